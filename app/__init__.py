@@ -1,3 +1,20 @@
-from .models import *
-from .schemas import *
-from .crud import *
+"""
+Models, schemas and CRUD classes are re-exported lazily: `from app import X`
+imports the submodule defining X on first use, so importing e.g. app.settings
+from a command line tool does not build every pydantic schema.
+"""
+import importlib
+from typing import Any
+
+_SUBMODULES = ("models", "schemas", "crud")
+
+
+def __getattr__(name: str) -> Any:
+    if not name.startswith("__"):
+        for submodule in _SUBMODULES:
+            module = importlib.import_module(f"{__name__}.{submodule}")
+            if name in vars(module):
+                value = vars(module)[name]
+                globals()[name] = value
+                return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
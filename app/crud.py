@@ -1,10 +1,15 @@
-from tortoise.expressions import Q
-from tortoise.functions import Count, Avg
+import json
+from datetime import datetime, timezone
+from types import SimpleNamespace
+from typing import Any
+
+from tortoise.expressions import Q, Subquery
+from tortoise.functions import Count, Avg, Max
+from tortoise.transactions import in_transaction
 
 from app import (
     Equipment,
     EquipmentSchema,
-    EquipmentSearchSchema,
     EquipmentType,
     TypeSchema,
     Location,
@@ -12,69 +17,82 @@ from app import (
 )
 from ms_core import BaseCRUD
 
-from app.models import EquipmentType
+from app.models import EquipmentType, LocationClosure
+from app.schemas import CountMode, ScanEvent
+from app.settings import search_count_cap
+from app.utils import change_feed, statuses
+from app.utils.dimension_cache import DimensionCache, equipment_types, locations
+from app.utils.etag import collection_etag, make_etag
+from app.utils.lookup_cache import lookup_cache
+from app.utils.serialization import (
+    EQUIPMENT_COLUMNS,
+    LOCATION_COLUMNS,
+    LOOKUP_COLUMNS,
+    dumps,
+    equipment_values,
+    hydrate_related,
+    related_ids,
+)
 
 
 class EquipmentCRUD(BaseCRUD[Equipment, EquipmentSchema]):
     model = Equipment  # type: ignore
     schema = EquipmentSchema  # type: ignore
 
-    @classmethod
-    async def search_equipment(
-        cls, 
-        query: str, 
-        limit: int = 50, 
-        offset: int = 0,
+    @staticmethod
+    async def attach_related(rows: list[dict[str, Any]]) -> list[dict[str, Any]]:
+        """
+        Attach type and location from the dimension cache instead of joining them
+        """
+        related = {}
+        if rows and "type_id" in rows[0]:
+            related["type"] = await equipment_types.get_many(related_ids(rows, "type"))
+        if rows and "location_id" in rows[0]:
+            related["location"] = await locations.get_many(related_ids(rows, "location"))
+        
+        return hydrate_related(rows, related)
+
+    @staticmethod
+    def search_filter(
+        query: str,
         status: str | None = None,
         condition_min: int | None = None,
-        condition_max: int | None = None
-    ) -> list[EquipmentSearchSchema]:
+        condition_max: int | None = None,
+        location_id: int | None = None
+    ) -> Q:
         """
-        Full text search for equipment with optional filters
+        Build the full text search condition shared by search and count queries
+
+        `location_id` matches the location and all of its sublocations.
         """
-        # Build the base query
-        search_conditions = []
-        
         # Text search across multiple fields
-        text_search = Q(
+        final_query = Q(
             Q(name__icontains=query) |
             Q(serial_number__icontains=query) |
             Q(search_vector__icontains=query)
         )
-        search_conditions.append(text_search)
         
         # Add optional filters
         if status:
-            search_conditions.append(Q(status=status))
+            # An unknown status matches nothing, as it did when stored as text
+            code = statuses.vocabulary.codes.get(status)
+            final_query &= Q(status=code) if code is not None else Q(id__in=[])
         
         if condition_min is not None:
-            search_conditions.append(Q(condition__gte=condition_min))
+            final_query &= Q(condition__gte=condition_min)
             
         if condition_max is not None:
-            search_conditions.append(Q(condition__lte=condition_max))
-        
-        # Combine all conditions
-        final_query = search_conditions[0]
-        for condition in search_conditions[1:]:
-            final_query &= condition
-        
-        # Execute the search
-        equipments = await Equipment.filter(final_query).prefetch_related(
-            'type', 'location'
-        ).limit(limit).offset(offset)
+            final_query &= Q(condition__lte=condition_max)
+
+        if location_id is not None:
+            final_query &= Q(location_id__in=LocationCRUD.subtree_ids(location_id))
         
-        return [EquipmentSearchSchema.from_orm(equipment) for equipment in equipments]
+        return final_query
 
-    @classmethod
-    async def search_equipment_advanced(
-        cls,
-        query: str,
-        search_fields: list[str] | None = None,
-        limit: int = 50,
-        offset: int = 0
-    ) -> list[EquipmentSearchSchema]:
+    @staticmethod
+    def advanced_search_filter(query: str, search_fields: list[str] | None = None) -> Q:
         """
-        Advanced search with PostgreSQL full text search capabilities
+        Build the field-specific search condition, fields are combined with OR
         """
         if not search_fields:
             search_fields = ['name', 'serial_number', 'search_vector']
@@ -82,7 +100,10 @@ class EquipmentCRUD(BaseCRUD[Equipment, EquipmentSchema]):
         # Build search conditions for specified fields
         search_conditions = []
         for field in search_fields:
-            if hasattr(Equipment, field):
+            if field == "status":
+                # Stored as codes, match the names of the vocabulary instead
+                search_conditions.append(Q(status__in=statuses.vocabulary.matching(query)))
+            elif hasattr(Equipment, field):
                 search_conditions.append(Q(**{f"{field}__icontains": query}))
         
         if not search_conditions:
@@ -97,18 +118,373 @@ class EquipmentCRUD(BaseCRUD[Equipment, EquipmentSchema]):
         for condition in search_conditions[1:]:
             final_query |= condition
         
-        equipments = await Equipment.filter(final_query).prefetch_related(
+        return final_query
+
+    @staticmethod
+    async def count_matching(query: Q, mode: CountMode = "exact") -> tuple[int, bool]:
+        """
+        Count the items matching a search condition, returns (count, capped)
+
+        `estimated` returns the planner's row estimate without running the
+        query (exact outside Postgres). `capped` stops after
+        `search_count_cap` + 1 matching rows and reports the cap with capped
+        set when there are more, so broad queries don't scan the whole table.
+        """
+        queryset = Equipment.filter(query)
+        if mode == "capped":
+            count = await Equipment.filter(
+                id__in=Subquery(queryset.limit(search_count_cap + 1).values("id"))
+            ).count()
+            if count > search_count_cap:
+                return search_count_cap, True
+            return count, False
+
+        if mode == "estimated" and Equipment._meta.db.capabilities.dialect == "postgres":
+            rows = await queryset.only("id").explain()
+            plan = rows[0]["QUERY PLAN"]
+            if isinstance(plan, str):
+                plan = json.loads(plan)
+            return int(plan[0]["Plan"]["Plan Rows"]), False
+
+        return await queryset.count(), False
+
+    @classmethod
+    async def search_equipment(
+        cls, 
+        query: str, 
+        limit: int = 50, 
+        offset: int = 0,
+        status: str | None = None,
+        condition_min: int | None = None,
+        condition_max: int | None = None,
+        fields: tuple[str, ...] | None = None,
+        location_id: int | None = None
+    ) -> list[dict[str, Any]]:
+        """
+        Full text search for equipment with optional filters
+
+        Rows are returned as plain dicts in the EquipmentSearchSchema shape,
+        type and location come from the dimension cache. With `fields` only
+        those columns are selected.
+        """
+        final_query = cls.search_filter(
+            query, status, condition_min, condition_max, location_id
+        )
+        
+        # Execute the search
+        rows = await Equipment.filter(final_query).limit(limit).offset(offset).values(
+            *equipment_values(fields)
+        )
+        
+        return await cls.attach_related(rows)
+
+    @classmethod
+    async def search_equipment_advanced(
+        cls,
+        query: str,
+        search_fields: list[str] | None = None,
+        limit: int = 50,
+        offset: int = 0,
+        fields: tuple[str, ...] | None = None
+    ) -> list[dict[str, Any]]:
+        """
+        Advanced search with PostgreSQL full text search capabilities
+        """
+        final_query = cls.advanced_search_filter(query, search_fields)
+        
+        rows = await Equipment.filter(final_query).limit(limit).offset(offset).values(
+            *equipment_values(fields)
+        )
+        
+        return await cls.attach_related(rows)
+
+    @classmethod
+    async def list_equipment(
+        cls,
+        limit: int | None = None,
+        offset: int = 0,
+        fields: tuple[str, ...] | None = None
+    ) -> list[dict[str, Any]]:
+        """
+        List equipment as plain dicts in the EquipmentSearchSchema shape, all
+        of it unless a limit is given
+        """
+        query = Equipment.all().order_by("id").offset(offset)
+        if limit is not None:
+            query = query.limit(limit)
+        rows = await query.values(*equipment_values(fields))
+        
+        return await cls.attach_related(rows)
+
+    @classmethod
+    async def get_equipment_fields(
+        cls, equipment_id: int, fields: tuple[str, ...]
+    ) -> dict[str, Any] | None:
+        """
+        Get a single equipment item projected to a sparse fieldset
+        """
+        rows = await Equipment.filter(id=equipment_id).limit(1).values(
+            *equipment_values(fields)
+        )
+        
+        return (await cls.attach_related(rows))[0] if rows else None
+
+    @classmethod
+    async def get_equipment(cls, equipment_id: int) -> EquipmentSchema | None:
+        """
+        Get a single equipment item with its history
+
+        Type and location are joined in the main query, only the history
+        needs a second one (from_tortoise_orm would issue three).
+        """
+        equipment = await Equipment.filter(id=equipment_id).select_related(
             'type', 'location'
-        ).limit(limit).offset(offset)
+        ).prefetch_related('history').first()
+        if equipment is None:
+            return None
         
-        return [EquipmentSearchSchema.from_orm(equipment) for equipment in equipments]
+        return EquipmentSchema.model_validate(equipment)
+
+    @classmethod
+    async def lookup(cls, field: str, values: list[str]) -> dict[str, dict[str, Any]]:
+        """
+        Items by exact serial number or QR code, as slim rows keyed by value
+
+        Served from the hot lookup cache, misses are loaded with one indexed
+        query. When several items share a value the oldest one is returned.
+        Misses are read from the primary, a lagging replica would have stale
+        rows cached until they expire.
+        """
+        found: dict[str, dict[str, Any]] = {}
+        missing = []
+        for value in values:
+            row = lookup_cache.get(field, value)
+            if row is None:
+                missing.append(value)
+            else:
+                found[value] = row
+
+        if missing:
+            generation = lookup_cache.generation
+            rows = await Equipment.filter(**{f"{field}__in": missing}).order_by("id").using_db(
+                Equipment._meta.db
+            ).values(*LOOKUP_COLUMNS)
+            for row in rows:
+                if row[field] not in found:
+                    found[row[field]] = row
+                    lookup_cache.put(field, row[field], row, generation)
+
+        types = await equipment_types.get_many(related_ids(found.values(), "type"))
+        location_rows = await locations.get_many(related_ids(found.values(), "location"))
+        results = {}
+        for value, row in found.items():
+            # Cached rows are shared, build a new dict
+            item = {column: row[column] for column in LOOKUP_COLUMNS[:-2]}
+            for relation, related in (("type", types), ("location", location_rows)):
+                related_row = related.get(row[f"{relation}_id"])
+                item[relation] = (
+                    {"id": related_row["id"], "name": related_row["name"]}
+                    if related_row is not None
+                    else None
+                )
+            results[value] = item
+        return results
+
+    @classmethod
+    async def get_equipment_etag(cls, equipment_id: int, *parts: Any) -> str | None:
+        """
+        ETag of a single item from its own, its type's and its location's updated_at
+        """
+        row = await Equipment.filter(id=equipment_id).first().values(
+            "updated_at", "type_id", "location_id"
+        )
+        if row is None:
+            return None
+        
+        equipment_type = await equipment_types.get(row["type_id"])
+        location = await locations.get(row["location_id"])
+        return make_etag(
+            equipment_id,
+            row["updated_at"],
+            equipment_type and equipment_type["updated_at"],
+            location and location["updated_at"],
+            *parts,
+        )
+
+    @classmethod
+    async def list_etag(cls, *parts: Any) -> tuple[str, int]:
+        """
+        ETag of the equipment collection from its row count and latest
+        updated_at, along with the row count
+        """
+        stats = await Equipment.all().annotate(
+            count=Count("id"), last_updated=Max("updated_at")
+        ).values("count", "last_updated")
+        
+        etag = make_etag(
+            stats[0]["count"],
+            stats[0]["last_updated"],
+            collection_etag((await equipment_types.rows()).values()),
+            collection_etag((await locations.rows()).values()),
+            *parts,
+        )
+        return etag, stats[0]["count"]
+
+    @classmethod
+    async def apply_scans(cls, scans: list[ScanEvent], email: str) -> list[dict[str, Any]]:
+        """
+        Apply a batch of scans (status and location changes) in one transaction
+
+        Items are resolved and locked with one query, updated with one
+        UPDATE ... FROM unnest() and their history written with one
+        INSERT ... SELECT FROM unnest(), so both statements take a fixed
+        number of parameters whatever the batch size (Postgres allows 32767);
+        change events go out on commit. Scans of the same item apply in order.
+        Returns an outcome per scan.
+        """
+        serials = {scan.serial_number for scan in scans if scan.serial_number is not None}
+        qr_codes = {scan.qr_code for scan in scans if scan.qr_code is not None}
+        # Whole tables, get_many reloads once if a scanned location is new
+        types = await equipment_types.rows()
+        location_rows = await locations.get_many(
+            {scan.location_id for scan in scans if scan.location_id is not None}
+        )
+
+        def snapshot(item: Equipment) -> str:
+            # Same shape as the history written by patch_equipment
+            row = {column: getattr(item, column) for column in EQUIPMENT_COLUMNS}
+            row["type"] = types.get(item.type_id)
+            row["location"] = location_rows.get(item.location_id)
+            return dumps(row).decode()
+
+        conditions = []
+        if serials:
+            conditions.append(Q(serial_number__in=serials))
+        if qr_codes:
+            conditions.append(Q(qr_code_data__in=qr_codes))
+
+        results: list[dict[str, Any]] = []
+        async with in_transaction() as connection:
+            items = await Equipment.filter(Q(*conditions, join_type="OR")).order_by(
+                "id"
+            ).select_for_update().using_db(connection)
+            # The oldest item wins when several share a code, as in lookups
+            by_serial: dict[str, Equipment] = {}
+            by_qr_code: dict[str, Equipment] = {}
+            for item in items:
+                by_serial.setdefault(item.serial_number, item)
+                if item.qr_code_data is not None:
+                    by_qr_code.setdefault(item.qr_code_data, item)
+
+            now = datetime.now(timezone.utc)
+            changed: dict[int, Equipment] = {}
+            previous: dict[int, SimpleNamespace] = {}
+            history = []
+            for index, scan in enumerate(scans):
+                if scan.serial_number is not None:
+                    item = by_serial.get(scan.serial_number)
+                else:
+                    item = by_qr_code.get(scan.qr_code)
+                if item is None:
+                    results.append({"index": index, "outcome": "unknown_code", "id": None})
+                    continue
+                if scan.location_id is not None and scan.location_id not in location_rows:
+                    results.append({"index": index, "outcome": "unknown_location", "id": item.id})
+                    continue
+                if scan.status is not None and scan.status not in statuses.vocabulary.codes:
+                    results.append({"index": index, "outcome": "unknown_status", "id": item.id})
+                    continue
+
+                status = scan.status if scan.status is not None else item.status
+                location_id = scan.location_id if scan.location_id is not None else item.location_id
+                if status == item.status and location_id == item.location_id:
+                    results.append({"index": index, "outcome": "unchanged", "id": item.id})
+                    continue
+
+                previous.setdefault(
+                    item.id,
+                    SimpleNamespace(
+                        status=item.status, type_id=item.type_id, location_id=item.location_id
+                    ),
+                )
+                old = snapshot(item)
+                item.status = status
+                item.location_id = location_id
+                item.updated_at = now
+                item.search_vector = cls.search_text(
+                    item, types.get(item.type_id), location_rows.get(location_id)
+                )
+                history.append((item.id, old, snapshot(item)))
+                changed[item.id] = item
+                results.append({"index": index, "outcome": "updated", "id": item.id})
+
+            if changed:
+                await connection.execute_query(
+                    """
+                    UPDATE "equipments" AS e
+                    SET "status" = u."status", "location_id" = u."location_id",
+                        "search_vector" = u."search_vector", "updated_at" = $5
+                    FROM unnest($1::int[], $2::smallint[], $3::int[], $4::text[])
+                        AS u("id", "status", "location_id", "search_vector")
+                    WHERE e."id" = u."id"
+                    """,
+                    [
+                        list(changed),
+                        [statuses.vocabulary.code(item.status) for item in changed.values()],
+                        [item.location_id for item in changed.values()],
+                        [item.search_vector for item in changed.values()],
+                        now,
+                    ],
+                )
+                # In scan order, replays follow the ids of entries sharing created_at
+                await connection.execute_query(
+                    """
+                    INSERT INTO "history"
+                        ("equipment_id", "action", "old", "new", "email", "created_at", "updated_at")
+                    SELECT h."equipment_id", 'update', h."old"::jsonb, h."new"::jsonb, $4, $5, $5
+                    FROM unnest($1::int[], $2::text[], $3::text[]) WITH ORDINALITY
+                        AS h("equipment_id", "old", "new", "position")
+                    ORDER BY h."position"
+                    """,
+                    [
+                        [equipment_id for equipment_id, _, _ in history],
+                        [old for _, old, _ in history],
+                        [new for _, _, new in history],
+                        email,
+                        now,
+                    ],
+                )
+                await change_feed.publish_many(
+                    [
+                        change_feed.equipment_event("update", item, previous[item.id])
+                        for item in changed.values()
+                    ],
+                    connection,
+                )
+        return results
+
+    @staticmethod
+    def search_text(
+        item: Equipment, type_row: dict[str, Any] | None, location_row: dict[str, Any] | None
+    ) -> str:
+        """Search vector of an item, same parts as update_search_vector"""
+        search_parts = [
+            item.name,
+            item.serial_number,
+            item.status,
+            str(item.condition),
+            type_row["name"] if type_row else "",
+            location_row["name"] if location_row else "",
+            location_row["description"] if location_row and location_row["description"] else "",
+        ]
+        return " ".join(part for part in search_parts if part)
 
     @classmethod
     async def update_search_vector(cls, equipment_id: int) -> None:
         """
         Update the search vector for a specific equipment item
         """
-        equipment = await Equipment.get(id=equipment_id).prefetch_related('type', 'location')
+        equipment = await Equipment.get(id=equipment_id).select_related('type', 'location')
         if equipment:
             # Create a search vector from relevant fields
             search_parts = [
@@ -133,28 +509,114 @@ class EquipmentCRUD(BaseCRUD[Equipment, EquipmentSchema]):
         """
         total_count = await Equipment.all().count()
         
-        # Get status distribution
+        # Get status distribution, an index-only scan of the status index
         status_counts = await Equipment.all().annotate(
             count=Count("id")
         ).group_by("status").values("status", "count")
         
-        # Get average condition using a simpler approach
-        all_equipment = await Equipment.all()
-        conditions = [eq.condition for eq in all_equipment]
-        avg_condition = sum(conditions) / len(conditions) if conditions else 0
+        # Average condition computed by the database, not over every loaded item
+        stats = await Equipment.all().annotate(
+            avg_condition=Avg("condition")
+        ).values("avg_condition")
+        avg_condition = stats[0]["avg_condition"] or 0
         
         return {
             "total_equipment": total_count,
             "status_distribution": {item["status"]: item["count"] for item in status_counts},
-            "average_condition": round(avg_condition, 2)
+            "average_condition": round(float(avg_condition), 2)
         }
 
 
-class TypeCRUD(BaseCRUD[EquipmentType, TypeSchema]):
+class CachedReadsMixin:
+    """Reads served from the process-local dimension cache"""
+    cache: DimensionCache
+
+    @classmethod
+    async def list_cached(cls) -> list[dict[str, Any]]:
+        return list((await cls.cache.rows()).values())
+
+    @classmethod
+    async def get_cached(cls, item_id: int) -> dict[str, Any] | None:
+        return await cls.cache.get(item_id)
+
+    @classmethod
+    async def list_etag(cls) -> str:
+        return collection_etag((await cls.cache.rows()).values())
+
+
+class TypeCRUD(CachedReadsMixin, BaseCRUD[EquipmentType, TypeSchema]):
     model = EquipmentType  # type: ignore
     schema = TypeSchema  # type: ignore
+    cache = equipment_types
 
 
-class LocationCRUD(BaseCRUD[Location, LocationSchema]):
+class LocationCRUD(CachedReadsMixin, BaseCRUD[Location, LocationSchema]):
     model = Location  # type: ignore
     schema = LocationSchema  # type: ignore
+    cache = locations
+
+    @staticmethod
+    def subtree_ids(location_id: int) -> Subquery:
+        """Ids of a location and its sublocations, for `location_id__in` filters"""
+        return Subquery(
+            LocationClosure.filter(ancestor_id=location_id).values("descendant_id")
+        )
+
+    @classmethod
+    async def subtree(cls, location_id: int) -> list[dict[str, Any]] | None:
+        """
+        A location and its sublocations, by depth, None for an unknown location
+
+        The ids come from the closure table, the rows from the dimension cache.
+        """
+        links = await LocationClosure.filter(ancestor_id=location_id).order_by(
+            "depth", "descendant_id"
+        ).values_list("descendant_id", "depth")
+        if not links:
+            return None
+
+        rows = await locations.get_many(descendant for descendant, _ in links)
+        return [
+            {**rows[descendant], "depth": depth}
+            for descendant, depth in links
+            if descendant in rows
+        ]
+
+    @classmethod
+    async def subtree_counts(cls, location_id: int) -> dict[int, int]:
+        """Equipment count of every location of a subtree that holds any"""
+        counts = await Equipment.filter(
+            location_id__in=cls.subtree_ids(location_id)
+        ).annotate(count=Count("id")).group_by("location_id").values_list(
+            "location_id", "count"
+        )
+        return dict(counts)
+
+    @classmethod
+    async def move(cls, location_id: int, parent_id: int | None) -> dict[str, Any]:
+        """
+        Move a location and its whole subtree under another parent (None for a root)
+
+        The closure table is rewritten by a trigger with one set-based delete
+        and insert, whatever the size of the subtree. Raises LookupError for
+        an unknown location or parent and ValueError for a move into the
+        location's own subtree.
+        """
+        async with in_transaction() as connection:
+            location = await Location.filter(id=location_id).select_for_update().using_db(
+                connection
+            ).first()
+            if location is None:
+                raise LookupError("Location not found")
+            if parent_id is not None:
+                if not await Location.filter(id=parent_id).using_db(connection).exists():
+                    raise LookupError("Parent location not found")
+                if await LocationClosure.filter(
+                    ancestor_id=location_id, descendant_id=parent_id
+                ).using_db(connection).exists():
+                    raise ValueError("A location can't be moved into its own subtree")
+
+            if location.parent_id != parent_id:
+                location.parent_id = parent_id
+                await location.save(update_fields=["parent_id", "updated_at"], using_db=connection)
+        return {column: getattr(location, column) for column in LOCATION_COLUMNS}
@@ -1,7 +1,10 @@
 import asyncio
 import logging
+import time
 from datetime import datetime, timedelta
-from typing import Annotated, Any, Callable, NamedTuple, Optional
+from pathlib import Path
+from types import MappingProxyType
+from typing import Annotated, Any, Callable, Mapping, NamedTuple, Optional
 
 import httpx
 from fastapi import Depends, HTTPException
@@ -9,6 +12,8 @@ from fastapi.security import OAuth2PasswordBearer
 from pydantic import BaseModel, ValidationError
 
 from app.settings import usersms_url
+from app.utils import invalidation
+from app.utils.metrics import auth_duration
 
 
 # Configuration structure
@@ -22,6 +27,12 @@ class AuthConfig(NamedTuple):
     cache_duration_minutes: int = 10
     request_timeout: float = 5.0
     logger: logging.Logger = None  # type: ignore
+    jwt_public_key: Optional[str] = None
+    jwks_url: Optional[str] = None
+    jwt_algorithms: tuple[str, ...] = ("RS256",)
+    jwt_audience: Optional[str] = None
+    jwt_issuer: Optional[str] = None
+    signing_keys_refresh_minutes: int = 60
 
 
 # Global configuration
@@ -30,10 +41,21 @@ _oauth2_scheme: Optional[OAuth2PasswordBearer] = OAuth2PasswordBearer(
     tokenUrl="http://localhost:8000" + "/token"
 )
 
-# Cache management
-_role_cache: dict[int, str] = {}
+# Cache management, the role map is replaced as a whole and never mutated
+_role_cache: Mapping[int, str] = MappingProxyType({})
 _cache_expiry: Optional[datetime] = None
-_cache_lock = asyncio.Lock()
+_role_refresh_task: Optional[asyncio.Task] = None
+_role_refresh_failed_at: Optional[datetime] = None
+
+# No role map refresh is attempted for this long after a failed one
+ROLE_REFRESH_BACKOFF = timedelta(seconds=30)
+
+# Signing keys for local JWT verification, keyed by "kid" ("" for a static key)
+_signing_keys: dict[str, Any] = {}
+_signing_keys_lock = asyncio.Lock()
+_signing_keys_loaded_at: Optional[datetime] = None
+_signing_keys_task: Optional[asyncio.Task] = None
+_signing_key_file: Optional[Path] = None
 
 
 # Pydantic models
@@ -59,10 +81,20 @@ def configure_auth(
     cache_duration_minutes: int = 10,
     request_timeout: float = 5.0,
     logger: Optional[logging.Logger] = None,
+    jwt_public_key: Optional[str] = None,
+    jwt_public_key_file: Optional[str] = None,
+    jwks_url: Optional[str] = None,
+    jwt_algorithms: tuple[str, ...] = ("RS256",),
+    jwt_audience: Optional[str] = None,
+    jwt_issuer: Optional[str] = None,
+    signing_keys_refresh_minutes: int = 60,
 ) -> None:
     """
     Configure the authentication system.
 
+    Signed (JWT) tokens are verified locally when a public key or a JWKS URL
+    is configured; opaque tokens are still sent to the introspection endpoint.
+
     Args:
         auth_service_url: Base URL of the authentication service
         token_url: Token endpoint URL (defaults to auth_service_url + "/token")
@@ -71,8 +103,15 @@ def configure_auth(
         cache_duration_minutes: Cache duration in minutes
         request_timeout: HTTP request timeout in seconds
         logger: Optional logger instance
+        jwt_public_key: PEM encoded public key used to verify signed tokens
+        jwt_public_key_file: Path to a PEM public key, re-read on every refresh
+        jwks_url: JWKS document URL, fetched and refreshed in the background
+        jwt_algorithms: Accepted signature algorithms
+        jwt_audience: Expected "aud" claim, not checked when omitted
+        jwt_issuer: Expected "iss" claim, not checked when omitted
+        signing_keys_refresh_minutes: Signing keys refresh interval in minutes
     """
-    global _auth_config, _oauth2_scheme
+    global _auth_config, _oauth2_scheme, _signing_key_file, _signing_keys_loaded_at
 
     if token_url is None:
         token_url = f"http://localhost:8000/token"
@@ -88,12 +127,31 @@ def configure_auth(
         cache_duration_minutes=cache_duration_minutes,
         request_timeout=request_timeout,
         logger=logger,
+        jwt_public_key=jwt_public_key,
+        jwks_url=jwks_url,
+        jwt_algorithms=tuple(jwt_algorithms),
+        jwt_audience=jwt_audience,
+        jwt_issuer=jwt_issuer,
+        signing_keys_refresh_minutes=signing_keys_refresh_minutes,
     )
 
     # Initialize OAuth2 scheme
     _oauth2_scheme = OAuth2PasswordBearer(tokenUrl=token_url)
 
+    # Static keys are available right away, JWKS is fetched on first use
+    _signing_keys.clear()
+    _signing_keys_loaded_at = None
+    _signing_key_file = Path(jwt_public_key_file) if jwt_public_key_file else None
+    if _signing_key_file is not None:
+        _signing_keys[""] = _signing_key_file.read_text()
+        _signing_keys_loaded_at = datetime.now()
+    elif jwt_public_key:
+        _signing_keys[""] = jwt_public_key
+        _signing_keys_loaded_at = datetime.now()
+
     logger.info(f"Auth toolkit configured for {auth_service_url}")
+    if _local_verification_enabled():
+        logger.info("Signed tokens will be verified locally")
 
 
 def _get_config() -> AuthConfig:
@@ -110,6 +168,12 @@ def _get_oauth2_scheme() -> OAuth2PasswordBearer:
     return _oauth2_scheme
 
 
+def _local_verification_enabled() -> bool:
+    """Check whether signed tokens can be verified without introspection."""
+    config = _get_config()
+    return bool(config.jwks_url or config.jwt_public_key or _signing_key_file)
+
+
 def _create_auth_exception(message: str, status_code: int = 401) -> HTTPException:
     """Create a standardized authentication exception."""
     headers = {"WWW-Authenticate": "Bearer"}
@@ -176,33 +240,89 @@ async def fetch_roles_from_api(auth_token: Optional[str] = None) -> dict[int, st
     return role_map
 
 
-async def get_role_id_map(auth_token: Optional[str] = None) -> dict[int, str]:
-    """Get the role ID map, using cache if available and not expired."""
+async def _refresh_role_map(auth_token: Optional[str] = None) -> Mapping[int, str]:
+    """Fetch roles from the API and swap in the new role map."""
     global _role_cache, _cache_expiry
     config = _get_config()
+
+    invalidation.listener.ensure_running()
+    role_map = MappingProxyType(await fetch_roles_from_api(auth_token))
+    _role_cache = role_map
+    _cache_expiry = datetime.now() + timedelta(minutes=config.cache_duration_minutes)
+    return role_map
+
+
+def invalidate_role_map() -> None:
+    """Expire the role map, the next lookup refreshes it in the background."""
+    global _cache_expiry
+    _cache_expiry = None
+
+
+invalidation.register("roles", invalidate_role_map)
+
+
+def _record_refresh_result(task: asyncio.Task) -> None:
+    """Record a failed refresh, the current role map (if any) stays in use."""
+    global _role_refresh_failed_at
+
+    if task.cancelled():
+        return
+    error = task.exception()
+    if error is None:
+        _role_refresh_failed_at = None
+        return
+
+    _role_refresh_failed_at = datetime.now()
+    # Auth service errors were logged where they were raised
+    if not isinstance(error, HTTPException):
+        _get_config().logger.warning(f"Role map refresh failed: {error!r}")
+
+
+def _schedule_role_refresh(auth_token: Optional[str] = None) -> Optional[asyncio.Task]:
+    """
+    Start a role map refresh unless one is already running.
+
+    Returns None while backing off after a failed refresh.
+    """
+    global _role_refresh_task
+
+    if _role_refresh_task is None or _role_refresh_task.done():
+        if (
+            _role_refresh_failed_at is not None
+            and datetime.now() - _role_refresh_failed_at < ROLE_REFRESH_BACKOFF
+        ):
+            return None
+        _role_refresh_task = asyncio.create_task(_refresh_role_map(auth_token))
+        _role_refresh_task.add_done_callback(_record_refresh_result)
+    return _role_refresh_task
+
+
+async def get_role_id_map(auth_token: Optional[str] = None) -> Mapping[int, str]:
+    """
+    Get the role ID map.
+
+    The cached map is served without locking. It is refreshed in the background
+    once less than a fifth of the cache duration is left, or after it expired,
+    so only the very first call waits for the roles API. After a failed
+    refresh the roles API is left alone for ROLE_REFRESH_BACKOFF.
+    """
+    config = _get_config()
     cache_duration = timedelta(minutes=config.cache_duration_minutes)
 
-    async with _cache_lock:
-        # Check if cache is valid
-        if _cache_expiry and datetime.now() < _cache_expiry and _role_cache:
-            config.logger.debug("Using cached role mapping")
-            return _role_cache.copy()
+    if _role_cache:
+        if _cache_expiry is None or datetime.now() > _cache_expiry - cache_duration / 5:
+            config.logger.debug("Refreshing role mapping in the background")
+            _schedule_role_refresh(auth_token)
+        return _role_cache
 
-        # Fetch fresh data
-        config.logger.info("Fetching roles from API (cache expired or empty)")
-        try:
-            _role_cache = await fetch_roles_from_api(auth_token)
-            _cache_expiry = datetime.now() + cache_duration
-            return _role_cache.copy()
-        except Exception as e:
-            # If we have stale cache data, use it as fallback
-            if _role_cache:
-                config.logger.warning(f"Using stale role cache due to API error: {e}")
-                return _role_cache.copy()
-            else:
-                # No cache and API failed - this is a critical error
-                config.logger.error("No role data available and API fetch failed")
-                raise
+    # Nothing to serve yet, wait for the shared refresh
+    refresh = _schedule_role_refresh(auth_token)
+    if refresh is None:
+        raise HTTPException(
+            status_code=503, detail="Unable to fetch roles from auth service"
+        )
+    config.logger.info("Fetching roles from API (cache empty)")
+    return await asyncio.shield(refresh)
 
 
 async def _introspect_token(token: str) -> dict[str, Any]:
@@ -229,6 +349,144 @@ async def _introspect_token(token: str) -> dict[str, Any]:
     return data
 
 
+async def _load_signing_keys() -> dict[str, Any]:
+    """Load signing keys from the JWKS endpoint or the configured key file."""
+    config = _get_config()
+
+    if _signing_key_file is not None:
+        return {"": await asyncio.to_thread(_signing_key_file.read_text)}
+
+    if config.jwks_url is None:
+        return {"": config.jwt_public_key}
+
+    try:
+        async with httpx.AsyncClient(follow_redirects=True) as client:
+            resp = await client.get(config.jwks_url, timeout=config.request_timeout)
+    except httpx.RequestError as e:
+        raise RuntimeError(f"JWKS request error: {e}")
+
+    if resp.status_code != 200:
+        raise RuntimeError(f"Failed to fetch JWKS: HTTP {resp.status_code}")
+
+    import jwt  # Imported on first use, it pulls in cryptography
+
+    keys = {}
+    for key in jwt.PyJWKSet.from_dict(resp.json()).keys:
+        keys[key.key_id or ""] = key
+    return keys
+
+
+async def _refresh_signing_keys(min_age: Optional[timedelta] = None) -> None:
+    """
+    Replace the signing keys, keeping the current ones if loading fails.
+
+    With min_age set, keys loaded more recently than that are kept as is.
+    """
+    global _signing_keys, _signing_keys_loaded_at
+    config = _get_config()
+
+    async with _signing_keys_lock:
+        if (
+            min_age is not None
+            and _signing_keys_loaded_at is not None
+            and datetime.now() - _signing_keys_loaded_at < min_age
+        ):
+            return
+
+        try:
+            keys = await _load_signing_keys()
+        except Exception as e:
+            config.logger.warning(f"Keeping current signing keys due to error: {e}")
+            return
+
+        _signing_keys = keys
+        _signing_keys_loaded_at = datetime.now()
+        config.logger.info(f"Loaded {len(keys)} token signing keys")
+
+
+async def _signing_keys_refresher() -> None:
+    """Periodically refresh the signing keys in the background."""
+    config = _get_config()
+    while True:
+        await asyncio.sleep(config.signing_keys_refresh_minutes * 60)
+        await _refresh_signing_keys()
+
+
+async def _get_signing_key(kid: str) -> Any:
+    """Get the signing key for a "kid", refreshing unknown ones at most once a minute."""
+    global _signing_keys_task
+
+    if _signing_keys_task is None or _signing_keys_task.done():
+        _signing_keys_task = asyncio.create_task(_signing_keys_refresher())
+
+    key = _signing_keys.get(kid) or _signing_keys.get("")
+    if key is None:
+        await _refresh_signing_keys(min_age=timedelta(minutes=1))
+        key = _signing_keys.get(kid) or _signing_keys.get("")
+
+    return key
+
+
+async def _decode_signed_token(token: str) -> Optional[dict[str, Any]]:
+    """
+    Verify a signed token locally and return its claims.
+
+    Returns None when no matching signing key is known, so the caller can fall
+    back to introspection. Note that local verification cannot see revocations,
+    tokens stay valid until their "exp" claim.
+    """
+    import jwt  # Imported on first use, it pulls in cryptography
+
+    config = _get_config()
+
+    try:
+        header = jwt.get_unverified_header(token)
+    except jwt.InvalidTokenError:
+        return None
+
+    key = await _get_signing_key(header.get("kid") or "")
+    if key is None:
+        config.logger.debug(f"No signing key for kid {header.get('kid')!r}")
+        return None
+
+    try:
+        return jwt.decode(
+            token,
+            key,
+            algorithms=list(config.jwt_algorithms),
+            audience=config.jwt_audience,
+            issuer=config.jwt_issuer,
+            options={
+                "verify_aud": config.jwt_audience is not None,
+                # TokenIntrospect needs "sub", and a token without "exp" never expires
+                "require": ["exp", "sub"],
+            },
+        )
+    except jwt.ExpiredSignatureError:
+        raise _create_auth_exception("Token expired")
+    except jwt.InvalidTokenError as e:
+        config.logger.warning(f"Signed token verification failed: {e}")
+        raise _create_auth_exception("Invalid token")
+
+
+async def _verify_token(token: str) -> dict[str, Any]:
+    """Verify a token locally when possible, otherwise introspect it."""
+    start = time.perf_counter()
+    if _local_verification_enabled() and token.count(".") == 2:
+        try:
+            claims = await _decode_signed_token(token)
+        finally:
+            auth_duration.observe(time.perf_counter() - start, "local")
+        if claims is not None:
+            return {"active": True, "payload": claims}
+
+    start = time.perf_counter()
+    try:
+        return await _introspect_token(token)
+    finally:
+        auth_duration.observe(time.perf_counter() - start, "introspection")
+
+
 async def _create_user_from_payload(
     payload: dict[str, Any], token: str
 ) -> TokenIntrospect:
@@ -272,7 +530,7 @@ def get_current_user():
         """
         Authentication that validates token and returns user information.
         """
-        data = await _introspect_token(token)
+        data = await _verify_token(token)
 
         try:
             # Create user data from payload
@@ -1,7 +1,10 @@
-from tortoise import fields, validators
+from tortoise import fields, models, validators
+from tortoise.contrib.postgres.indexes import PostgreSQLIndex
 
 from ms_core import AbstractModel
 
+from app.utils import statuses
+
 
 class ExtendedAbstractModel(AbstractModel):
     updated_at = fields.DatetimeField(auto_now=True)
@@ -9,13 +12,13 @@ class ExtendedAbstractModel(AbstractModel):
 
 class Equipment(ExtendedAbstractModel):
     name = fields.CharField(max_length=255)
-    serial_number = fields.CharField(max_length=255)
-    status = fields.CharField(max_length=50)
+    serial_number = fields.CharField(max_length=255, db_index=True)  # Scanner lookups
+    status = statuses.StatusField()  # SMALLINT code of equipment_statuses
     condition = fields.IntField(
         validators=[validators.MinValueValidator(0), validators.MaxValueValidator(10)]
     )
     photo_url = fields.CharField(max_length=500, null=True)
-    qr_code_data = fields.CharField(max_length=500, null=True)
+    qr_code_data = fields.CharField(max_length=500, null=True, db_index=True)
     metadata = fields.JSONField(null=True)
     search_vector = fields.TextField(null=True)  # For full text search
 
@@ -24,7 +27,7 @@ class Equipment(ExtendedAbstractModel):
     )
 
     location: fields.ForeignKeyRelation["Location"] = fields.ForeignKeyField(
-        "models.Location", "equipments"
+        "models.Location", "equipments", db_index=True  # Subtree filters and counts
     )
 
     history: fields.ReverseRelation["EquipmentHistoryEntry"]
@@ -33,6 +36,20 @@ class Equipment(ExtendedAbstractModel):
         table = "equipments"
         indexes = [
             ("name", "serial_number"),  # Composite index for better search performance
+            ("updated_at", "id"),  # Delta sync watermark
+            ("created_at",),  # Items created since a snapshot
+            ("status",),  # Status distributions
+            # Items in the hot statuses, filtered and counted off small indexes
+            PostgreSQLIndex(
+                fields=("id",),
+                condition={"status": statuses.AVAILABLE},
+                name="idx_equipments_available",
+            ),
+            PostgreSQLIndex(
+                fields=("id",),
+                condition={"status": statuses.IN_REPAIR},
+                name="idx_equipments_in_repair",
+            ),
         ]
 
 
@@ -45,15 +62,54 @@ class EquipmentType(ExtendedAbstractModel):
         table = "equipment_types"
 
 
+# Vocabulary of equipment statuses, see app.utils.statuses
+class EquipmentStatus(models.Model):
+    id = fields.SmallIntField(primary_key=True)
+    name = fields.CharField(max_length=50, unique=True)
+
+    class Meta:  # type: ignore
+        table = "equipment_statuses"
+
+
 class Location(ExtendedAbstractModel):
     name = fields.CharField(max_length=255)
     description = fields.CharField(max_length=500, null=True)
 
+    # Locations with sublocations can't be deleted
+    parent: fields.ForeignKeyNullableRelation["Location"] = fields.ForeignKeyField(
+        "models.Location", "children", null=True, on_delete=fields.RESTRICT
+    )
+
     equipments: fields.ReverseRelation[Equipment]
+    children: fields.ReverseRelation["Location"]
+    ancestors: fields.ReverseRelation["LocationClosure"]
+    descendants: fields.ReverseRelation["LocationClosure"]
 
     class Meta:  # type: ignore
         table = "locations"
 
+    class PydanticMeta:
+        # The tree is exposed as parent_id and the /locations/{id}/subtree endpoints
+        exclude = ("parent", "children", "ancestors", "descendants")
+
+
+# Every (ancestor, descendant) pair of the location tree, including each
+# location with itself at depth 0. Written by triggers (see the migration).
+class LocationClosure(models.Model):
+    id = fields.BigIntField(primary_key=True)
+    ancestor: fields.ForeignKeyRelation[Location] = fields.ForeignKeyField(
+        "models.Location", "descendants"
+    )
+    descendant: fields.ForeignKeyRelation[Location] = fields.ForeignKeyField(
+        "models.Location", "ancestors"
+    )
+    depth = fields.IntField()
+
+    class Meta:  # type: ignore
+        table = "location_closure"
+        unique_together = (("ancestor", "descendant"),)  # Subtree of an ancestor
+        indexes = [("descendant", "depth")]  # Path of a location
+
 
 class EquipmentHistoryEntry(ExtendedAbstractModel):
     action = fields.CharField(max_length=10)
@@ -68,3 +124,50 @@ class EquipmentHistoryEntry(ExtendedAbstractModel):
 
     class Meta:  # type: ignore
         table = "history"
+        indexes = [("created_at", "id")]  # Replay after a snapshot
+
+
+# Deleted rows for delta sync, written by triggers (see the migration)
+class Tombstone(models.Model):
+    id = fields.BigIntField(primary_key=True)
+    entity = fields.CharField(max_length=20)
+    entity_id = fields.IntField()
+    deleted_at = fields.DatetimeField(auto_now_add=True)
+    # Of deleted equipment, for as-of queries (see app.utils.snapshots)
+    created_at = fields.DatetimeField(null=True)
+    state = fields.JSONField(null=True)
+
+    class Meta:  # type: ignore
+        table = "tombstones"
+        indexes = [("deleted_at", "id"), ("created_at",)]
+
+
+# Compact copy of the inventory, the starting point of as-of queries
+class InventorySnapshot(models.Model):
+    id = fields.IntField(primary_key=True)
+    taken_at = fields.DatetimeField(db_index=True)
+    item_count = fields.IntField(default=0)
+
+    items: fields.ReverseRelation["SnapshotItem"]
+
+    class Meta:  # type: ignore
+        table = "inventory_snapshots"
+
+
+# No foreign keys to equipment, types and locations: snapshots outlive them
+class SnapshotItem(models.Model):
+    id = fields.BigIntField(primary_key=True)
+    snapshot: fields.ForeignKeyRelation[InventorySnapshot] = fields.ForeignKeyField(
+        "models.InventorySnapshot", "items"
+    )
+    equipment_id = fields.IntField()
+    name = fields.CharField(max_length=255)
+    serial_number = fields.CharField(max_length=255)
+    status = fields.CharField(max_length=50)
+    condition = fields.IntField()
+    type_id = fields.IntField()
+    location_id = fields.IntField()
+
+    class Meta:  # type: ignore
+        table = "snapshot_items"
+        indexes = [("snapshot", "location_id"), ("snapshot", "equipment_id")]
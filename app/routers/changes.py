@@ -0,0 +1,69 @@
+import json
+from typing import Any, AsyncIterator, Literal
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
+
+from app.dependencies import require_role
+from app.utils.change_feed import Subscription, hub
+
+router = APIRouter(
+    prefix="/changes",
+    tags=["changes"],
+    dependencies=[Depends(require_role("user"))],
+)
+
+# Milliseconds an EventSource waits before reconnecting
+RECONNECT_DELAY_MS = 2000
+
+
+def _format_event(event: dict[str, Any]) -> bytes:
+    name = event["action"] if event["entity"] is None else f"{event['entity']}.{event['action']}"
+    return f"event: {name}\ndata: {json.dumps(event, separators=(',', ':'))}\n\n".encode()
+
+
+async def _stream(request: Request, subscription: Subscription) -> AsyncIterator[bytes]:
+    yield f"retry: {RECONNECT_DELAY_MS}\n\n".encode()
+    async for event in hub.subscribe(subscription):
+        if event is None:
+            if await request.is_disconnected():
+                return
+            yield b": keepalive\n\n"
+        else:
+            yield _format_event(event)
+
+
+@router.get("/")
+async def stream_changes(
+    request: Request,
+    entity: list[Literal["equipment", "type", "location"]] | None = Query(
+        None, description="Entities to receive, all when omitted"
+    ),
+    location_id: list[int] | None = Query(None),
+    type_id: list[int] | None = Query(None),
+    status: list[str] | None = Query(None),
+) -> StreamingResponse:
+    """
+    Server-Sent Events stream of equipment, type and location changes
+
+    Events are named `<entity>.<create|update|delete>` and carry the changed
+    row as JSON; equipment updates include the previous status, type and
+    location when they changed, and `equipment.import` follows a bulk import
+    (reload). Filters apply to equipment events (an item moving out of a
+    filtered location is still sent) and to the type and location events of
+    the filtered ids.
+
+    Load the initial state after the `ready` event. After a `reset` event
+    (the client fell behind, or a worker lost its database connection) the
+    stream ends: reconnect and reload.
+    """
+    if not hub.available():
+        raise HTTPException(503, detail="The change feed requires a Postgres database")
+
+    subscription = Subscription(entity, location_id, type_id, status)
+    return StreamingResponse(
+        _stream(request, subscription),
+        media_type="text/event-stream",
+        # Keep proxies from buffering or caching the stream
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -0,0 +1,42 @@
+from fastapi import APIRouter, Depends, HTTPException
+
+from app.dependencies import require_role
+from app.utils import invalidation
+from app.utils.db_pool import pool_stats
+
+router = APIRouter(
+    prefix="/internal",
+    tags=["internal"],
+    dependencies=[Depends(require_role("admin"))],
+)
+
+
+@router.get("/db/pool")
+async def get_pool_stats() -> dict:
+    """
+    Connection pool stats per database connection
+
+    In use and idle connections, acquire counts, timeouts and a cumulative
+    histogram of the time spent waiting for a connection, in seconds.
+    """
+    return pool_stats()
+
+
+@router.get("/caches")
+async def list_caches() -> list[str]:
+    """Names of the process-local caches"""
+    return invalidation.cache_names()
+
+
+@router.post("/caches/{name}/invalidate", status_code=204)
+async def invalidate_cache(name: str) -> None:
+    """
+    Drop a process-local cache in every worker
+
+    E.g. the role map after roles were changed in USERSMS, or the dimension
+    caches after the tables were edited outside the API.
+    """
+    if name not in invalidation.cache_names():
+        raise HTTPException(status_code=404, detail=f"Unknown cache {name}")
+    invalidation.invalidate_local(name)
+    await invalidation.publish(name)
@@ -1,11 +1,11 @@
 from typing import Annotated
 
-from fastapi import Depends, HTTPException, Path, Query
+from fastapi import Depends, HTTPException, Path, Query, Request, Response
 from ms_core import BaseCRUDRouter, DefaultEndpoint, EndpointConfig
 
 from app import EquipmentCRUD, EquipmentSchema
 from app.dependencies import require_role
-from app.models import EquipmentHistoryEntry
+from app.models import Equipment, EquipmentHistoryEntry
 from app.schemas import (
     EquipmentCreate, 
     EquipmentSchema,
@@ -13,8 +13,14 @@ from app.schemas import (
     TokenIntrospect,
     SearchRequest,
     AdvancedSearchRequest,
+    CountMode,
     SearchResponse,
-    EquipmentStats
+    EquipmentStats,
+    EquipmentLookupSchema,
+    LookupBatchRequest,
+    LookupBatchResponse,
+    ScanBatchRequest,
+    ScanBatchResponse,
 )
 from app.utils.search_utils import (
     search_suggestions,
@@ -22,12 +28,35 @@ from app.utils.search_utils import (
     optimize_search_performance,
     bulk_update_search_vectors
 )
+from app.settings import db_pool_max_size
+from app.utils import change_feed
+from app.utils.admission import ConcurrencyLimit
+from app.utils.db_routing import read_only
+from app.utils.etag import etag_matches, not_modified
+from app.utils.serialization import json_response, parse_fields
+
+# Admission control of the expensive endpoints, so they can't take the whole
+# database pool from lookups and scans (see app.utils.admission). Taken by a
+# parameter after `user`, so only authenticated requests hold a slot
+search_limit = ConcurrencyLimit(
+    "search", limit=max(1, db_pool_max_size // 2), queue=32, timeout=5
+)
+# Stats and analytics aggregate over the whole equipment table, each one a long
+# scan: run one at a time, leaving the pool and the disk to lookups and scans
+analytics_limit = ConcurrencyLimit("analytics", limit=1, queue=4, timeout=10)
+# Full rewrites of the search vectors, one at a time and never queued
+maintenance_limit = ConcurrencyLimit("search_maintenance", limit=1, retry_after=60)
 
 router = BaseCRUDRouter(
     EquipmentCRUD,
     EquipmentSchema,
     EquipmentCreate,
-    exclude_endpoints=[DefaultEndpoint.UPDATE],
+    # Updates go through patch_equipment, reads through list_equipment/get_equipment
+    exclude_endpoints=[
+        endpoint
+        for endpoint in DefaultEndpoint
+        if endpoint not in (DefaultEndpoint.CREATE, DefaultEndpoint.DELETE)
+    ],
     endpoint_configs={
         DefaultEndpoint.CREATE: EndpointConfig(
             path="/",
@@ -44,6 +73,17 @@ router = BaseCRUDRouter(
 )
 
 
+def sparse_fields(
+    fields: str | None = Query(
+        None, description="Comma separated fields to return, all when omitted"
+    ),
+) -> tuple[str, ...] | None:
+    try:
+        return parse_fields(fields)
+    except ValueError as e:
+        raise HTTPException(400, detail=str(e))
+
+
 async def audit_save(
     sub: str, old: EquipmentSchema, new: EquipmentSchema, is_created: bool
 ):
@@ -62,7 +102,7 @@ async def patch_equipment(
     payload: EquipmentCreate,
     item_id: int = Path(),
 ) -> EquipmentSchema:
-    old = await EquipmentCRUD.get_by(id=item_id)
+    old = await EquipmentCRUD.get_equipment(item_id)
 
     if not old:
         raise HTTPException(404, detail="Item not found")
@@ -70,15 +110,48 @@ async def patch_equipment(
     new = await router._update(payload, item_id)
 
     await audit_save(user.sub, old, new, False)
+    await change_feed.publish(change_feed.equipment_event("update", new, old))
 
     return new
 
 
-@router.post("/search", response_model=SearchResponse)
+@router.post("/scans", response_model=ScanBatchResponse)
+async def apply_scans(
+    user: Annotated[TokenIntrospect, Depends(require_role("admin"))],
+    request: ScanBatchRequest,
+) -> Response:
+    """
+    Apply a batch of check-in/check-out scans
+
+    Each scan names an item by serial number or QR code and sets its status,
+    location or both. All changes are written in one transaction with their
+    history. Outcomes are returned per scan, in order: `updated`,
+    `unchanged`, `unknown_code`, `unknown_location` or `unknown_status`.
+    """
+    results = await EquipmentCRUD.apply_scans(request.scans, user.sub)
+    counts = {"updated": 0, "unchanged": 0}
+    for result in results:
+        if result["outcome"] in counts:
+            counts[result["outcome"]] += 1
+    return json_response(
+        {
+            "results": results,
+            **counts,
+            "failed": len(results) - counts["updated"] - counts["unchanged"],
+        }
+    )
+
+
+@router.post(
+    "/search",
+    response_model=SearchResponse,
+    dependencies=[Depends(read_only)],
+)
 async def search_equipment(
     search_request: SearchRequest,
-    user: Annotated[TokenIntrospect, Depends(require_role("user"))]
-) -> SearchResponse:
+    user: Annotated[TokenIntrospect, Depends(require_role("user"))],
+    slot: Annotated[None, Depends(search_limit)],
+) -> Response:
     """
     Full text search for equipment with optional filters
     """
@@ -88,42 +161,44 @@ async def search_equipment(
         offset=search_request.offset,
         status=search_request.status,
         condition_min=search_request.condition_min,
-        condition_max=search_request.condition_max
+        condition_max=search_request.condition_max,
+        fields=search_request.fields,
+        location_id=search_request.location_id
     )
     
     # Get total count for pagination
-    from app.models import Equipment
-    from tortoise.expressions import Q
-    
-    count_query = Q(
-        Q(name__icontains=search_request.query) |
-        Q(serial_number__icontains=search_request.query) |
-        Q(search_vector__icontains=search_request.query)
+    total_count, capped = await EquipmentCRUD.count_matching(
+        EquipmentCRUD.search_filter(
+            search_request.query,
+            search_request.status,
+            search_request.condition_min,
+            search_request.condition_max,
+            search_request.location_id,
+        ),
+        search_request.count_mode,
     )
     
-    if search_request.status:
-        count_query &= Q(status=search_request.status)
-    if search_request.condition_min is not None:
-        count_query &= Q(condition__gte=search_request.condition_min)
-    if search_request.condition_max is not None:
-        count_query &= Q(condition__lte=search_request.condition_max)
-    
-    total_count = await Equipment.filter(count_query).count()
-    
-    return SearchResponse(
-        results=results,
-        total_count=total_count,
-        query=search_request.query,
-        limit=search_request.limit,
-        offset=search_request.offset
-    )
+    return json_response({
+        "results": results,
+        "total_count": total_count,
+        "count_mode": search_request.count_mode,
+        "count_capped": capped,
+        "query": search_request.query,
+        "limit": search_request.limit,
+        "offset": search_request.offset,
+    })
 
 
-@router.post("/search/advanced", response_model=SearchResponse)
+@router.post(
+    "/search/advanced",
+    response_model=SearchResponse,
+    dependencies=[Depends(read_only)],
+)
 async def advanced_search_equipment(
     search_request: AdvancedSearchRequest,
-    user: Annotated[TokenIntrospect, Depends(require_role("user"))]
-) -> SearchResponse:
+    user: Annotated[TokenIntrospect, Depends(require_role("user"))],
+    slot: Annotated[None, Depends(search_limit)],
+) -> Response:
     """
     Advanced search with field-specific search capabilities
     """
@@ -131,72 +206,70 @@ async def advanced_search_equipment(
         query=search_request.query,
         search_fields=search_request.search_fields,
         limit=search_request.limit,
-        offset=search_request.offset
+        offset=search_request.offset,
+        fields=search_request.fields
     )
     
     # Get total count for pagination
-    from app.models import Equipment
-    from tortoise.expressions import Q
-    
-    count_conditions = []
-    for field in search_request.search_fields:
-        if hasattr(Equipment, field):
-            count_conditions.append(Q(**{f"{field}__icontains": search_request.query}))
-    
-    if count_conditions:
-        count_query = count_conditions[0]
-        for condition in count_conditions[1:]:
-            count_query |= condition
-        total_count = await Equipment.filter(count_query).count()
-    else:
-        total_count = len(results)
-    
-    return SearchResponse(
-        results=results,
-        total_count=total_count,
-        query=search_request.query,
-        limit=search_request.limit,
-        offset=search_request.offset
+    total_count, capped = await EquipmentCRUD.count_matching(
+        EquipmentCRUD.advanced_search_filter(
+            search_request.query, search_request.search_fields
+        ),
+        search_request.count_mode,
     )
+    
+    return json_response({
+        "results": results,
+        "total_count": total_count,
+        "count_mode": search_request.count_mode,
+        "count_capped": capped,
+        "query": search_request.query,
+        "limit": search_request.limit,
+        "offset": search_request.offset,
+    })
 
 
-@router.get("/search/quick")
+@router.get("/search/quick", response_model=SearchResponse)
 async def quick_search(
     user: Annotated[TokenIntrospect, Depends(require_role("user"))],
+    slot: Annotated[None, Depends(search_limit)],
+    fields: Annotated[tuple[str, ...] | None, Depends(sparse_fields)],
     q: str = Query(..., min_length=1, max_length=100, description="Quick search query"),
     limit: int = Query(default=10, ge=1, le=50, description="Maximum number of results"),
-) -> SearchResponse:
+    count_mode: CountMode = Query(default="capped", description="How total_count is computed"),
+) -> Response:
     """
     Quick search endpoint for simple text queries
+
+    The total count is capped by default, see `count_capped`.
     """
     results = await EquipmentCRUD.search_equipment(
         query=q,
         limit=limit,
-        offset=0
+        offset=0,
+        fields=fields
     )
     
     # Get total count
-    from app.models import Equipment
-    from tortoise.expressions import Q
-    
-    total_count = await Equipment.filter(
-        Q(name__icontains=q) |
-        Q(serial_number__icontains=q) |
-        Q(search_vector__icontains=q)
-    ).count()
-    
-    return SearchResponse(
-        results=results,
-        total_count=total_count,
-        query=q,
-        limit=limit,
-        offset=0
+    total_count, capped = await EquipmentCRUD.count_matching(
+        EquipmentCRUD.search_filter(q), count_mode
     )
+    
+    return json_response({
+        "results": results,
+        "total_count": total_count,
+        "count_mode": count_mode,
+        "count_capped": capped,
+        "query": q,
+        "limit": limit,
+        "offset": 0,
+    })
 
 
 @router.get("/search/stats", response_model=EquipmentStats)
 async def get_equipment_stats(
-    user: Annotated[TokenIntrospect, Depends(require_role("user"))]
+    user: Annotated[TokenIntrospect, Depends(require_role("user"))],
+    slot: Annotated[None, Depends(analytics_limit)],
 ) -> EquipmentStats:
     """
     Get equipment statistics for search analytics
@@ -213,8 +286,7 @@ async def update_equipment_search_vector(
     """
     Manually update the search vector for a specific equipment item
     """
-    equipment = await EquipmentCRUD.get_by(id=item_id)
-    if not equipment:
+    if not await Equipment.exists(id=item_id):
         raise HTTPException(404, detail="Equipment not found")
     
     await EquipmentCRUD.update_search_vector(item_id)
@@ -224,6 +296,7 @@ async def update_equipment_search_vector(
 @router.get("/search/suggestions")
 async def get_search_suggestions(
     user: Annotated[TokenIntrospect, Depends(require_role("user"))],
+    slot: Annotated[None, Depends(search_limit)],
     q: str = Query(..., min_length=1, max_length=100, description="Partial search query"),
     limit: int = Query(default=5, ge=1, le=20, description="Maximum number of suggestions"),
 ) -> dict[str, object]:
@@ -240,7 +313,8 @@ async def get_search_suggestions(
 
 @router.get("/search/analytics")
 async def get_search_analytics_data(
-    user: Annotated[TokenIntrospect, Depends(require_role("user"))]
+    user: Annotated[TokenIntrospect, Depends(require_role("user"))],
+    slot: Annotated[None, Depends(analytics_limit)],
 ) -> dict[str, object]:
     """
     Get detailed search analytics and equipment distribution
@@ -251,7 +325,8 @@ async def get_search_analytics_data(
 
 @router.post("/search/optimize")
 async def optimize_search(
-    user: Annotated[TokenIntrospect, Depends(require_role("admin"))]
+    user: Annotated[TokenIntrospect, Depends(require_role("admin"))],
+    slot: Annotated[None, Depends(maintenance_limit)],
 ) -> dict[str, object]:
     """
     Optimize search performance by updating all search vectors
@@ -263,7 +338,8 @@ async def optimize_search(
 @router.post("/search/bulk-update")
 async def bulk_update_search_vectors_endpoint(
     equipment_ids: list[int],
-    user: Annotated[TokenIntrospect, Depends(require_role("admin"))]
+    user: Annotated[TokenIntrospect, Depends(require_role("admin"))],
+    slot: Annotated[None, Depends(maintenance_limit)],
 ) -> dict[str, object]:
     """
     Bulk update search vectors for multiple equipment items
@@ -276,3 +352,103 @@ async def bulk_update_search_vectors_endpoint(
     
     result = await bulk_update_search_vectors(equipment_ids)
     return result
+
+
+@router.get("/lookup/serial/{serial_number:path}", response_model=EquipmentLookupSchema)
+async def lookup_by_serial(serial_number: str) -> Response:
+    """
+    Exact serial number lookup for scanners, slim payload
+    """
+    item = (await EquipmentCRUD.lookup("serial_number", [serial_number])).get(serial_number)
+    if item is None:
+        raise HTTPException(404, detail="Item not found")
+    return json_response(item)
+
+
+@router.get("/lookup/qr/{code:path}", response_model=EquipmentLookupSchema)
+async def lookup_by_qr_code(code: str) -> Response:
+    """
+    Exact QR code lookup for scanners, slim payload
+    """
+    item = (await EquipmentCRUD.lookup("qr_code_data", [code])).get(code)
+    if item is None:
+        raise HTTPException(404, detail="Item not found")
+    return json_response(item)
+
+
+@router.post(
+    "/lookup/batch", response_model=LookupBatchResponse, dependencies=[Depends(read_only)]
+)
+async def lookup_batch(request: LookupBatchRequest) -> Response:
+    """
+    Resolve up to 500 serial numbers and QR codes at once, unknown ones map to null
+    """
+    results = {}
+    for key, field, values in (
+        ("serial_numbers", "serial_number", request.serial_numbers),
+        ("qr_codes", "qr_code_data", request.qr_codes),
+    ):
+        found = await EquipmentCRUD.lookup(field, values) if values else {}
+        results[key] = {value: found.get(value) for value in values}
+    return json_response(results)
+
+
+@router.get("/", response_model=list[EquipmentSearchSchema])
+async def list_equipment(
+    request: Request,
+    fields: Annotated[tuple[str, ...] | None, Depends(sparse_fields)],
+    limit: int | None = Query(
+        default=None, ge=1, le=1000, description="Maximum number of results, all when omitted"
+    ),
+    offset: int = Query(default=0, ge=0, description="Number of results to skip"),
+) -> Response:
+    """
+    List equipment, answers 304 when the collection is unchanged
+
+    The whole collection is returned unless a limit is given. X-Total-Count
+    holds the number of items, and a Link header points to the next page
+    while there is one.
+    """
+    etag, total_count = await EquipmentCRUD.list_etag(limit, offset, fields)
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    
+    headers = {"ETag": etag, "X-Total-Count": str(total_count)}
+    if limit is not None and offset + limit < total_count:
+        next_page = request.url.include_query_params(offset=offset + limit)
+        headers["Link"] = f'<{next_page}>; rel="next"'
+    return json_response(
+        await EquipmentCRUD.list_equipment(limit, offset, fields), headers=headers
+    )
+
+
+@router.get("/{item_id}", response_model=EquipmentSchema)
+async def get_equipment(
+    request: Request,
+    response: Response,
+    fields: Annotated[tuple[str, ...] | None, Depends(sparse_fields)],
+    item_id: int = Path(),
+) -> EquipmentSchema | Response:
+    """
+    Get a single equipment item, with its history unless a fieldset is given
+
+    Answers 304 when the If-None-Match header matches the item's ETag.
+    """
+    etag = await EquipmentCRUD.get_equipment_etag(item_id, fields)
+    if etag is None:
+        raise HTTPException(404, detail="Item not found")
+    if etag_matches(request, etag):
+        return not_modified(etag)
+
+    if fields:
+        equipment = await EquipmentCRUD.get_equipment_fields(item_id, fields)
+        if not equipment:
+            raise HTTPException(404, detail="Item not found")
+        return json_response(equipment, headers={"ETag": etag})
+
+    equipment = await EquipmentCRUD.get_equipment(item_id)
+    if not equipment:
+        raise HTTPException(404, detail="Item not found")
+    
+    response.headers["ETag"] = etag
+    return equipment
@@ -1,9 +1,20 @@
-from fastapi import Depends
+from fastapi import Depends, HTTPException, Path, Request, Response
 from ms_core import BaseCRUDRouter, DefaultEndpoint, EndpointConfig
 
 from app.crud import LocationCRUD
 from app.dependencies import require_role
-from app.schemas import LocationCreate, LocationSchema
+from app.models import Location
+from app.schemas import (
+    LocationCreate,
+    LocationMove,
+    LocationSchema,
+    LocationSubtreeCounts,
+    LocationSummarySchema,
+    LocationTreeSchema,
+)
+from app.utils.dimension_cache import invalidate_after_write
+from app.utils.etag import etag_matches, make_etag, not_modified
+from app.utils.serialization import json_response
 
 router = BaseCRUDRouter(
     LocationCRUD,
@@ -11,18 +22,102 @@ router = BaseCRUDRouter(
     LocationCreate,
     prefix="/locations",
     tags=["locations"],
+    # Reads are served from the dimension cache by the handlers below
+    exclude_endpoints=[
+        endpoint
+        for endpoint in DefaultEndpoint
+        if endpoint
+        not in (DefaultEndpoint.CREATE, DefaultEndpoint.UPDATE, DefaultEndpoint.DELETE)
+    ],
     endpoint_configs={
         DefaultEndpoint.CREATE: EndpointConfig(
             path="/",
             methods=["POST"],
-            dependencies=[require_role("admin")],
+            dependencies=[require_role("admin"), invalidate_after_write(Location)],
         ),
         DefaultEndpoint.DELETE: EndpointConfig(
-            path="/{item_id}", methods=["DELETE"], dependencies=[require_role("admin")]
+            path="/{item_id}",
+            methods=["DELETE"],
+            dependencies=[require_role("admin"), invalidate_after_write(Location)],
         ),
         DefaultEndpoint.UPDATE: EndpointConfig(
-            path="/{item_id}", methods=["PATCH"], dependencies=[require_role("admin")]
+            path="/{item_id}",
+            methods=["PATCH"],
+            dependencies=[require_role("admin"), invalidate_after_write(Location)],
         ),
     },
     dependencies=[Depends(require_role("user"))],
 )
+
+
+@router.get("/", response_model=list[LocationSummarySchema])
+async def list_locations(request: Request) -> Response:
+    """
+    List locations from the process-local cache
+    """
+    etag = await LocationCRUD.list_etag()
+    if etag_matches(request, etag):
+        return not_modified(etag)
+
+    return json_response(await LocationCRUD.list_cached(), headers={"ETag": etag})
+
+
+@router.get("/{item_id}", response_model=LocationSummarySchema)
+async def get_location(request: Request, item_id: int = Path()) -> Response:
+    """
+    Get a location from the process-local cache
+    """
+    location = await LocationCRUD.get_cached(item_id)
+    if not location:
+        raise HTTPException(404, detail="Item not found")
+
+    etag = make_etag(location["id"], location["updated_at"])
+    if etag_matches(request, etag):
+        return not_modified(etag)
+
+    return json_response(location, headers={"ETag": etag})
+
+
+@router.get("/{item_id}/subtree", response_model=list[LocationTreeSchema])
+async def get_location_subtree(item_id: int = Path()) -> Response:
+    """
+    A location and all of its sublocations, ordered by depth
+    """
+    subtree = await LocationCRUD.subtree(item_id)
+    if subtree is None:
+        raise HTTPException(404, detail="Item not found")
+
+    return json_response(subtree)
+
+
+@router.get("/{item_id}/subtree/counts", response_model=LocationSubtreeCounts)
+async def get_location_subtree_counts(item_id: int = Path()) -> Response:
+    """
+    Equipment counts of a location and all of its sublocations
+    """
+    if not await LocationCRUD.get_cached(item_id):
+        raise HTTPException(404, detail="Item not found")
+
+    counts = await LocationCRUD.subtree_counts(item_id)
+    return json_response(
+        {"location_id": item_id, "total": sum(counts.values()), "by_location": counts}
+    )
+
+
+@router.post(
+    "/{item_id}/move",
+    response_model=LocationSummarySchema,
+    dependencies=[Depends(require_role("admin")), Depends(invalidate_after_write(Location))],
+)
+async def move_location(move: LocationMove, item_id: int = Path()) -> Response:
+    """
+    Move a location, with everything under it, to another parent
+    """
+    try:
+        location = await LocationCRUD.move(item_id, move.parent_id)
+    except LookupError as e:
+        raise HTTPException(404, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(400, detail=str(e))
+
+    return json_response(location)
@@ -0,0 +1,77 @@
+from datetime import datetime
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+
+from app.dependencies import require_role
+from app.models import InventorySnapshot, LocationClosure
+from app.schemas import AsOfResponse, SnapshotSchema
+from app.utils.serialization import json_response
+from app.utils.snapshots import inventory_as_of, take_snapshot
+
+router = APIRouter(
+    prefix="/snapshots",
+    tags=["snapshots"],
+    dependencies=[Depends(require_role("user"))],
+)
+
+
+@router.get("/", response_model=list[SnapshotSchema])
+async def list_snapshots() -> Response:
+    """
+    Inventory snapshots, newest first
+    """
+    snapshots = await InventorySnapshot.all().order_by("-taken_at").values(
+        "id", "taken_at", "item_count"
+    )
+    return json_response(snapshots)
+
+
+@router.post(
+    "/",
+    response_model=SnapshotSchema,
+    status_code=201,
+    dependencies=[Depends(require_role("admin"))],
+)
+async def create_snapshot() -> Response:
+    """
+    Take a snapshot now, e.g. before a stocktake
+    """
+    snapshot = await take_snapshot()
+    if snapshot is None:
+        raise HTTPException(409, detail="A snapshot is being taken")
+
+    return json_response(
+        {"id": snapshot.id, "taken_at": snapshot.taken_at, "item_count": snapshot.item_count},
+        status_code=201,
+    )
+
+
+@router.get("/as-of", response_model=AsOfResponse)
+async def get_inventory_as_of(
+    at: datetime = Query(..., description="Point in time, with a timezone"),
+    location_id: int | None = Query(
+        None, description="Only items at this location or one of its sublocations"
+    ),
+) -> Response:
+    """
+    The inventory as it was at a point in time
+
+    Starts from the latest snapshot taken before `at` and replays the
+    history written after it. Sublocations are those of the current tree.
+    """
+    if at.tzinfo is None:
+        raise HTTPException(400, detail="`at` must include a timezone")
+
+    location_ids = None
+    if location_id is not None:
+        location_ids = await LocationClosure.filter(ancestor_id=location_id).values_list(
+            "descendant_id", flat=True
+        )
+        if not location_ids:
+            raise HTTPException(404, detail="Location not found")
+
+    inventory = await inventory_as_of(at, location_ids)
+    if inventory is None:
+        raise HTTPException(404, detail="No snapshot was taken before this time")
+
+    return json_response(inventory)
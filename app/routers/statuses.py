@@ -0,0 +1,49 @@
+from fastapi import APIRouter, Depends, HTTPException, Response
+from tortoise.exceptions import IntegrityError
+from tortoise.transactions import in_transaction
+
+from app.dependencies import require_role
+from app.models import EquipmentStatus
+from app.schemas import StatusCreate, StatusSchema
+from app.utils import invalidation, statuses
+from app.utils.serialization import json_response
+
+router = APIRouter(
+    prefix="/statuses",
+    tags=["statuses"],
+    dependencies=[Depends(require_role("user"))],
+)
+
+
+@router.get("/", response_model=list[StatusSchema])
+async def list_statuses() -> Response:
+    """
+    The equipment statuses items can be given, from the process-local vocabulary
+    """
+    return json_response(
+        [{"id": code, "name": name} for code, name in sorted(statuses.vocabulary.names.items())]
+    )
+
+
+@router.post(
+    "/",
+    response_model=StatusSchema,
+    status_code=201,
+    dependencies=[Depends(require_role("admin"))],
+)
+async def create_status(status: StatusCreate) -> Response:
+    """
+    Add a status to the vocabulary
+
+    Statuses can't be renamed or deleted, history and snapshots refer to them
+    by name.
+    """
+    try:
+        async with in_transaction() as connection:
+            created = await EquipmentStatus.create(name=status.name, using_db=connection)
+            await invalidation.publish(statuses.NAME, connection)
+    except IntegrityError:
+        raise HTTPException(409, detail="Status already exists")
+    await statuses.vocabulary.load()
+
+    return json_response({"id": created.id, "name": created.name}, status_code=201)
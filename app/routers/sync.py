@@ -0,0 +1,34 @@
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+
+from app.dependencies import require_role
+from app.utils.serialization import json_response
+from app.utils.sync import SyncCursor, changes_since
+
+router = APIRouter(
+    prefix="/sync",
+    tags=["sync"],
+    dependencies=[Depends(require_role("user"))],
+)
+
+
+@router.get("/")
+async def sync(
+    cursor: str | None = Query(
+        None, description="Cursor of the previous response, omit for a full sync"
+    ),
+    limit: int = Query(500, ge=1, le=2000, description="Rows and tombstones per page"),
+) -> Response:
+    """
+    Equipment changed and rows deleted since a cursor
+
+    Apply `equipment` as upserts and `deleted` (equipment, types and
+    locations) as deletes, then call again with the returned `cursor`
+    while `has_more` is true. Keep the last cursor for the next sync; it
+    may return a few recently synced rows again.
+    """
+    try:
+        start = SyncCursor.decode(cursor) if cursor else SyncCursor.start()
+    except ValueError as e:
+        raise HTTPException(400, detail=str(e))
+
+    return json_response(await changes_since(start, limit))
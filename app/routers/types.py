@@ -1,9 +1,13 @@
-from fastapi import Depends
+from fastapi import Depends, HTTPException, Path, Request, Response
 from ms_core import BaseCRUDRouter, DefaultEndpoint, EndpointConfig
 
 from app.crud import TypeCRUD
 from app.dependencies import require_role
-from app.schemas import TypeCreate, TypeSchema
+from app.models import EquipmentType
+from app.schemas import TypeCreate, TypeSchema, TypeSummarySchema
+from app.utils.dimension_cache import invalidate_after_write
+from app.utils.etag import etag_matches, make_etag, not_modified
+from app.utils.serialization import json_response
 
 router = BaseCRUDRouter(
     TypeCRUD,
@@ -11,18 +15,57 @@ router = BaseCRUDRouter(
     TypeCreate,
     prefix="/types",
     tags=["equipment_types"],
+    # Reads are served from the dimension cache by the handlers below
+    exclude_endpoints=[
+        endpoint
+        for endpoint in DefaultEndpoint
+        if endpoint
+        not in (DefaultEndpoint.CREATE, DefaultEndpoint.UPDATE, DefaultEndpoint.DELETE)
+    ],
     endpoint_configs={
         DefaultEndpoint.CREATE: EndpointConfig(
             path="/",
             methods=["POST"],
-            dependencies=[require_role("admin")],
+            dependencies=[require_role("admin"), invalidate_after_write(EquipmentType)],
         ),
         DefaultEndpoint.DELETE: EndpointConfig(
-            path="/{item_id}", methods=["DELETE"], dependencies=[require_role("admin")]
+            path="/{item_id}",
+            methods=["DELETE"],
+            dependencies=[require_role("admin"), invalidate_after_write(EquipmentType)],
         ),
         DefaultEndpoint.UPDATE: EndpointConfig(
-            path="/{item_id}", methods=["PATCH"], dependencies=[require_role("admin")]
+            path="/{item_id}",
+            methods=["PATCH"],
+            dependencies=[require_role("admin"), invalidate_after_write(EquipmentType)],
         ),
     },
     dependencies=[Depends(require_role("user"))],
 )
+
+
+@router.get("/", response_model=list[TypeSummarySchema])
+async def list_types(request: Request) -> Response:
+    """
+    List equipment types from the process-local cache
+    """
+    etag = await TypeCRUD.list_etag()
+    if etag_matches(request, etag):
+        return not_modified(etag)
+
+    return json_response(await TypeCRUD.list_cached(), headers={"ETag": etag})
+
+
+@router.get("/{item_id}", response_model=TypeSummarySchema)
+async def get_type(request: Request, item_id: int = Path()) -> Response:
+    """
+    Get an equipment type from the process-local cache
+    """
+    equipment_type = await TypeCRUD.get_cached(item_id)
+    if not equipment_type:
+        raise HTTPException(404, detail="Item not found")
+
+    etag = make_etag(equipment_type["id"], equipment_type["updated_at"])
+    if etag_matches(request, etag):
+        return not_modified(etag)
+
+    return json_response(equipment_type, headers={"ETag": etag})
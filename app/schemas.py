@@ -1,9 +1,18 @@
 from datetime import datetime
-from pydantic import BaseModel, Field
+from typing import Literal
+
+from pydantic import BaseModel, Field, field_validator, model_validator
 from tortoise import Tortoise
 from tortoise.contrib.pydantic import pydantic_model_creator
 
-from app.models import Equipment, EquipmentType, Location
+from app.models import (
+    Equipment,
+    EquipmentStatus,
+    EquipmentType,
+    InventorySnapshot,
+    Location,
+)
+from app.utils.serialization import parse_fields
 
 Tortoise.init_models(["app.models"], "models")
 
@@ -25,11 +34,44 @@ TypeSchema = pydantic_model_creator(EquipmentType)
 TypeCreate = pydantic_model_creator(
     EquipmentType, name="TypeCreate", exclude_readonly=True
 )
+# Cached rows, without the reverse equipments relation
+TypeSummarySchema = pydantic_model_creator(
+    EquipmentType, name="TypeSummarySchema", exclude=("equipments",)
+)
+
+StatusSchema = pydantic_model_creator(EquipmentStatus)
+StatusCreate = pydantic_model_creator(
+    EquipmentStatus, name="StatusCreate", exclude_readonly=True
+)
 
 LocationSchema = pydantic_model_creator(Location)
+# Without parent_id: locations are created as roots and placed in the tree with
+# POST /locations/{id}/move, which validates the move
 LocationCreate = pydantic_model_creator(
-    Location, name="LocationCreate", exclude_readonly=True
+    Location, name="LocationCreate", exclude_readonly=True, exclude=("parent_id",)
 )
+LocationSummarySchema = pydantic_model_creator(
+    Location, name="LocationSummarySchema", exclude=("equipments",)
+)
+
+
+class LocationTreeSchema(LocationSummarySchema):  # type: ignore
+    depth: int = Field(description="Levels below the subtree root")
+
+
+class LocationSubtreeCounts(BaseModel):
+    location_id: int
+    total: int
+    by_location: dict[int, int] = Field(
+        description="Equipment count of each location that holds any"
+    )
+
+
+class LocationMove(BaseModel):
+    parent_id: int | None = Field(description="New parent, null to make it a root")
+
+# exact: COUNT(*), estimated: planner estimate, capped: exact up to a cap
+CountMode = Literal["exact", "estimated", "capped"]
 
 
 class SearchRequest(BaseModel):
@@ -39,7 +81,17 @@ class SearchRequest(BaseModel):
     status: str | None = Field(None, description="Filter by equipment status")
     condition_min: int | None = Field(None, ge=0, le=10, description="Minimum condition rating")
     condition_max: int | None = Field(None, ge=0, le=10, description="Maximum condition rating")
+    location_id: int | None = Field(
+        None, description="Filter by location, including its sublocations"
+    )
     search_fields: list[str] | None = Field(None, description="Specific fields to search in")
+    fields: list[str] | None = Field(None, description="Fields to return, all when omitted")
+    count_mode: CountMode = Field("exact", description="How total_count is computed")
+
+    @field_validator("fields")
+    @classmethod
+    def validate_fields(cls, value: list[str] | None) -> tuple[str, ...] | None:
+        return parse_fields(value)
 
 
 class AdvancedSearchRequest(BaseModel):
@@ -50,16 +102,88 @@ class AdvancedSearchRequest(BaseModel):
     )
     limit: int = Field(default=50, ge=1, le=100, description="Maximum number of results")
     offset: int = Field(default=0, ge=0, description="Number of results to skip")
+    fields: list[str] | None = Field(None, description="Fields to return, all when omitted")
+    count_mode: CountMode = Field("exact", description="How total_count is computed")
+
+    @field_validator("fields")
+    @classmethod
+    def validate_fields(cls, value: list[str] | None) -> tuple[str, ...] | None:
+        return parse_fields(value)
 
 
 class SearchResponse(BaseModel):
     results: list[EquipmentSearchSchema]
     total_count: int
+    count_mode: CountMode = "exact"
+    count_capped: bool = Field(
+        False, description="More than total_count results matched, shown as \"N+\""
+    )
     query: str
     limit: int
     offset: int
 
 
+class RelatedName(BaseModel):
+    id: int
+    name: str
+
+
+class EquipmentLookupSchema(BaseModel):
+    id: int
+    updated_at: datetime
+    name: str
+    serial_number: str
+    status: str
+    condition: int
+    qr_code_data: str | None
+    type: RelatedName | None
+    location: RelatedName | None
+
+
+class LookupBatchRequest(BaseModel):
+    serial_numbers: list[str] = Field(default_factory=list, max_length=500)
+    qr_codes: list[str] = Field(default_factory=list, max_length=500)
+
+
+class LookupBatchResponse(BaseModel):
+    serial_numbers: dict[str, EquipmentLookupSchema | None]
+    qr_codes: dict[str, EquipmentLookupSchema | None]
+
+
+class ScanEvent(BaseModel):
+    serial_number: str | None = Field(None, description="Scanned serial number")
+    qr_code: str | None = Field(None, description="Scanned QR code, instead of a serial number")
+    status: str | None = Field(None, max_length=50, description="New status, unchanged when omitted")
+    location_id: int | None = Field(None, description="New location, unchanged when omitted")
+
+    @model_validator(mode="after")
+    def validate_scan(self) -> "ScanEvent":
+        if (self.serial_number is None) == (self.qr_code is None):
+            raise ValueError("Give either serial_number or qr_code")
+        if self.status is None and self.location_id is None:
+            raise ValueError("Give status, location_id or both")
+        return self
+
+
+class ScanBatchRequest(BaseModel):
+    scans: list[ScanEvent] = Field(..., min_length=1, max_length=5000)
+
+
+class ScanOutcome(BaseModel):
+    index: int
+    outcome: Literal[
+        "updated", "unchanged", "unknown_code", "unknown_location", "unknown_status"
+    ]
+    id: int | None = None
+
+
+class ScanBatchResponse(BaseModel):
+    results: list[ScanOutcome]
+    updated: int
+    unchanged: int
+    failed: int
+
+
 class EquipmentStats(BaseModel):
     total_equipment: int
     status_distribution: dict[str, int]
@@ -76,3 +200,30 @@ class TokenIntrospect(BaseModel):
 
 class UserSchema(TokenIntrospect):
     role_name: str | None = None
+
+
+SnapshotSchema = pydantic_model_creator(
+    InventorySnapshot, name="SnapshotSchema", exclude=("items",)
+)
+
+
+class AsOfItem(BaseModel):
+    id: int
+    name: str
+    serial_number: str
+    status: str
+    condition: int
+    type_id: int
+    location_id: int
+
+
+class AsOfSnapshot(BaseModel):
+    id: int
+    taken_at: datetime
+
+
+class AsOfResponse(BaseModel):
+    at: datetime
+    snapshot: AsOfSnapshot = Field(description="Snapshot the history was replayed from")
+    replayed: int = Field(description="History entries replayed")
+    items: list[AsOfItem]
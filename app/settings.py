@@ -5,3 +5,65 @@ logger = logging.getLogger("uvicorn.error")
 
 db_url = os.environ["DB_URL"]
 usersms_url = os.environ["USERSMS_URL"]
+
+# Local verification of signed tokens, introspection is used when both are unset
+jwt_public_key_file = os.environ.get("JWT_PUBLIC_KEY_FILE")
+jwks_url = os.environ.get("JWKS_URL")
+jwt_algorithms = tuple(os.environ.get("JWT_ALGORITHMS", "RS256").split(","))
+jwt_audience = os.environ.get("JWT_AUDIENCE")
+jwt_issuer = os.environ.get("JWT_ISSUER")
+
+# Seconds before cached equipment types and locations are reloaded
+dimension_cache_ttl = float(os.environ.get("DIMENSION_CACHE_TTL", "60"))
+
+# Read replicas, comma separated; read-only queries are spread over them
+db_replica_urls = [url for url in os.environ.get("DB_REPLICA_URLS", "").split(",") if url]
+# Seconds a client's reads stay on the primary after it wrote
+replica_sticky_seconds = float(os.environ.get("REPLICA_STICKY_SECONDS", "5"))
+# Seconds between replica health checks
+replica_health_interval = float(os.environ.get("REPLICA_HEALTH_INTERVAL", "10"))
+
+# asyncpg connection pool, size workers so that workers * max size stays
+# below Postgres max_connections
+db_pool_min_size = int(os.environ.get("DB_POOL_MIN_SIZE", "1"))
+db_pool_max_size = int(os.environ.get("DB_POOL_MAX_SIZE", "5"))
+db_statement_cache_size = int(os.environ.get("DB_STATEMENT_CACHE_SIZE", "100"))
+# Seconds, unset means no timeout
+db_command_timeout = (
+    float(os.environ["DB_COMMAND_TIMEOUT"]) if os.environ.get("DB_COMMAND_TIMEOUT") else None
+)
+# Seconds an idle connection is kept before it is closed
+db_connection_lifetime = float(os.environ.get("DB_CONNECTION_LIFETIME", "300"))
+# Seconds a request waits for a free connection before failing
+db_pool_acquire_timeout = float(os.environ.get("DB_POOL_ACQUIRE_TIMEOUT", "30"))
+
+# Statements slower than this are logged, with their plan in profiled requests
+slow_query_ms = float(os.environ.get("SLOW_QUERY_MS", "200"))
+# Repeats of one query shape in a profiled request reported as a possible N+1
+n_plus_one_threshold = int(os.environ.get("N_PLUS_ONE_THRESHOLD", "5"))
+
+# Change feed: events buffered per subscriber before it is dropped as too slow
+change_feed_buffer = int(os.environ.get("CHANGE_FEED_BUFFER", "256"))
+# Seconds between keepalive comments on idle streams
+change_feed_keepalive = float(os.environ.get("CHANGE_FEED_KEEPALIVE", "15"))
+
+# Scanner lookups: items kept in the hot cache, and seconds before they expire
+lookup_cache_size = int(os.environ.get("LOOKUP_CACHE_SIZE", "10000"))
+lookup_cache_ttl = float(os.environ.get("LOOKUP_CACHE_TTL", "30"))
+
+# Delta sync: seconds a sync cursor stays behind the present, so rows of
+# transactions still running when a page was read are sent on the next sync
+sync_settle_seconds = float(os.environ.get("SYNC_SETTLE_SECONDS", "10"))
+
+# Inventory snapshots for as-of queries: hours between snapshots (0 disables
+# the periodic ones), and days they are kept
+snapshot_interval_hours = float(os.environ.get("SNAPSHOT_INTERVAL_HOURS", "24"))
+snapshot_retention_days = float(os.environ.get("SNAPSHOT_RETENTION_DAYS", "400"))
+
+# Search results counted at most by the capped count mode, reported as "N+"
+search_count_cap = int(os.environ.get("SEARCH_COUNT_CAP", "1000"))
+
+# Backfills in migrations: rows updated per transaction, and seconds slept
+# between batches so replicas and the application keep up
+backfill_batch_size = int(os.environ.get("BACKFILL_BATCH_SIZE", "5000"))
+backfill_pause = float(os.environ.get("BACKFILL_PAUSE", "0.1"))
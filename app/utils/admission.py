@@ -0,0 +1,92 @@
+"""
+Admission control for expensive endpoints
+
+A `ConcurrencyLimit` is a route dependency letting at most `limit` requests
+run at once; up to `queue` more wait for a slot, in order, for at most
+`timeout` seconds. Requests beyond that are shed straight away rather than
+piling up on the database pool and slowing down the cheap hot paths:
+
+- 429 when the queue is full, the client is asked to back off;
+- 503 when a queued request timed out waiting for a slot.
+
+Both carry a `Retry-After` header. Limits are per worker, several routes can
+share one limit. Take a limit with an endpoint parameter declared after the
+authentication one: dependencies are resolved in order, so requests failing
+authentication never hold or wait for a slot. `admission_*` metrics report
+running, queued and rejected requests and the time spent waiting.
+"""
+import asyncio
+import math
+import time
+from typing import AsyncIterator
+
+from fastapi import HTTPException
+
+from app.settings import logger
+from app.utils.metrics import Counter, Gauge, Histogram
+
+running_gauge = Gauge("admission_running", "Requests running under a limit", ("limit",))
+queued_gauge = Gauge("admission_queued", "Requests waiting for a slot", ("limit",))
+rejected_total = Counter(
+    "admission_rejected_total", "Requests shed by admission control", ("limit", "reason")
+)
+wait_duration = Histogram(
+    "admission_wait_seconds", "Time queued requests waited for a slot", ("limit",)
+)
+
+
+class ConcurrencyLimit:
+    def __init__(
+        self,
+        name: str,
+        limit: int,
+        queue: int = 0,
+        timeout: float = 5.0,
+        retry_after: int | None = None,
+    ) -> None:
+        self.name = name
+        self.limit = limit
+        self.queue = queue
+        self.timeout = timeout
+        self.retry_after = retry_after if retry_after is not None else max(1, math.ceil(timeout))
+        self._semaphore = asyncio.Semaphore(limit)
+        self.waiting = 0
+
+    def _reject(self, status_code: int, reason: str) -> HTTPException:
+        rejected_total.inc(self.name, reason)
+        logger.info(f"Shedding a request to {self.name}: {reason}")
+        return HTTPException(
+            status_code,
+            detail=f"Too many concurrent {self.name} requests, retry later",
+            headers={"Retry-After": str(self.retry_after)},
+        )
+
+    async def _acquire(self) -> None:
+        # No awaits between the check and acquire, so a free slot is taken at once
+        if not self._semaphore.locked():
+            await self._semaphore.acquire()
+            return
+        if self.waiting >= self.queue:
+            raise self._reject(429, "queue_full")
+
+        self.waiting += 1
+        queued_gauge.inc(self.name)
+        start = time.perf_counter()
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), self.timeout)
+        except asyncio.TimeoutError:
+            raise self._reject(503, "timeout") from None
+        finally:
+            self.waiting -= 1
+            queued_gauge.dec(self.name)
+        wait_duration.observe(time.perf_counter() - start, self.name)
+
+    async def __call__(self) -> AsyncIterator[None]:
+        """Route dependency, holds a slot while the request is handled"""
+        await self._acquire()
+        running_gauge.inc(self.name)
+        try:
+            yield
+        finally:
+            running_gauge.dec(self.name)
+            self._semaphore.release()
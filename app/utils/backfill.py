@@ -0,0 +1,63 @@
+"""
+Batched backfills of new columns
+
+Filling a new column of a large table with one UPDATE locks every row for
+the whole statement and produces one huge transaction. `backfill` updates
+the rows in id order, `backfill_batch_size` at a time, each batch in its own
+short transaction, sleeping `backfill_pause` seconds between batches so
+replication and the application keep up.
+
+Backfills are meant for the `backfill` hook of migrations (see migrate.py),
+which runs outside a transaction; `where` must exclude rows already done so
+an interrupted backfill resumes where it stopped.
+"""
+import asyncio
+import time
+
+from tortoise.backends.base.client import BaseDBAsyncClient
+
+from app.settings import backfill_batch_size, backfill_pause, logger
+
+# Seconds between progress messages
+PROGRESS_INTERVAL = 10.0
+
+
+async def backfill(
+    db: BaseDBAsyncClient,
+    table: str,
+    assignments: str,
+    where: str,
+    batch_size: int | None = None,
+    pause: float | None = None,
+) -> int:
+    """
+    Run `UPDATE table SET assignments WHERE where` in batches, returns the rows updated
+
+    `assignments` and `where` are SQL over the table's columns, e.g.
+    `"status_code" = 1` and `"status_code" IS NULL`.
+    """
+    batch_size = batch_size or backfill_batch_size
+    pause = backfill_pause if pause is None else pause
+    query = (
+        f'UPDATE "{table}" SET {assignments} WHERE "id" IN ('
+        f'SELECT "id" FROM "{table}" WHERE ({where}) AND "id" > $1 '
+        f'ORDER BY "id" LIMIT {int(batch_size)}) RETURNING "id"'
+    )
+
+    last_id = 0
+    updated = 0
+    reported_at = time.monotonic()
+    while True:
+        rows = await db.execute_query_dict(query, [last_id])
+        if not rows:
+            break
+        updated += len(rows)
+        last_id = max(row["id"] for row in rows)
+        if time.monotonic() - reported_at > PROGRESS_INTERVAL:
+            logger.info(f"Backfilling {table}: {updated} rows, up to id {last_id}")
+            reported_at = time.monotonic()
+        if pause:
+            await asyncio.sleep(pause)
+
+    logger.info(f"Backfilled {updated} rows of {table}")
+    return updated
@@ -0,0 +1,450 @@
+"""
+Bulk import of equipment from CSV or JSONL dumps
+
+    DB_URL=... USERSMS_URL=... python -m app.utils.bulk_import dump.csv [--dry-run]
+
+Rows are streamed in batches. Per batch, type and location names are resolved
+with one query each (missing ones are created), rows are copied into a
+temporary staging table with COPY and merged into `equipments` by serial
+number: existing items are updated, new ones inserted. Updates whose values
+differ get a history entry with their old and new state, written by the same
+statement, so as-of queries (app.utils.snapshots) replay them. Search vectors
+are computed while reading, so no per-row saves are needed afterwards.
+Statuses must be in the vocabulary (see app.utils.statuses), they are not
+created.
+
+Columns: name, serial_number, status, condition, type, location, and
+optionally location_description, photo_url, qr_code_data and metadata (a JSON
+object, as text in CSV files). `--dry-run` validates the whole file and
+reports what would be inserted, updated and created without writing; its
+counts do not account for serial numbers repeated across batches.
+"""
+import argparse
+import asyncio
+import csv
+import json
+import logging
+import sys
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Iterable, Iterator
+
+from tortoise import Tortoise, connections
+
+from app.settings import db_url, logger
+from app.utils import change_feed, invalidation
+from app.utils.db_pool import configure_pool
+from app.utils.statuses import vocabulary
+
+STAGING_COLUMNS = (
+    "line",
+    "name",
+    "serial_number",
+    "status",
+    "condition",
+    "photo_url",
+    "qr_code_data",
+    "metadata",
+    "search_vector",
+    "type_id",
+    "location_id",
+)
+EQUIPMENT_COLUMNS = STAGING_COLUMNS[1:]
+# Author of the history entries of updated items
+HISTORY_EMAIL = "bulk_import"
+
+# Limits of the Equipment model fields
+MAX_LENGTHS = {
+    "name": 255,
+    "serial_number": 255,
+    "status": 50,
+    "photo_url": 500,
+    "qr_code_data": 500,
+    "type": 255,
+    "location": 255,
+    "location_description": 500,
+}
+REQUIRED = ("name", "serial_number", "status", "condition", "type", "location")
+
+# Errors printed in the report, the rest are only counted
+MAX_REPORTED_ERRORS = 20
+
+
+class RowError(ValueError):
+    pass
+
+
+@dataclass
+class ImportReport:
+    read: int = 0
+    invalid: int = 0
+    inserted: int = 0
+    updated: int = 0
+    types_created: int = 0
+    locations_created: int = 0
+    seconds: float = 0.0
+    errors: list[str] = field(default_factory=list)
+
+    def add_error(self, line: int, error: Exception) -> None:
+        self.invalid += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append(f"line {line}: {error}")
+
+    def as_dict(self) -> dict[str, Any]:
+        return {
+            **self.__dict__,
+            "seconds": round(self.seconds, 2),
+            "rows_per_second": round(self.read / self.seconds) if self.seconds else 0,
+        }
+
+
+def read_rows(path: Path, file_format: str) -> Iterator[tuple[int, dict[str, Any]]]:
+    """Stream (line number, row) pairs from a CSV or JSONL file"""
+    with path.open(newline="", encoding="utf-8") as f:
+        if file_format == "csv":
+            reader = csv.DictReader(f)
+            for row in reader:
+                yield reader.line_num, row
+            return
+
+        for line, text in enumerate(f, start=1):
+            if text.strip():
+                try:
+                    yield line, json.loads(text)
+                except json.JSONDecodeError as e:
+                    yield line, {"__error__": f"invalid JSON: {e}"}
+
+
+def _text(row: dict[str, Any], key: str) -> str | None:
+    value = row.get(key)
+    if value is None:
+        return None
+    value = str(value).strip()
+    if not value:
+        return None
+    if len(value) > MAX_LENGTHS[key]:
+        raise RowError(f"{key} is longer than {MAX_LENGTHS[key]} characters")
+    return value
+
+
+def validate_row(row: dict[str, Any]) -> dict[str, Any]:
+    """Normalize a raw row, raising RowError when it cannot be imported"""
+    if "__error__" in row:
+        raise RowError(row["__error__"])
+
+    values = {key: _text(row, key) for key in MAX_LENGTHS}
+    values["condition"] = row.get("condition")
+    missing = [key for key in REQUIRED if values[key] in (None, "")]
+    if missing:
+        raise RowError(f"missing {', '.join(missing)}")
+    if values["status"] not in vocabulary.codes:
+        raise RowError(f"unknown status {values['status']!r}")
+
+    try:
+        condition = int(values["condition"])
+    except (TypeError, ValueError):
+        raise RowError("condition must be an integer")
+    if not 0 <= condition <= 10:
+        raise RowError("condition must be between 0 and 10")
+    values["condition"] = condition
+
+    metadata = row.get("metadata")
+    if isinstance(metadata, str):
+        try:
+            metadata = json.loads(metadata) if metadata.strip() else None
+        except json.JSONDecodeError:
+            raise RowError("metadata is not valid JSON")
+    if metadata is not None and not isinstance(metadata, dict):
+        raise RowError("metadata must be a JSON object")
+    values["metadata"] = json.dumps(metadata) if metadata is not None else None
+    return values
+
+
+def search_vector(values: dict[str, Any]) -> str:
+    # Same parts as EquipmentCRUD.update_search_vector
+    search_parts = [
+        values["name"],
+        values["serial_number"],
+        values["status"],
+        str(values["condition"]),
+        values["type"],
+        values["location"],
+        values["location_description"],
+    ]
+    return " ".join(part for part in search_parts if part)
+
+
+def batches(
+    rows: Iterable[tuple[int, dict[str, Any]]], size: int
+) -> Iterator[list[tuple[int, dict[str, Any]]]]:
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+class ReferenceResolver:
+    """Name -> id of types and locations, looked up and created per batch"""
+
+    def __init__(self, connection: Any, dry_run: bool) -> None:
+        self.connection = connection
+        self.dry_run = dry_run
+        self.types: dict[str, int | None] = {}
+        self.locations: dict[str, int | None] = {}
+
+    async def _resolve(
+        self, table: str, known: dict[str, int | None], names: dict[str, Any]
+    ) -> int:
+        """Fill `known` with ids for `names` (name -> insert values), return created count"""
+        missing = [name for name in names if name not in known]
+        if not missing:
+            return 0
+
+        # Names are not unique, the oldest row wins like a lookup by name would
+        rows = await self.connection.fetch(
+            f'SELECT DISTINCT ON ("name") "name", "id" FROM "{table}" '
+            f'WHERE "name" = ANY($1::text[]) ORDER BY "name", "id"',
+            missing,
+        )
+        known.update((row["name"], row["id"]) for row in rows)
+        to_create = [name for name in missing if name not in known]
+        if not to_create:
+            return 0
+
+        if self.dry_run:
+            known.update((name, None) for name in to_create)
+            return len(to_create)
+
+        if table == "locations":
+            rows = await self.connection.fetch(
+                'INSERT INTO "locations" ("name", "description") '
+                'SELECT * FROM unnest($1::text[], $2::text[]) RETURNING "name", "id"',
+                to_create,
+                [names[name] for name in to_create],
+            )
+        else:
+            rows = await self.connection.fetch(
+                f'INSERT INTO "{table}" ("name") '
+                f'SELECT unnest($1::text[]) RETURNING "name", "id"',
+                to_create,
+            )
+        known.update((row["name"], row["id"]) for row in rows)
+        return len(to_create)
+
+    async def resolve(self, rows: list[dict[str, Any]], report: ImportReport) -> None:
+        types = {row["type"]: None for row in rows}
+        locations: dict[str, str | None] = {}
+        for row in rows:
+            locations.setdefault(row["location"], row["location_description"])
+
+        report.types_created += await self._resolve("equipment_types", self.types, types)
+        report.locations_created += await self._resolve("locations", self.locations, locations)
+        for row in rows:
+            row["type_id"] = self.types[row["type"]]
+            row["location_id"] = self.locations[row["location"]]
+
+
+async def _create_staging_table(connection: Any) -> None:
+    await connection.execute(
+        """
+        CREATE TEMPORARY TABLE IF NOT EXISTS "equipment_import" (
+            "line" INT NOT NULL,
+            "name" VARCHAR(255) NOT NULL,
+            "serial_number" VARCHAR(255) NOT NULL,
+            "status" SMALLINT NOT NULL,
+            "condition" INT NOT NULL,
+            "photo_url" VARCHAR(500),
+            "qr_code_data" VARCHAR(500),
+            "metadata" JSONB,
+            "search_vector" TEXT,
+            "type_id" INT NOT NULL,
+            "location_id" INT NOT NULL
+        )
+        """
+    )
+
+
+# Last row wins when a serial number repeats in the file
+_DEDUPLICATED = """
+    SELECT DISTINCT ON ("serial_number") *
+    FROM "equipment_import"
+    ORDER BY "serial_number", "line" DESC
+"""
+
+
+def _history_state(alias: str) -> str:
+    """JSON state of an equipments row for history, with the status name like the API"""
+    return (
+        f"""to_jsonb({alias}) || jsonb_build_object('status', """
+        f"""(SELECT "name" FROM "equipment_statuses" WHERE "id" = {alias}."status"))"""
+    )
+
+
+async def _merge_batch(connection: Any, rows: list[dict[str, Any]]) -> tuple[int, int]:
+    """Copy a batch into the staging table and merge it, returns (inserted, updated)"""
+    async with connection.transaction():
+        await connection.execute('TRUNCATE "equipment_import"')
+        await connection.copy_records_to_table(
+            "equipment_import",
+            records=[tuple(row[column] for column in STAGING_COLUMNS) for row in rows],
+            columns=STAGING_COLUMNS,
+        )
+        await connection.execute('ANALYZE "equipment_import"')
+
+        assignments = ", ".join(f'"{column}" = s."{column}"' for column in EQUIPMENT_COLUMNS)
+        columns = ", ".join(f'"{column}"' for column in EQUIPMENT_COLUMNS)
+        changed = " OR ".join(
+            f'p."{column}" IS DISTINCT FROM u."{column}"'
+            for column in EQUIPMENT_COLUMNS
+            if column != "search_vector"  # Derived from the others
+        )
+        # All CTEs see the rows as they were before the update
+        updated = await connection.fetchval(
+            f"""
+            WITH "previous" AS (
+                SELECT e.* FROM "equipments" AS e
+                WHERE e."serial_number" IN (SELECT "serial_number" FROM "equipment_import")
+            ), "updated" AS (
+                UPDATE "equipments" AS e
+                SET {assignments}, "updated_at" = CURRENT_TIMESTAMP
+                FROM ({_DEDUPLICATED}) AS s
+                WHERE e."serial_number" = s."serial_number"
+                RETURNING e.*
+            ), "history" AS (
+                INSERT INTO "history"
+                    ("equipment_id", "action", "old", "new", "email", "created_at", "updated_at")
+                SELECT u."id", 'update', {_history_state("p")}, {_history_state("u")}, $1,
+                    CURRENT_TIMESTAMP, CURRENT_TIMESTAMP
+                FROM "updated" AS u JOIN "previous" AS p ON p."id" = u."id"
+                WHERE {changed}
+            )
+            SELECT count(*) FROM "updated"
+            """,
+            HISTORY_EMAIL,
+        )
+
+        inserted = await connection.execute(
+            f"""
+            INSERT INTO "equipments" ({columns}, "created_at", "updated_at")
+            SELECT {columns}, CURRENT_TIMESTAMP, CURRENT_TIMESTAMP
+            FROM ({_DEDUPLICATED}) AS s
+            WHERE NOT EXISTS (
+                SELECT 1 FROM "equipments" AS e WHERE e."serial_number" = s."serial_number"
+            )
+            """
+        )
+    # The status string looks like "INSERT 0 42"
+    return int(inserted.split()[-1]), updated
+
+
+async def _count_existing(connection: Any, rows: list[dict[str, Any]]) -> int:
+    serials = list({row["serial_number"] for row in rows})
+    return await connection.fetchval(
+        'SELECT COUNT(DISTINCT "serial_number") FROM "equipments" '
+        'WHERE "serial_number" = ANY($1::text[])',
+        serials,
+    )
+
+
+async def import_file(
+    path: Path, file_format: str, batch_size: int = 10_000, dry_run: bool = False
+) -> ImportReport:
+    report = ImportReport()
+    client = connections.get("default")
+    if client.capabilities.dialect != "postgres":
+        raise RuntimeError("Bulk import needs PostgreSQL (COPY)")
+    await vocabulary.load(client)
+
+    start = time.perf_counter()
+    async with client.acquire_connection() as connection:
+        if not dry_run:
+            await _create_staging_table(connection)
+        resolver = ReferenceResolver(connection, dry_run)
+
+        for batch in batches(read_rows(path, file_format), batch_size):
+            rows = []
+            for line, raw in batch:
+                report.read += 1
+                try:
+                    values = validate_row(raw)
+                except RowError as e:
+                    report.add_error(line, e)
+                    continue
+                values["line"] = line
+                values["search_vector"] = search_vector(values)
+                # Staged as its code, the search vector has the name
+                values["status"] = vocabulary.codes[values["status"]]
+                rows.append(values)
+            if not rows:
+                continue
+
+            await resolver.resolve(rows, report)
+            if dry_run:
+                existing = await _count_existing(connection, rows)
+                report.updated += existing
+                report.inserted += len({row["serial_number"] for row in rows}) - existing
+            else:
+                inserted, updated = await _merge_batch(connection, rows)
+                report.inserted += inserted
+                report.updated += updated
+
+            elapsed = time.perf_counter() - start
+            logger.info(
+                f"Imported {report.read} rows ({report.invalid} invalid) "
+                f"at {report.read / elapsed:.0f} rows/s"
+            )
+
+    if not dry_run:
+        # Too many rows for one event each, tell dashboards to reload
+        await change_feed.publish(
+            {"entity": "equipment", "action": "import", "count": report.inserted + report.updated}
+        )
+        if report.types_created:
+            await invalidation.publish("equipment_types")
+        if report.locations_created:
+            await invalidation.publish("locations")
+
+    report.seconds = time.perf_counter() - start
+    return report
+
+
+async def run(args: argparse.Namespace) -> ImportReport:
+    config = {
+        "connections": {"default": db_url},
+        "apps": {"models": {"models": ["app.models"], "default_connection": "default"}},
+    }
+    configure_pool(config)
+    await Tortoise.init(config=config)
+    try:
+        return await import_file(args.file, args.format, args.batch_size, args.dry_run)
+    finally:
+        await Tortoise.close_connections()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("file", type=Path, help="CSV or JSONL file")
+    parser.add_argument(
+        "--format", choices=("csv", "jsonl"), help="Defaults to the file extension"
+    )
+    parser.add_argument("--batch-size", type=int, default=10_000, help="Rows per COPY")
+    parser.add_argument(
+        "--dry-run", action="store_true", help="Validate and report without writing"
+    )
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    args.format = args.format or ("jsonl" if args.file.suffix in (".jsonl", ".ndjson") else "csv")
+
+    report = asyncio.run(run(args))
+    print(json.dumps({"dry_run": args.dry_run, **report.as_dict()}, indent=2))
+    if report.invalid:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,261 @@
+"""
+Change feed of equipment, types and locations
+
+Writes publish a small JSON event on `CHANNEL` (Postgres NOTIFY, delivered
+on commit). Equipment deletes are sent by a database trigger instead, so
+items deleted along with their type or location are reported too. Every
+worker receives all events on its shared listening connection and fans them
+out in-process to its subscribers, so the database sees one listener per
+worker however many dashboards are connected.
+
+Each subscriber has filters and a bounded queue. A `ready` event tells it
+that the worker is listening: a client loads its initial state after that,
+so no change falls in between. Equipment events carry the previous status,
+type and location when they changed, so an item leaving a filtered location
+or status is delivered too. A subscriber whose queue is full is cut off with
+a `reset` event rather than slowing the fan-out down; it is expected to
+subscribe again and reload. Subscribers also get a `reset` when the listener
+reconnects, as events may have been missed.
+"""
+import asyncio
+import json
+from datetime import datetime
+from typing import Any, AsyncIterator, Callable, Iterable
+
+from tortoise.backends.base.client import BaseDBAsyncClient
+from tortoise.models import Model
+from tortoise.signals import post_delete, post_save
+
+from app.models import Equipment, EquipmentType, Location
+from app.settings import change_feed_buffer, change_feed_keepalive, logger
+from app.utils.metrics import Counter, Gauge
+from app.utils.notifications import listener, notify, notify_many
+
+CHANNEL = "qsinventory_changes"
+ENTITIES = ("equipment", "type", "location")
+# Fields of equipment events, filters look at the last three
+EQUIPMENT_FIELDS = ("name", "serial_number", "condition", "status", "type_id", "location_id")
+FILTERED_FIELDS = ("status", "type_id", "location_id")
+# Sent once the worker listens for the subscriber
+READY = {"entity": None, "action": "ready"}
+# Ends the stream of a subscriber that has to reload
+RESET = {"entity": None, "action": "reset"}
+
+subscribers_gauge = Gauge("change_feed_subscribers", "Connected change feed subscribers")
+events_total = Counter("change_feed_events_total", "Change events received", ("entity",))
+dropped_total = Counter(
+    "change_feed_dropped_subscribers_total", "Subscribers cut off for falling behind"
+)
+
+
+def _related_id(item: Any, relation: str) -> int | None:
+    """FK id of a model instance, or of a nested object in a schema"""
+    value = getattr(item, f"{relation}_id", None)
+    if value is None and not isinstance(item, Model):
+        related = getattr(item, relation, None)
+        value = getattr(related, "id", None)
+    return value
+
+
+def equipment_event(action: str, item: Any, previous: Any = None) -> dict[str, Any]:
+    """Event for an equipment model instance or schema, `previous` before an update"""
+    event = {"entity": "equipment", "action": action, "id": item.id}
+    for field in EQUIPMENT_FIELDS:
+        if field.endswith("_id"):
+            event[field] = _related_id(item, field.removesuffix("_id"))
+        else:
+            event[field] = getattr(item, field)
+    updated_at = getattr(item, "updated_at", None)
+    event["updated_at"] = updated_at.isoformat() if isinstance(updated_at, datetime) else None
+
+    if previous is not None:
+        changed = {}
+        for field in FILTERED_FIELDS:
+            if field.endswith("_id"):
+                value = _related_id(previous, field.removesuffix("_id"))
+            else:
+                value = getattr(previous, field)
+            if value != event[field]:
+                changed[field] = value
+        if changed:
+            event["previous"] = changed
+    return event
+
+
+async def publish(event: dict[str, Any], using_db: BaseDBAsyncClient | None = None) -> None:
+    """Send an event to the subscribers of every worker"""
+    await notify(CHANNEL, json.dumps(event, default=str), using_db)
+
+
+async def publish_many(
+    events: list[dict[str, Any]], using_db: BaseDBAsyncClient | None = None
+) -> None:
+    """Send several events with a single statement"""
+    if events:
+        payloads = [json.dumps(event, default=str) for event in events]
+        await notify_many(CHANNEL, payloads, using_db)
+
+
+class Subscription:
+    def __init__(
+        self,
+        entities: Iterable[str] | None = None,
+        location_ids: Iterable[int] | None = None,
+        type_ids: Iterable[int] | None = None,
+        statuses: Iterable[str] | None = None,
+    ) -> None:
+        self.entities = frozenset(entities) if entities else None
+        self.filters: dict[str, frozenset] = {}
+        for field, values in (
+            ("location_id", location_ids),
+            ("type_id", type_ids),
+            ("status", statuses),
+        ):
+            if values:
+                self.filters[field] = frozenset(values)
+        self.queue: asyncio.Queue[dict[str, Any]] = asyncio.Queue(change_feed_buffer)
+        self.ready = False
+        self.closed = False
+
+    def matches(self, event: dict[str, Any]) -> bool:
+        entity = event["entity"]
+        if self.entities is not None and entity not in self.entities:
+            return False
+
+        if event["action"] == "import":
+            # Bulk changes without details, every subscriber has to reload
+            return True
+        if entity == "equipment":
+            previous = event.get("previous", {})
+            for field, allowed in self.filters.items():
+                if event.get(field) not in allowed and previous.get(field) not in allowed:
+                    return False
+        elif entity == "type" and "type_id" in self.filters:
+            return event["id"] in self.filters["type_id"]
+        elif entity == "location" and "location_id" in self.filters:
+            return event["id"] in self.filters["location_id"]
+        return True
+
+    def offer(self, event: dict[str, Any]) -> None:
+        if self.closed or not self.ready:
+            return
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.close()
+            dropped_total.inc()
+            logger.info("Change feed subscriber fell behind, sending a reset")
+
+    def mark_ready(self) -> None:
+        self.ready = True
+        self.offer(READY)
+
+    def close(self) -> None:
+        """Replace whatever is queued with a final reset"""
+        self.closed = True
+        while not self.queue.empty():
+            self.queue.get_nowait()
+        self.queue.put_nowait(RESET)
+
+
+class ChangeHub:
+    """In-process fan-out of the events received by this worker"""
+
+    def __init__(self) -> None:
+        self.subscriptions: set[Subscription] = set()
+        # In-process consumers (e.g. caches), called with every event and
+        # with RESET when events may have been missed
+        self.observers: list[Callable[[dict[str, Any]], None]] = []
+
+    def _notify_observers(self, event: dict[str, Any]) -> None:
+        for observer in self.observers:
+            try:
+                observer(event)
+            except Exception:
+                logger.exception(f"Change feed observer {observer} failed")
+
+    def dispatch(self, payload: str) -> None:
+        try:
+            event = json.loads(payload)
+        except ValueError:
+            logger.warning(f"Ignoring malformed change event: {payload!r}")
+            return
+        events_total.inc(str(event.get("entity")))
+        self._notify_observers(event)
+        for subscription in tuple(self.subscriptions):
+            if subscription.matches(event):
+                subscription.offer(event)
+
+    def on_connect(self) -> None:
+        self._notify_observers(RESET)
+        for subscription in tuple(self.subscriptions):
+            if subscription.ready:
+                # Was live before the connection dropped, may have missed events
+                subscription.close()
+            else:
+                subscription.mark_ready()
+
+    def available(self) -> bool:
+        return listener.ensure_running()
+
+    async def subscribe(self, subscription: Subscription) -> AsyncIterator[dict[str, Any] | None]:
+        """
+        Events of a subscription, None after `change_feed_keepalive` idle seconds
+
+        Starts with a ready event once the worker listens, ends after a reset
+        event. Check `available` first.
+        """
+        self.subscriptions.add(subscription)
+        subscribers_gauge.inc()
+        if listener.connected.is_set():
+            subscription.mark_ready()
+        try:
+            while True:
+                try:
+                    event = await asyncio.wait_for(
+                        subscription.queue.get(), change_feed_keepalive
+                    )
+                except asyncio.TimeoutError:
+                    yield None
+                    continue
+                yield event
+                if event is RESET:
+                    return
+        finally:
+            self.subscriptions.discard(subscription)
+            subscribers_gauge.dec()
+
+
+hub = ChangeHub()
+listener.listen(CHANNEL, hub.dispatch, on_connect=hub.on_connect)
+
+
+@post_save(Equipment)
+async def _equipment_created(sender, instance, created, using_db, update_fields) -> None:
+    # Updates are published by the endpoints, which know the previous values
+    if created:
+        await publish(equipment_event("create", instance), using_db)
+
+
+# Equipment deletes are published by a trigger (migration 15), including
+# those cascading from a deleted type or location
+
+
+@post_save(EquipmentType, Location)
+async def _dimension_saved(sender, instance, created, using_db, update_fields) -> None:
+    entity = "type" if sender is EquipmentType else "location"
+    event = {
+        "entity": entity,
+        "action": "create" if created else "update",
+        "id": instance.id,
+        "name": instance.name,
+    }
+    if sender is Location:
+        event["parent_id"] = instance.parent_id
+    await publish(event, using_db)
+
+
+@post_delete(EquipmentType, Location)
+async def _dimension_deleted(sender, instance, using_db) -> None:
+    entity = "type" if sender is EquipmentType else "location"
+    await publish({"entity": entity, "action": "delete", "id": instance.id}, using_db)
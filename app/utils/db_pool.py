@@ -0,0 +1,216 @@
+"""
+Configurable asyncpg pool with acquire metrics
+
+Used as a Tortoise engine (`client_class` below): `configure_pool` switches
+the asyncpg connections of the Tortoise config to it and fills in the pool
+settings. The pool is wrapped so every acquire, from plain queries and from
+transactions alike, is timed and counted. Queries are reported to the
+request metrics and the query profiler, see app.utils.profiler.
+"""
+import asyncio
+import bisect
+import time
+from typing import Any
+
+import asyncpg
+from tortoise import connections
+from tortoise.backends.asyncpg import AsyncpgDBClient
+from tortoise.backends.asyncpg.client import TransactionWrapper
+from tortoise.backends.base.client import NestedTransactionContext, TransactionContextPooled
+from tortoise.backends.base.config_generator import expand_db_url
+
+from app.settings import (
+    db_command_timeout,
+    db_connection_lifetime,
+    db_pool_acquire_timeout,
+    db_pool_max_size,
+    db_pool_min_size,
+    db_statement_cache_size,
+    logger,
+)
+from app.utils.metrics import Gauge, collectors
+from app.utils.profiler import track_query
+
+# Upper bounds in seconds of the acquire wait histogram buckets
+WAIT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class PoolStats:
+    """Acquire counters of one pool"""
+
+    def __init__(self) -> None:
+        self.acquired = 0
+        self.timeouts = 0
+        self.wait_sum = 0.0
+        # One count per bucket plus the +Inf bucket
+        self.wait_counts = [0] * (len(WAIT_BUCKETS) + 1)
+
+    def observe(self, wait: float) -> None:
+        self.acquired += 1
+        self.wait_sum += wait
+        self.wait_counts[bisect.bisect_left(WAIT_BUCKETS, wait)] += 1
+
+    def histogram(self) -> dict[str, int]:
+        """Cumulative bucket counts keyed by upper bound, like Prometheus"""
+        buckets = {}
+        total = 0
+        for bound, count in zip((*map(str, WAIT_BUCKETS), "+Inf"), self.wait_counts):
+            total += count
+            buckets[bound] = total
+        return buckets
+
+
+class InstrumentedPool:
+    """asyncpg pool proxy timing `acquire`, everything else is passed through"""
+
+    def __init__(self, pool: asyncpg.Pool, acquire_timeout: float | None) -> None:
+        self._pool = pool
+        self.acquire_timeout = acquire_timeout
+        self.stats = PoolStats()
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._pool, name)
+
+    async def acquire(self, timeout: float | None = None) -> asyncpg.Connection:
+        start = time.perf_counter()
+        try:
+            connection = await self._pool.acquire(timeout=timeout or self.acquire_timeout)
+        except asyncio.TimeoutError:
+            self.stats.timeouts += 1
+            logger.warning(
+                f"Timed out after {time.perf_counter() - start:.2f}s waiting for "
+                f"a database connection ({self._pool.get_max_size()} max)"
+            )
+            raise
+        self.stats.observe(time.perf_counter() - start)
+        return connection
+
+
+class QueryMetricsMixin:
+    """Report every query to the request metrics and the profiler"""
+
+    async def execute_insert(self, query: str, values: list) -> Any:
+        async with track_query(self, query, values):
+            return await super().execute_insert(query, values)
+
+    async def execute_many(self, query: str, values: list) -> None:
+        async with track_query(self, query, values):
+            return await super().execute_many(query, values)
+
+    async def execute_query(self, query: str, values: list | None = None) -> Any:
+        async with track_query(self, query, values):
+            return await super().execute_query(query, values)
+
+    async def execute_query_dict(self, query: str, values: list | None = None) -> list[dict]:
+        async with track_query(self, query, values):
+            return await super().execute_query_dict(query, values)
+
+    async def execute_script(self, query: str) -> None:
+        async with track_query(self, query, None):
+            return await super().execute_script(query)
+
+
+class InstrumentedTransactionWrapper(QueryMetricsMixin, TransactionWrapper):
+    def _in_transaction(self) -> NestedTransactionContext:
+        return NestedTransactionContext(InstrumentedTransactionWrapper(self))
+
+
+class InstrumentedAsyncpgClient(QueryMetricsMixin, AsyncpgDBClient):
+    def __init__(self, **kwargs: Any) -> None:
+        self.acquire_timeout = kwargs.pop("acquire_timeout", None)
+        super().__init__(**kwargs)
+
+    async def create_pool(self, **kwargs) -> InstrumentedPool:
+        pool = await super().create_pool(**kwargs)
+        return InstrumentedPool(pool, self.acquire_timeout)
+
+    def _in_transaction(self) -> TransactionContextPooled:
+        return TransactionContextPooled(
+            InstrumentedTransactionWrapper(self), self._pool_init_lock
+        )
+
+    def pool_stats(self) -> dict[str, Any] | None:
+        """Size and acquire stats, None until the pool is created"""
+        pool = self._pool
+        if pool is None:
+            return None
+
+        size = pool.get_size()
+        idle = pool.get_idle_size()
+        stats = pool.stats
+        return {
+            "min_size": pool.get_min_size(),
+            "max_size": pool.get_max_size(),
+            "size": size,
+            "in_use": size - idle,
+            "idle": idle,
+            "acquired": stats.acquired,
+            "timeouts": stats.timeouts,
+            "acquire_wait": {
+                "count": stats.acquired,
+                "sum": round(stats.wait_sum, 6),
+                "buckets": stats.histogram(),
+            },
+        }
+
+
+client_class = InstrumentedAsyncpgClient
+
+
+def configure_pool(tortoise_conf: dict[str, Any]) -> None:
+    """
+    Switch asyncpg connections to the instrumented client with the pool settings
+
+    Options given in the connection URL query string take precedence.
+    """
+    pool_options = {
+        "minsize": db_pool_min_size,
+        "maxsize": db_pool_max_size,
+        "statement_cache_size": db_statement_cache_size,
+        "max_inactive_connection_lifetime": db_connection_lifetime,
+        "acquire_timeout": db_pool_acquire_timeout,
+    }
+    if db_command_timeout is not None:
+        pool_options["command_timeout"] = db_command_timeout
+
+    for name, connection in tortoise_conf["connections"].items():
+        if isinstance(connection, str):
+            connection = expand_db_url(connection)
+        if connection["engine"] != "tortoise.backends.asyncpg":
+            continue
+
+        connection["engine"] = __name__
+        for option, value in pool_options.items():
+            connection["credentials"].setdefault(option, value)
+        tortoise_conf["connections"][name] = connection
+
+
+def pool_stats() -> dict[str, Any]:
+    """Stats of every instrumented connection pool by connection name"""
+    return {
+        client.connection_name: client.pool_stats()
+        for client in connections.all()
+        if isinstance(client, InstrumentedAsyncpgClient)
+    }
+
+
+pool_connections = Gauge(
+    "db_pool_connections", "Pooled database connections", ("connection", "state")
+)
+pool_max_size = Gauge("db_pool_max_size", "Maximum pool size", ("connection",))
+pool_acquire_timeouts = Gauge(
+    "db_pool_acquire_timeouts", "Connection acquires that timed out", ("connection",)
+)
+
+
+def _collect_pool_metrics() -> None:
+    for name, stats in pool_stats().items():
+        if stats is None:
+            continue
+        pool_connections.set(stats["in_use"], name, "in_use")
+        pool_connections.set(stats["idle"], name, "idle")
+        pool_max_size.set(stats["max_size"], name)
+        pool_acquire_timeouts.set(stats["timeouts"], name)
+
+
+collectors.append(_collect_pool_metrics)
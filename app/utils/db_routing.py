@@ -0,0 +1,157 @@
+"""
+Read replica routing
+
+Replica connections are added to the Tortoise config next to the primary and
+picked by `ReplicaRouter`, a Tortoise connection router. Reads are only sent
+to replicas inside requests that do not write: GET/HEAD requests and routes
+marked with the `read_only` dependency (e.g. POST search). Everything else,
+including migrations and background jobs, stays on the primary.
+
+After a client's write request, its reads stay on the primary for
+`replica_sticky_seconds` so it reads its own writes despite replication lag.
+Replicas are pinged in the background and skipped while unreachable.
+"""
+import asyncio
+import contextvars
+import hashlib
+import itertools
+import time
+from typing import Any, Awaitable, Callable
+
+from fastapi import Request, Response
+from tortoise import connections
+
+from app.settings import logger, replica_health_interval, replica_sticky_seconds
+
+SAFE_METHODS = frozenset({"GET", "HEAD", "OPTIONS"})
+
+# Whether reads of the current request may go to a replica
+_route_reads: contextvars.ContextVar[bool] = contextvars.ContextVar(
+    "route_reads", default=False
+)
+
+
+class ReplicaSet:
+    """Replica connection names with round-robin selection over healthy ones"""
+
+    def __init__(self) -> None:
+        self.names: list[str] = []
+        self.healthy: list[str] = []
+        self._counter = itertools.count()
+        self._health_task: asyncio.Task | None = None
+
+    def __bool__(self) -> bool:
+        return bool(self.names)
+
+    def pick(self) -> str | None:
+        healthy = self.healthy
+        if not healthy:
+            return None
+        return healthy[next(self._counter) % len(healthy)]
+
+    async def _ping(self, name: str) -> bool:
+        try:
+            await asyncio.wait_for(
+                connections.get(name).execute_query("SELECT 1"),
+                timeout=replica_health_interval,
+            )
+            return True
+        except Exception as e:
+            logger.warning(f"Read replica {name} is unhealthy: {e}")
+            return False
+
+    async def check(self) -> None:
+        results = await asyncio.gather(*(self._ping(name) for name in self.names))
+        healthy = [name for name, ok in zip(self.names, results) if ok]
+        if healthy != self.healthy:
+            logger.info(f"Healthy read replicas: {healthy or 'none, using primary'}")
+        self.healthy = healthy
+
+    async def _health_loop(self) -> None:
+        while True:
+            await self.check()
+            await asyncio.sleep(replica_health_interval)
+
+    def ensure_health_checks(self) -> None:
+        if self._health_task is None or self._health_task.done():
+            self._health_task = asyncio.create_task(self._health_loop())
+
+
+replicas = ReplicaSet()
+
+# Client key -> monotonic time until which its reads stay on the primary
+_sticky_until: dict[str, float] = {}
+
+
+class ReplicaRouter:
+    """Tortoise connection router, see the `routers` config key"""
+
+    def db_for_read(self, model: Any) -> str | None:
+        if _route_reads.get():
+            return replicas.pick()
+        return None
+
+    def db_for_write(self, model: Any) -> str | None:
+        return None
+
+
+def register_replicas(tortoise_conf: dict[str, Any], replica_urls: list[str]) -> None:
+    """Add replica connections and the replica router to a Tortoise config"""
+    if not replica_urls:
+        return
+
+    for index, url in enumerate(replica_urls):
+        name = f"replica_{index}"
+        tortoise_conf["connections"][name] = url
+        replicas.names.append(name)
+    replicas.healthy = list(replicas.names)
+    tortoise_conf["routers"] = [ReplicaRouter]
+    logger.info(f"Routing read-only queries to {len(replica_urls)} replicas")
+
+
+def _client_key(request: Request) -> str:
+    authorization = request.headers.get("authorization")
+    if authorization:
+        return hashlib.blake2b(authorization.encode(), digest_size=16).hexdigest()
+    return request.client.host if request.client else ""
+
+
+def _is_sticky(key: str) -> bool:
+    until = _sticky_until.get(key)
+    return until is not None and until > time.monotonic()
+
+
+def _mark_sticky(key: str) -> None:
+    now = time.monotonic()
+    if len(_sticky_until) > 10_000:
+        for stale in [k for k, until in _sticky_until.items() if until <= now]:
+            del _sticky_until[stale]
+    _sticky_until[key] = now + replica_sticky_seconds
+
+
+async def route_reads(
+    request: Request, call_next: Callable[[Request], Awaitable[Response]]
+) -> Response:
+    """Middleware deciding where the reads of a request go"""
+    if not replicas:
+        return await call_next(request)
+
+    replicas.ensure_health_checks()
+    key = _client_key(request)
+    request.state.sticky = _is_sticky(key)
+    token = _route_reads.set(request.method in SAFE_METHODS and not request.state.sticky)
+    try:
+        response = await call_next(request)
+    finally:
+        _route_reads.reset(token)
+
+    if request.method not in SAFE_METHODS and not getattr(request.state, "read_only", False):
+        _mark_sticky(key)
+    return response
+
+
+async def read_only(request: Request) -> None:
+    """Dependency for non-GET routes that do not write, e.g. POST search"""
+    request.state.read_only = True
+    if replicas and not getattr(request.state, "sticky", True):
+        _route_reads.set(True)
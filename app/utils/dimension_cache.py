@@ -0,0 +1,117 @@
+"""
+Process-local cache of the small dimension tables (equipment types, locations)
+
+Rows are loaded with a single query and served from memory. The cache is
+dropped when a type or location is saved or deleted, in every worker through
+app.utils.invalidation, and expires after `dimension_cache_ttl` seconds in
+case a notification is lost.
+"""
+import asyncio
+import time
+from types import MappingProxyType
+from typing import Any, AsyncIterator, Iterable, Mapping
+
+from tortoise.models import Model
+from tortoise.signals import post_delete, post_save
+
+from app.models import EquipmentType, Location
+from app.settings import dimension_cache_ttl
+from app.utils import invalidation
+from app.utils.serialization import LOCATION_COLUMNS, TYPE_COLUMNS
+
+# Minimum seconds between reloads caused by unknown ids
+MISS_RELOAD_INTERVAL = 1.0
+
+
+class DimensionCache:
+    """All rows of a small table keyed by id, reloaded as a whole"""
+
+    def __init__(self, name: str, model: type[Model], columns: tuple[str, ...], ttl: float):
+        self.name = name
+        self.model = model
+        self.columns = columns
+        self.ttl = ttl
+        self._rows: Mapping[int, dict[str, Any]] | None = None
+        self._loaded_at = 0.0
+        # Bumped by every invalidation, see _reload
+        self._generation = 0
+        self._lock = asyncio.Lock()
+        invalidation.register(name, self.invalidate)
+
+    def _is_fresh(self) -> bool:
+        return self._rows is not None and time.monotonic() - self._loaded_at < self.ttl
+
+    async def _reload(self, loaded_before: float) -> Mapping[int, dict[str, Any]]:
+        async with self._lock:
+            # Another task may have reloaded while we were waiting
+            if self._rows is None or self._loaded_at <= loaded_before:
+                invalidation.listener.ensure_running()
+                generation = self._generation
+                # Always from the primary, a lagging replica would keep stale rows
+                rows = await self.model.all().using_db(self.model._meta.db).order_by(
+                    "id"
+                ).values(*self.columns)
+                self._rows = MappingProxyType({row["id"]: row for row in rows})
+                # Invalidated while loading: serve the rows once, reload next time
+                self._loaded_at = time.monotonic() if generation == self._generation else 0.0
+            return self._rows
+
+    async def rows(self) -> Mapping[int, dict[str, Any]]:
+        """All rows keyed by id, the mapping must not be modified"""
+        if self._is_fresh():
+            return self._rows  # type: ignore
+        return await self._reload(self._loaded_at)
+
+    async def get_many(self, ids: Iterable[int]) -> Mapping[int, dict[str, Any]]:
+        """All rows, reloaded once if any of the ids is missing (e.g. created elsewhere)"""
+        rows = await self.rows()
+        if time.monotonic() - self._loaded_at > MISS_RELOAD_INTERVAL and any(
+            item_id not in rows for item_id in ids if item_id is not None
+        ):
+            rows = await self._reload(self._loaded_at)
+        return rows
+
+    async def get(self, item_id: int) -> dict[str, Any] | None:
+        return (await self.get_many([item_id])).get(item_id)
+
+    def invalidate(self) -> None:
+        self._rows = None
+        self._generation += 1
+
+
+equipment_types = DimensionCache(
+    "equipment_types", EquipmentType, TYPE_COLUMNS, dimension_cache_ttl
+)
+locations = DimensionCache("locations", Location, LOCATION_COLUMNS, dimension_cache_ttl)
+
+caches: dict[type[Model], DimensionCache] = {
+    EquipmentType: equipment_types,
+    Location: locations,
+}
+
+
+@post_save(EquipmentType, Location)
+async def _invalidate_on_save(sender, instance, created, using_db, update_fields) -> None:
+    caches[sender].invalidate()
+    await invalidation.publish(caches[sender].name, using_db)
+
+
+@post_delete(EquipmentType, Location)
+async def _invalidate_on_delete(sender, instance, using_db) -> None:
+    caches[sender].invalidate()
+    await invalidation.publish(caches[sender].name, using_db)
+
+
+def invalidate_after_write(model: type[Model]):
+    """
+    Dependency for write endpoints that drops the cache once the handler is done
+
+    Covers writes that bypass model signals, e.g. queryset updates.
+    """
+
+    async def invalidate() -> AsyncIterator[None]:
+        yield
+        caches[model].invalidate()
+        await invalidation.publish(caches[model].name)
+
+    return invalidate
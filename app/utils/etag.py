@@ -0,0 +1,39 @@
+"""
+ETag helpers for conditional GET requests
+
+Tags are derived from `updated_at` values (and row counts for collections),
+so they can be checked with a cheap metadata query before rendering a body.
+"""
+import hashlib
+from typing import Any
+
+from fastapi import Request, Response
+
+
+def make_etag(*parts: Any) -> str:
+    """Build a strong ETag from the parts that identify a representation"""
+    digest = hashlib.blake2b(repr(parts).encode(), digest_size=16).hexdigest()
+    return f'"{digest}"'
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """Check the If-None-Match header (weak comparison, as RFC 9110 requires)"""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+
+    tags = (tag.strip() for tag in header.split(","))
+    return etag in (tag.removeprefix("W/") for tag in tags)
+
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=304, headers={"ETag": etag})
+
+
+def collection_etag(rows: Any, *parts: Any) -> str:
+    """ETag for in-memory rows, from their count and latest updated_at"""
+    rows = list(rows)
+    last_updated = max((row["updated_at"] for row in rows), default=None)
+    return make_etag(len(rows), last_updated, *parts)
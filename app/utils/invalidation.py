@@ -0,0 +1,70 @@
+"""
+Cross-worker cache invalidation over Postgres LISTEN/NOTIFY
+
+Every worker process keeps its own caches (dimension tables, role map), each
+registered here under a name. A write drops the local cache and publishes
+its name on `CHANNEL`, and the other workers drop theirs when the
+notification arrives. A notification sent inside a transaction is delivered
+on commit, so no worker reloads before the write is visible.
+
+The shared listener (app.utils.notifications) is started with the first
+cache load. After it (re)connects all caches are dropped, as notifications
+may have been missed meanwhile. Cache TTLs stay in place as a fallback.
+"""
+import json
+import os
+import socket
+from typing import Any, Callable
+
+from tortoise.backends.base.client import BaseDBAsyncClient
+
+from app.settings import logger
+from app.utils.notifications import listener, notify
+
+CHANNEL = "qsinventory_cache_invalidation"
+# Identifies this worker, its own notifications are ignored
+ORIGIN = f"{socket.gethostname()}:{os.getpid()}"
+
+_handlers: dict[str, Callable[[], None]] = {}
+
+
+def register(name: str, invalidate: Callable[[], None]) -> None:
+    """Register a process-local cache, `invalidate` drops it"""
+    _handlers[name] = invalidate
+
+
+def cache_names() -> list[str]:
+    return sorted(_handlers)
+
+
+def invalidate_local(name: str | None = None) -> None:
+    """Drop one cache of this worker, or all of them"""
+    for cache, invalidate in _handlers.items():
+        if name is None or cache == name:
+            invalidate()
+
+
+async def publish(name: str, using_db: BaseDBAsyncClient | None = None) -> None:
+    """
+    Tell the other workers to drop a cache
+
+    Pass the connection of the write (e.g. a transaction) so the notification
+    goes out on commit.
+    """
+    await notify(CHANNEL, json.dumps({"cache": name, "origin": ORIGIN}), using_db)
+
+
+def _on_notification(payload: str) -> None:
+    try:
+        message: dict[str, Any] = json.loads(payload)
+    except ValueError:
+        logger.warning(f"Ignoring malformed cache invalidation: {payload!r}")
+        return
+    if message.get("origin") == ORIGIN:
+        return
+    logger.debug(f"Dropping cache {message.get('cache')} on notification")
+    invalidate_local(message.get("cache"))
+
+
+# Anything cached before a (re)connect may have missed a notification
+listener.listen(CHANNEL, _on_notification, on_connect=invalidate_local)
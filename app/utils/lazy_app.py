@@ -0,0 +1,136 @@
+"""
+Lazy startup mode
+
+    uvicorn app.utils.lazy_app:application
+
+Serves `main:application` but lets the server bind its port right away: the
+ASGI wrapper below only imports a few standard modules, reports the lifespan
+startup as complete immediately and imports `main` (FastAPI, routers, CRUD
+classes, pydantic schemas, Tortoise) in a worker thread. The real
+application's lifespan is then run, and requests arriving in the meantime wait
+for it instead of failing. Useful where a worker should be up as soon as
+possible (autoscaling, liveness probes); the first requests still pay the
+import time, see benchmarks.startup.
+
+As the startup is reported complete before `main` is loaded, a failed load
+sends the process SIGTERM: the server shuts down, to be restarted by its
+supervisor, instead of keeping a port open that only answers 503.
+"""
+import asyncio
+import importlib
+import logging
+import os
+import signal
+import time
+from typing import Any, Awaitable, Callable
+
+# Not app.settings, the point is to import as little as possible up front
+logger = logging.getLogger("uvicorn.error")
+
+Scope = dict[str, Any]
+Receive = Callable[[], Awaitable[dict[str, Any]]]
+Send = Callable[[dict[str, Any]], Awaitable[None]]
+
+
+class LazyApplication:
+    def __init__(self, target: str) -> None:
+        self.target = target
+        self.app: Callable | None = None
+        self._state: dict[str, Any] = {}
+        self._loader: asyncio.Task | None = None
+        self._lifespan_task: asyncio.Task | None = None
+        self._lifespan_queue: asyncio.Queue | None = None
+        self._lifespan_events: dict[str, asyncio.Future] = {}
+
+    async def _run_lifespan(self, app: Callable, event: str) -> None:
+        """Send a lifespan event to the real application and wait for its reply"""
+        loop = asyncio.get_running_loop()
+        future = self._lifespan_events[event] = loop.create_future()
+
+        if self._lifespan_task is None:
+            self._lifespan_queue = asyncio.Queue()
+
+            async def send(message: dict[str, Any]) -> None:
+                name, _, outcome = message["type"].removeprefix("lifespan.").partition(".")
+                waiter = self._lifespan_events.get(name)
+                if waiter is None or waiter.done():
+                    return
+                if outcome == "failed":
+                    waiter.set_exception(RuntimeError(message.get("message", "")))
+                else:
+                    waiter.set_result(None)
+
+            scope = {"type": "lifespan", "asgi": {"version": "3.0"}, "state": self._state}
+            self._lifespan_task = asyncio.create_task(
+                app(scope, self._lifespan_queue.get, send)
+            )
+
+        await self._lifespan_queue.put({"type": f"lifespan.{event}"})
+        # An application without lifespan support returns right away
+        await asyncio.wait(
+            (future, self._lifespan_task), return_when=asyncio.FIRST_COMPLETED
+        )
+        if future.done():
+            future.result()
+
+    async def _load(self) -> None:
+        start = time.perf_counter()
+        module_name, _, attribute = self.target.partition(":")
+        try:
+            module = await asyncio.to_thread(importlib.import_module, module_name)
+            app = getattr(module, attribute)
+            imported = time.perf_counter() - start
+            await self._run_lifespan(app, "startup")
+        except Exception:
+            logger.exception(f"Loading {self.target} failed")
+            raise
+
+        self.app = app
+        logger.info(
+            f"Loaded {self.target} in {time.perf_counter() - start:.2f}s "
+            f"({imported:.2f}s importing)"
+        )
+
+    def _stop_on_failure(self, loader: asyncio.Task) -> None:
+        """The startup was reported complete already, stop the server instead"""
+        if not loader.cancelled() and loader.exception() is not None:
+            logger.error(f"Stopping, {self.target} could not be loaded")
+            os.kill(os.getpid(), signal.SIGTERM)
+
+    def _start_loading(self) -> asyncio.Task:
+        if self._loader is None:
+            self._loader = asyncio.create_task(self._load())
+        return self._loader
+
+    async def _lifespan(self, scope: Scope, receive: Receive, send: Send) -> None:
+        await receive()  # lifespan.startup
+        # Shared with request scopes by the server, the real lifespan fills it
+        self._state = scope.get("state", self._state)
+        self._start_loading().add_done_callback(self._stop_on_failure)
+        await send({"type": "lifespan.startup.complete"})
+
+        await receive()  # lifespan.shutdown
+        if self.app is not None:
+            await self._run_lifespan(self.app, "shutdown")
+        elif self._loader is not None:
+            self._loader.cancel()
+        await send({"type": "lifespan.shutdown.complete"})
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] == "lifespan":
+            await self._lifespan(scope, receive, send)
+            return
+
+        if self.app is None:
+            try:
+                await asyncio.shield(self._start_loading())
+            except Exception:
+                if scope["type"] == "http":
+                    await send({"type": "http.response.start", "status": 503, "headers": []})
+                    await send({"type": "http.response.body", "body": b"Service unavailable"})
+                return
+
+        await self.app(scope, receive, send)
+
+
+application = LazyApplication("main:application")
@@ -0,0 +1,86 @@
+"""
+Hot cache for scanner lookups by serial number and QR code
+
+Recently scanned items are kept in a small LRU as slim rows (see
+LOOKUP_COLUMNS), keyed by the looked up field and value. Entries expire after
+`lookup_cache_ttl` seconds and are dropped as soon as the change feed reports
+a write to the item, in any worker. Unknown codes are not cached, so a newly
+labelled item is found on its first scan.
+"""
+import time
+from collections import OrderedDict
+from typing import Any
+
+from app.settings import lookup_cache_size, lookup_cache_ttl
+from app.utils.change_feed import RESET, hub
+from app.utils.metrics import Counter
+from app.utils.notifications import listener
+
+lookups_total = Counter(
+    "lookup_cache_requests_total", "Scanner lookups by cache result", ("result",)
+)
+
+Key = tuple[str, str]
+
+
+class LookupCache:
+    def __init__(self, size: int, ttl: float) -> None:
+        self.size = size
+        self.ttl = ttl
+        self._entries: OrderedDict[Key, tuple[float, dict[str, Any]]] = OrderedDict()
+        self._keys_by_id: dict[int, set[Key]] = {}
+        # Bumped by every invalidation, a load that raced one is not cached
+        self.generation = 0
+
+    def get(self, field: str, value: str) -> dict[str, Any] | None:
+        key = (field, value)
+        entry = self._entries.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            if entry is not None:
+                self._remove(key)
+            lookups_total.inc("miss")
+            return None
+        self._entries.move_to_end(key)
+        lookups_total.inc("hit")
+        return entry[1]
+
+    def put(self, field: str, value: str, row: dict[str, Any], generation: int) -> None:
+        """Cache a row loaded when `generation` was current, rows must not be modified"""
+        if generation != self.generation:
+            return
+        # Entries are only dropped on writes while the feed is received
+        listener.ensure_running()
+        key = (field, value)
+        self._entries[key] = (time.monotonic() + self.ttl, row)
+        self._entries.move_to_end(key)
+        self._keys_by_id.setdefault(row["id"], set()).add(key)
+        while len(self._entries) > self.size:
+            self._remove(next(iter(self._entries)))
+
+    def _remove(self, key: Key) -> None:
+        _, row = self._entries.pop(key)
+        keys = self._keys_by_id.get(row["id"])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._keys_by_id[row["id"]]
+
+    def drop_item(self, item_id: int) -> None:
+        self.generation += 1
+        for key in self._keys_by_id.pop(item_id, ()):
+            self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        self.generation += 1
+        self._entries.clear()
+        self._keys_by_id.clear()
+
+    def on_change(self, event: dict[str, Any]) -> None:
+        if event is RESET or event["action"] == "import":
+            self.clear()
+        elif event["entity"] == "equipment":
+            self.drop_item(event["id"])
+
+
+lookup_cache = LookupCache(lookup_cache_size, lookup_cache_ttl)
+hub.observers.append(lookup_cache.on_change)
@@ -0,0 +1,234 @@
+"""
+In-process metrics in the Prometheus text format
+
+Counters and histograms are plain Python numbers updated from the event loop
+thread, so no locks are needed. Histogram buckets are preallocated per label
+set and found with bisect. `MetricsMiddleware` is a pure ASGI middleware
+recording per-route latency, response sizes, in-flight requests and the DB
+queries made while handling each request; `/metrics` renders everything.
+"""
+import bisect
+import contextvars
+import time
+from contextlib import contextmanager
+from typing import Callable, Iterator
+
+# Seconds, for request latency, DB time and auth verification
+LATENCY_BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: tuple[str, ...], values: tuple[str, ...], **extra: str) -> str:
+    pairs = [*zip(names, values), *extra.items()]
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class Metric:
+    type = ""
+
+    def __init__(self, name: str, documentation: str, labels: tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        registry.append(self)
+
+    def header(self) -> list[str]:
+        return [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.type}",
+        ]
+
+    def render(self) -> list[str]:
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def __init__(self, name: str, documentation: str, labels: tuple[str, ...] = ()):
+        super().__init__(name, documentation, labels)
+        self.values: dict[tuple[str, ...], float] = {}
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def render(self) -> list[str]:
+        return self.header() + [
+            f"{self.name}{_format_labels(self.labels, labels)} {_format_value(value)}"
+            for labels, value in self.values.items()
+        ]
+
+
+class Gauge(Counter):
+    type = "gauge"
+
+    def dec(self, *labels: str, amount: float = 1) -> None:
+        self.values[labels] = self.values.get(labels, 0) - amount
+
+    def set(self, value: float, *labels: str) -> None:
+        self.values[labels] = value
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labels: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = LATENCY_BUCKETS,
+    ):
+        super().__init__(name, documentation, labels)
+        self.buckets = buckets
+        # Label values -> [per bucket counts..., +Inf count, sum]
+        self.values: dict[tuple[str, ...], list[float]] = {}
+
+    def observe(self, value: float, *labels: str) -> None:
+        counts = self.values.get(labels)
+        if counts is None:
+            counts = self.values[labels] = [0] * (len(self.buckets) + 2)
+        counts[bisect.bisect_left(self.buckets, value)] += 1
+        counts[-1] += value
+
+    def render(self) -> list[str]:
+        lines = self.header()
+        bounds = (*map(_format_value, self.buckets), "+Inf")
+        for labels, counts in self.values.items():
+            total = 0
+            for bound, count in zip(bounds, counts):
+                total += count
+                lines.append(
+                    f"{self.name}_bucket{_format_labels(self.labels, labels, le=bound)} {total}"
+                )
+            label_text = _format_labels(self.labels, labels)
+            lines.append(f"{self.name}_sum{label_text} {_format_value(counts[-1])}")
+            lines.append(f"{self.name}_count{label_text} {total}")
+        return lines
+
+
+registry: list[Metric] = []
+# Called before rendering to refresh gauges read from elsewhere (e.g. pools)
+collectors: list[Callable[[], None]] = []
+
+requests_total = Counter(
+    "http_requests_total", "HTTP requests handled", ("method", "route", "status")
+)
+request_duration = Histogram(
+    "http_request_duration_seconds", "HTTP request latency", ("method", "route")
+)
+requests_in_flight = Gauge("http_requests_in_flight", "HTTP requests being handled")
+response_size = Histogram(
+    "http_response_size_bytes", "HTTP response body size", ("method", "route"), SIZE_BUCKETS
+)
+request_db_queries = Histogram(
+    "http_request_db_queries", "Database queries per HTTP request", ("method", "route"),
+    COUNT_BUCKETS,
+)
+request_db_duration = Histogram(
+    "http_request_db_duration_seconds", "Database time per HTTP request", ("method", "route")
+)
+auth_duration = Histogram(
+    "auth_token_verification_duration_seconds",
+    "Time spent verifying access tokens",
+    ("method",),
+)
+
+
+class RequestStats:
+    """Database work of one request, shared by the tasks it spawns"""
+
+    __slots__ = ("queries", "db_time")
+
+    def __init__(self) -> None:
+        self.queries = 0
+        self.db_time = 0.0
+
+
+_request_stats: contextvars.ContextVar[RequestStats | None] = contextvars.ContextVar(
+    "request_stats", default=None
+)
+
+
+@contextmanager
+def observe_query() -> Iterator[None]:
+    """Count a database query and its duration towards the current request"""
+    stats = _request_stats.get()
+    if stats is None:
+        yield
+        return
+
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        stats.queries += 1
+        stats.db_time += time.perf_counter() - start
+
+
+class MetricsMiddleware:
+    """Pure ASGI middleware, cheaper than BaseHTTPMiddleware on the hot path"""
+
+    def __init__(self, app) -> None:
+        self.app = app
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+        size = 0
+
+        async def send_wrapper(message) -> None:
+            nonlocal status, size
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            elif message["type"] == "http.response.body":
+                size += len(message.get("body", b""))
+            await send(message)
+
+        stats = RequestStats()
+        token = _request_stats.set(stats)
+        requests_in_flight.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            duration = time.perf_counter() - start
+            requests_in_flight.dec()
+            _request_stats.reset(token)
+
+            # Route templates keep the label cardinality bounded
+            route = scope.get("route")
+            path = getattr(route, "path", "unmatched")
+            method = scope["method"]
+            requests_total.inc(method, path, str(status))
+            request_duration.observe(duration, method, path)
+            response_size.observe(size, method, path)
+            request_db_queries.observe(stats.queries, method, path)
+            request_db_duration.observe(stats.db_time, method, path)
+
+
+def render_metrics() -> str:
+    for collect in collectors:
+        collect()
+    lines = []
+    for metric in registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
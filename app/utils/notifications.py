@@ -0,0 +1,170 @@
+"""
+Postgres LISTEN/NOTIFY shared by the workers
+
+`notify` sends a payload on a channel, on the connection of the write when
+given so the notification is delivered on commit. Each worker has one
+dedicated listening connection for all channels, see `NotificationListener`;
+it is started by the first feature that needs it. Nothing is sent or
+received when the primary database is not Postgres.
+"""
+import asyncio
+from typing import Callable
+
+import asyncpg
+from tortoise import connections
+from tortoise.backends.asyncpg import AsyncpgDBClient
+from tortoise.backends.base.client import BaseDBAsyncClient
+
+from app.settings import logger
+
+# Seconds between checks that the listening connection is still alive
+KEEPALIVE_INTERVAL = 30.0
+MAX_RECONNECT_DELAY = 30.0
+# NOTIFY rejects payloads of 8000 bytes and more
+MAX_PAYLOAD_BYTES = 7999
+
+
+def primary() -> BaseDBAsyncClient | None:
+    """The default connection when it is Postgres"""
+    try:
+        client = connections.get("default")
+    except Exception:
+        # Tortoise is not initialised, e.g. in scripts importing the app
+        return None
+    return client if client.capabilities.dialect == "postgres" else None
+
+
+async def notify(
+    channel: str, payload: str, using_db: BaseDBAsyncClient | None = None
+) -> bool:
+    """Send a notification, False when it could not be sent"""
+    client = using_db if using_db is not None else primary()
+    if client is None or client.capabilities.dialect != "postgres":
+        return False
+    if len(payload.encode()) > MAX_PAYLOAD_BYTES:
+        logger.warning(f"Not notifying {channel}, payload of {len(payload)} characters")
+        return False
+    try:
+        await client.execute_query("SELECT pg_notify($1, $2)", [channel, payload])
+    except Exception as e:
+        # Not worth failing the write for, listeners have their own fallbacks
+        logger.warning(f"Could not notify {channel}: {e}")
+        return False
+    return True
+
+
+async def notify_many(
+    channel: str, payloads: list[str], using_db: BaseDBAsyncClient | None = None
+) -> bool:
+    """Send several notifications in one statement, e.g. for batch writes"""
+    client = using_db if using_db is not None else primary()
+    if client is None or client.capabilities.dialect != "postgres":
+        return False
+    sendable = [payload for payload in payloads if len(payload.encode()) <= MAX_PAYLOAD_BYTES]
+    if len(sendable) < len(payloads):
+        skipped = len(payloads) - len(sendable)
+        logger.warning(f"Not notifying {channel} of {skipped} oversized payloads")
+    try:
+        await client.execute_query(
+            "SELECT pg_notify($1, payload) FROM unnest($2::text[]) AS payload",
+            [channel, sendable],
+        )
+    except Exception as e:
+        logger.warning(f"Could not notify {channel}: {e}")
+        return False
+    return True
+
+
+class NotificationListener:
+    """
+    Background task listening on its own connection
+
+    Channels are registered at import time with `listen`. `on_connect` is
+    called after every (re)connect: notifications may have been missed while
+    the connection was down.
+    """
+
+    def __init__(self) -> None:
+        self._channels: dict[str, tuple[Callable[[str], None], Callable[[], None] | None]] = {}
+        self._task: asyncio.Task | None = None
+        # Set while the connection is up and listening on every channel
+        self.connected = asyncio.Event()
+
+    def listen(
+        self,
+        channel: str,
+        callback: Callable[[str], None],
+        on_connect: Callable[[], None] | None = None,
+    ) -> None:
+        self._channels[channel] = (callback, on_connect)
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def ensure_running(self) -> bool:
+        """Start listening unless already running, False when not possible"""
+        if self.running:
+            return True
+        client = primary()
+        if not isinstance(client, AsyncpgDBClient):
+            return False
+        self._task = asyncio.create_task(self._run(client))
+        return True
+
+    def _dispatch(
+        self, connection: asyncpg.Connection, pid: int, channel: str, payload: str
+    ) -> None:
+        callback, _ = self._channels[channel]
+        try:
+            callback(payload)
+        except Exception:
+            logger.exception(f"Handling a notification on {channel} failed")
+
+    async def _listen(self, client: AsyncpgDBClient) -> None:
+        connection = await asyncpg.connect(
+            host=client.host,
+            port=client.port,
+            user=client.user,
+            password=client.password,
+            database=client.database,
+            server_settings=client.server_settings,
+            ssl=client.extra.get("ssl"),
+        )
+        lost = asyncio.Event()
+        connection.add_termination_listener(lambda _: lost.set())
+        try:
+            for channel in self._channels:
+                await connection.add_listener(channel, self._dispatch)
+            self.connected.set()
+            for _, on_connect in self._channels.values():
+                if on_connect is not None:
+                    on_connect()
+            logger.info(f"Listening for notifications on {', '.join(self._channels)}")
+            while not lost.is_set():
+                try:
+                    await asyncio.wait_for(lost.wait(), KEEPALIVE_INTERVAL)
+                except asyncio.TimeoutError:
+                    # Notices a dead connection the socket did not report
+                    await connection.execute("SELECT 1", timeout=KEEPALIVE_INTERVAL)
+        finally:
+            self.connected.clear()
+            if not connection.is_closed():
+                connection.terminate()
+
+    async def _run(self, client: AsyncpgDBClient) -> None:
+        delay = 1.0
+        while True:
+            try:
+                await self._listen(client)
+                delay = 1.0
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Notification listener failed: {e}")
+            logger.warning(f"Notification listener reconnecting in {delay:.0f}s")
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, MAX_RECONNECT_DELAY)
+
+
+listener = NotificationListener()
@@ -0,0 +1,141 @@
+"""
+Request-level query profiler
+
+Every statement goes through `track_query` (see the instrumented client in
+app.utils.db_pool). Statements slower than `slow_query_ms` are always logged.
+Admins can profile a single request by sending the `X-Query-Profile` header:
+all statements of that request are then recorded with their timing, repeated
+query shapes (N+1 patterns) are reported, and slow SELECTs are logged with
+their `EXPLAIN (ANALYZE, BUFFERS)` plan. EXPLAIN ANALYZE runs the query a
+second time, which is why it is limited to profiled requests.
+"""
+import contextvars
+import re
+import time
+from collections import Counter
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator
+
+from fastapi import HTTPException, Request
+
+from app.dependencies import get_current_user
+from app.settings import logger, n_plus_one_threshold, slow_query_ms
+from app.utils.metrics import observe_query
+
+PROFILE_HEADER = "x-query-profile"
+
+# Literals and placeholders are replaced so repeated statements share a shape
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\$\d+|\b\d+(?:\.\d+)?\b")
+_VALUE_LISTS = re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)")
+
+
+def query_shape(query: str) -> str:
+    shape = _VALUE_LISTS.sub("(?)", _LITERALS.sub("?", query))
+    return " ".join(shape.split())
+
+
+def _is_plain_select(query: str) -> bool:
+    statement = query.lstrip().upper()
+    return statement.startswith("SELECT") and " FOR UPDATE" not in statement
+
+
+class QueryProfile:
+    """Statements issued while handling one request"""
+
+    def __init__(self) -> None:
+        self.queries: list[tuple[str, float]] = []
+
+    def record(self, query: str, duration: float) -> None:
+        self.queries.append((query, duration))
+
+    def repeated_shapes(self) -> list[tuple[str, int]]:
+        shapes = Counter(query_shape(query) for query, _ in self.queries)
+        return [
+            (shape, count)
+            for shape, count in shapes.most_common()
+            if count >= n_plus_one_threshold
+        ]
+
+    def report(self, name: str) -> str:
+        total = sum(duration for _, duration in self.queries)
+        lines = [f"Query profile of {name}: {len(self.queries)} queries in {total * 1000:.1f}ms"]
+        lines.extend(
+            f"  {duration * 1000:8.2f}ms  {' '.join(query.split())}"
+            for query, duration in self.queries
+        )
+        for shape, count in self.repeated_shapes():
+            lines.append(f"  Possible N+1, {count} queries of shape: {shape}")
+        return "\n".join(lines)
+
+
+_profile: contextvars.ContextVar[QueryProfile | None] = contextvars.ContextVar(
+    "query_profile", default=None
+)
+
+
+async def _explain(client: Any, query: str, values: list | None) -> str:
+    # Not recorded itself, the profile is hidden while explaining
+    token = _profile.set(None)
+    try:
+        rows = await client.execute_query_dict(
+            f"EXPLAIN (ANALYZE, BUFFERS) {query}", values
+        )
+    except Exception as e:
+        return f"EXPLAIN failed: {e}"
+    finally:
+        _profile.reset(token)
+    return "\n".join(row["QUERY PLAN"] for row in rows)
+
+
+@asynccontextmanager
+async def track_query(client: Any, query: str, values: list | None) -> AsyncIterator[None]:
+    """Time a statement for the request metrics, the slow log and the profile"""
+    start = time.perf_counter()
+    with observe_query():
+        yield
+    duration = time.perf_counter() - start
+
+    profile = _profile.get()
+    if profile is not None:
+        profile.record(query, duration)
+
+    if duration * 1000 < slow_query_ms:
+        return
+
+    message = f"Slow query ({duration * 1000:.1f}ms): {' '.join(query.split())}"
+    if (
+        profile is not None
+        and client.capabilities.dialect == "postgres"
+        and _is_plain_select(query)
+    ):
+        message += "\n" + await _explain(client, query, values)
+    logger.warning(message)
+
+
+async def query_profiling(request: Request) -> AsyncIterator[None]:
+    """
+    App-wide dependency profiling requests of admins that ask for it
+
+    The header is ignored for anyone else, so profiling cannot be used to slow
+    the service down.
+    """
+    if PROFILE_HEADER not in request.headers:
+        yield
+        return
+
+    scheme, _, token = request.headers.get("authorization", "").partition(" ")
+    try:
+        user = await get_current_user()(token) if scheme.lower() == "bearer" else None
+    except HTTPException:
+        user = None
+    if user is None or user.role_name != "admin":
+        yield
+        return
+
+    profile = QueryProfile()
+    _profile.set(profile)
+    try:
+        yield
+    finally:
+        _profile.set(None)
+        logger.info(profile.report(f"{request.method} {request.url.path}"))
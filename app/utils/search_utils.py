@@ -6,13 +6,14 @@ from tortoise.functions import Count
 
 from app.models import Equipment, EquipmentType, Location
 from app.crud import EquipmentCRUD
+from app.utils.dimension_cache import equipment_types
 
 
 async def populate_search_vectors() -> dict[str, object]:
     """
     Populate search vectors for all existing equipment
     """
-    equipments = await Equipment.all().prefetch_related('type', 'location')
+    equipments = await Equipment.all().select_related('type', 'location')
     updated_count = 0
     
     for equipment in equipments:
@@ -65,7 +66,7 @@ async def get_search_analytics() -> dict[str, object]:
     """
     Get analytics about search usage and equipment distribution
     """
-    # Equipment counts by status
+    # Equipment counts by status, off the small status index
     status_counts = await Equipment.all().annotate(
         count=Count("id")
     ).group_by("status").values("status", "count")
@@ -86,13 +87,15 @@ async def get_search_analytics() -> dict[str, object]:
         ).count()
         condition_stats[label] = count
     
-    # Equipment types distribution - simplified approach
-    all_equipment = await Equipment.all().prefetch_related('type')
-    type_stats = {}
-    for equipment in all_equipment:
-        if equipment.type:
-            type_name = equipment.type.name
-            type_stats[type_name] = type_stats.get(type_name, 0) + 1
+    # Equipment types distribution, names come from the dimension cache
+    type_counts = await Equipment.all().annotate(
+        count=Count("id")
+    ).group_by("type_id").values("type_id", "count")
+    types = await equipment_types.get_many(item["type_id"] for item in type_counts)
+    type_stats: dict[str, int] = {}
+    for item in type_counts:
+        type_name = types[item["type_id"]]["name"] if item["type_id"] in types else "unknown"
+        type_stats[type_name] = type_stats.get(type_name, 0) + item["count"]
     
     return {
         "status_distribution": {item["status"]: item["count"] for item in status_counts},
@@ -0,0 +1,130 @@
+"""
+Fast serialization helpers for equipment reads
+
+Rows are loaded with `.values()`, type and location are attached from the
+dimension cache by id, and the result is encoded straight to JSON bytes,
+skipping Tortoise model instances and pydantic validation on the hot read paths.
+"""
+from typing import Any, Iterable, Mapping
+
+import orjson
+from fastapi import Response
+
+EQUIPMENT_COLUMNS = (
+    "id",
+    "created_at",
+    "updated_at",
+    "name",
+    "serial_number",
+    "status",
+    "condition",
+    "photo_url",
+    "qr_code_data",
+    "metadata",
+    "search_vector",
+)
+TYPE_COLUMNS = ("id", "created_at", "updated_at", "name")
+LOCATION_COLUMNS = ("id", "created_at", "updated_at", "name", "description", "parent_id")
+
+RELATED_COLUMNS = {
+    "type": TYPE_COLUMNS,
+    "location": LOCATION_COLUMNS,
+}
+
+EQUIPMENT_VALUES = EQUIPMENT_COLUMNS + tuple(
+    f"{relation}_id" for relation in RELATED_COLUMNS
+)
+
+EQUIPMENT_FIELDS = EQUIPMENT_COLUMNS + tuple(RELATED_COLUMNS)
+
+# Slim rows for scanner lookups, type and location are reduced to id and name
+LOOKUP_COLUMNS = (
+    "id",
+    "updated_at",
+    "name",
+    "serial_number",
+    "status",
+    "condition",
+    "qr_code_data",
+    "type_id",
+    "location_id",
+)
+
+
+def parse_fields(value: str | list[str] | None) -> tuple[str, ...] | None:
+    """
+    Parse a sparse fieldset, either "id,name,status" or a list of names
+
+    "id" is always included. Raises ValueError on unknown field names.
+    """
+    if not value:
+        return None
+
+    names = value.split(",") if isinstance(value, str) else value
+    fields = {name.strip() for name in names if name.strip()}
+    unknown = fields.difference(EQUIPMENT_FIELDS)
+    if unknown:
+        raise ValueError(
+            f"Unknown fields: {', '.join(sorted(unknown))}. "
+            f"Available fields: {', '.join(EQUIPMENT_FIELDS)}"
+        )
+
+    fields.add("id")
+    # Keep the schema order so projected rows look like full ones
+    return tuple(field for field in EQUIPMENT_FIELDS if field in fields)
+
+
+def equipment_values(fields: tuple[str, ...] | None = None) -> tuple[str, ...]:
+    """
+    Columns to pass to `.values()` for a sparse fieldset
+
+    Relations are selected as their foreign key column, see hydrate_related.
+    """
+    if fields is None:
+        return EQUIPMENT_VALUES
+
+    return tuple(
+        f"{field}_id" if field in RELATED_COLUMNS else field for field in fields
+    )
+
+
+def hydrate_related(
+    rows: Iterable[dict[str, Any]], related: Mapping[str, Mapping[int, dict[str, Any]]]
+) -> list[dict[str, Any]]:
+    """
+    Replace foreign key columns with the related rows, in place
+
+    `{"type_id": 1}` becomes `{"type": {"id": 1, "name": "Laptop", ...}}`,
+    matching EquipmentSearchSchema. `related` maps relation names to rows by id.
+    """
+    results = []
+    for row in rows:
+        for relation, related_rows in related.items():
+            key = f"{relation}_id"
+            if key in row:
+                row[relation] = related_rows.get(row.pop(key))
+        results.append(row)
+    return results
+
+
+def related_ids(rows: Iterable[dict[str, Any]], relation: str) -> set[int]:
+    """Foreign key values of a relation present in the rows"""
+    key = f"{relation}_id"
+    return {row[key] for row in rows if row.get(key) is not None}
+
+
+def dumps(content: Any) -> bytes:
+    """Encode content to JSON bytes, datetimes in the same format as pydantic."""
+    return orjson.dumps(content, option=orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS)
+
+
+def json_response(
+    content: Any, status_code: int = 200, headers: Mapping[str, str] | None = None
+) -> Response:
+    """Build a pre-rendered JSON response, bypassing response_model validation."""
+    return Response(
+        content=dumps(content),
+        status_code=status_code,
+        headers=headers,
+        media_type="application/json",
+    )
@@ -0,0 +1,230 @@
+"""
+Point-in-time inventory snapshots and as-of queries
+
+A snapshot copies the id, name, serial number, status, condition, type and
+location of every item into `snapshot_items` with one INSERT ... SELECT. An
+as-of query starts from the latest snapshot taken before the requested time
+and replays only the history written since, so its cost is bounded by the
+snapshot interval and not by the length of the audit trail:
+
+- snapshot rows of the requested locations, plus those of the items changed
+  since the snapshot, are updated with the `new` state of each history entry;
+- items created since the snapshot start from their state at creation (the
+  `old` state of their first history entry, or their current row, or for
+  those deleted since, the state kept by their tombstone);
+- items deleted since the snapshot are dropped using the tombstones.
+
+History entries (written by patches, scans and bulk imports) are written
+with the time their transaction started, so replay begins
+`sync_settle_seconds` before the snapshot; entries already in it are
+applied again, which changes nothing.
+
+The history of an item is deleted with it, so the changes made to a deleted
+item after the last snapshot before its deletion can't be replayed: the
+snapshot state is returned for it until its deletion, or the state it was
+deleted in when it was created after that snapshot.
+
+Snapshots are taken every `snapshot_interval_hours` by a background task of
+whichever worker gets the lock first, and require Postgres.
+"""
+import asyncio
+import json
+from datetime import datetime, timedelta, timezone
+from typing import Any, Iterable
+
+from tortoise.expressions import Q
+from tortoise.transactions import in_transaction
+
+from app.models import (
+    Equipment,
+    EquipmentHistoryEntry,
+    InventorySnapshot,
+    SnapshotItem,
+    Tombstone,
+)
+from app.settings import (
+    logger,
+    snapshot_interval_hours,
+    snapshot_retention_days,
+    sync_settle_seconds,
+)
+from app.utils.notifications import primary
+
+# Columns of a snapshot item, and of the rows returned by as-of queries
+STATE_COLUMNS = ("name", "serial_number", "status", "condition", "type_id", "location_id")
+# Seconds between checks whether a snapshot is due
+CHECK_INTERVAL = 300.0
+LOCK_NAME = "inventory_snapshots"
+
+_scheduler_task: asyncio.Task | None = None
+
+
+async def take_snapshot(force: bool = True) -> InventorySnapshot | None:
+    """
+    Copy the inventory into a new snapshot, None if another worker is taking one
+
+    Without `force` nothing is taken unless the last snapshot is older than
+    the snapshot interval. Snapshots past the retention are deleted.
+    """
+    async with in_transaction() as connection:
+        _, rows = await connection.execute_query(
+            "SELECT pg_try_advisory_xact_lock(hashtext($1)) AS locked", [LOCK_NAME]
+        )
+        if not rows[0]["locked"]:
+            return None
+
+        now = datetime.now(timezone.utc)
+        if not force:
+            latest = await InventorySnapshot.all().using_db(connection).order_by(
+                "-taken_at"
+            ).first()
+            if latest is not None and now - latest.taken_at < timedelta(
+                hours=snapshot_interval_hours
+            ):
+                return None
+
+        snapshot = await InventorySnapshot.create(taken_at=now, using_db=connection)
+        columns = ", ".join(f'"{column}"' for column in STATE_COLUMNS)
+        # Snapshots keep status names, like the history replayed over them
+        selected = ", ".join(
+            's."name"' if column == "status" else f'e."{column}"' for column in STATE_COLUMNS
+        )
+        _, rows = await connection.execute_query(
+            f'WITH "copied" AS (INSERT INTO "snapshot_items" ("snapshot_id", "equipment_id", '
+            f'{columns}) SELECT $1, e."id", {selected} FROM "equipments" AS e '
+            f'JOIN "equipment_statuses" AS s ON s."id" = e."status" RETURNING 1) '
+            f'SELECT count(*) AS "count" FROM "copied"',
+            [snapshot.id],
+        )
+        snapshot.item_count = rows[0]["count"]
+        await snapshot.save(update_fields=["item_count"], using_db=connection)
+
+        # Never the one just taken, the retention is days
+        expired = await InventorySnapshot.filter(
+            taken_at__lt=now - timedelta(days=snapshot_retention_days)
+        ).using_db(connection).delete()
+
+    logger.info(
+        f"Took inventory snapshot {snapshot.id} of {snapshot.item_count} items"
+        + (f", deleted {expired} expired ones" if expired else "")
+    )
+    return snapshot
+
+
+async def _scheduler() -> None:
+    while True:
+        try:
+            await take_snapshot(force=False)
+        except Exception:
+            logger.exception("Could not take an inventory snapshot")
+        await asyncio.sleep(CHECK_INTERVAL)
+
+
+def ensure_scheduler() -> None:
+    """Start the periodic snapshots in this worker, called at application startup"""
+    global _scheduler_task
+
+    if snapshot_interval_hours <= 0 or primary() is None:
+        return
+    if _scheduler_task is None or _scheduler_task.done():
+        _scheduler_task = asyncio.create_task(_scheduler())
+
+
+def _history_state(value: Any) -> dict[str, Any]:
+    """Snapshot columns of the old or new state of a history entry"""
+    # Written as JSON text by audit_save and apply_scans, bulk imports write
+    # type_id and location_id instead of nested rows
+    if isinstance(value, str):
+        value = json.loads(value)
+    state = {column: value.get(column) for column in STATE_COLUMNS[:4]}
+    for relation in ("type", "location"):
+        related = value.get(relation)
+        state[f"{relation}_id"] = (
+            related["id"] if isinstance(related, dict) else value.get(f"{relation}_id")
+        )
+    return state
+
+
+async def inventory_as_of(
+    at: datetime, location_ids: Iterable[int] | None = None
+) -> dict[str, Any] | None:
+    """
+    Items and their state at `at`, optionally only those in `location_ids`
+
+    None when no snapshot was taken before `at`.
+    """
+    db = Equipment._meta.db
+    snapshot = await InventorySnapshot.filter(taken_at__lte=at).using_db(db).order_by(
+        "-taken_at"
+    ).first()
+    if snapshot is None:
+        return None
+    replay_from = snapshot.taken_at - timedelta(seconds=sync_settle_seconds)
+    location_ids = frozenset(location_ids) if location_ids is not None else None
+
+    history = await EquipmentHistoryEntry.filter(
+        created_at__gt=replay_from, created_at__lte=at
+    ).using_db(db).order_by("created_at", "id").values_list("equipment_id", "new")
+    changed = {equipment_id for equipment_id, _ in history}
+
+    base = SnapshotItem.filter(snapshot_id=snapshot.id).using_db(db)
+    if location_ids is not None:
+        base = base.filter(Q(location_id__in=location_ids) | Q(equipment_id__in=changed))
+    states: dict[int, dict[str, Any]] = {}
+    for row in await base.values("equipment_id", *STATE_COLUMNS):
+        states[row.pop("equipment_id")] = row
+
+    # Items created since the snapshot, as they were created
+    created = {
+        row.pop("id"): row
+        for row in await Equipment.filter(
+            created_at__gt=replay_from, created_at__lte=at
+        ).using_db(db).values("id", *STATE_COLUMNS)
+    }
+    # Or deleted since `at`, their history went with them
+    for row in await Tombstone.filter(
+        entity="equipment", created_at__gt=replay_from, created_at__lte=at, deleted_at__gt=at
+    ).using_db(db).values("entity_id", "state"):
+        created[row["entity_id"]] = _history_state(row["state"])
+    for equipment_id in states:
+        created.pop(equipment_id, None)
+    if created:
+        in_snapshot = await SnapshotItem.filter(
+            snapshot_id=snapshot.id, equipment_id__in=created
+        ).using_db(db).values_list("equipment_id", flat=True)
+        for equipment_id in in_snapshot:
+            del created[equipment_id]
+    if created:
+        # The old state of the first change of an item is its state at creation
+        changes = await EquipmentHistoryEntry.filter(
+            equipment_id__in=created
+        ).using_db(db).order_by("equipment_id", "created_at", "id").values_list(
+            "equipment_id", "old"
+        )
+        first_seen = set()
+        for equipment_id, old in changes:
+            if equipment_id not in first_seen:
+                first_seen.add(equipment_id)
+                created[equipment_id] = _history_state(old)
+        states.update(created)
+
+    for equipment_id, new in history:
+        states.setdefault(equipment_id, {}).update(_history_state(new))
+
+    deleted = await Tombstone.filter(
+        entity="equipment", deleted_at__gt=replay_from, deleted_at__lte=at
+    ).using_db(db).values_list("entity_id", flat=True)
+    for equipment_id in deleted:
+        states.pop(equipment_id, None)
+
+    items = [
+        {"id": equipment_id, **{column: row.get(column) for column in STATE_COLUMNS}}
+        for equipment_id, row in sorted(states.items())
+        if location_ids is None or row.get("location_id") in location_ids
+    ]
+    return {
+        "at": at,
+        "snapshot": {"id": snapshot.id, "taken_at": snapshot.taken_at},
+        "replayed": len(history),
+        "items": items,
+    }
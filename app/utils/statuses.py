@@ -0,0 +1,113 @@
+"""
+Vocabulary of equipment statuses
+
+Statuses are stored as SMALLINT codes of the `equipment_statuses` table and
+used as their names everywhere else: `StatusField` converts between the two
+whenever an item is saved, filtered or loaded, so the API, history, change
+events and scans keep working with status strings. A name that is not in the
+vocabulary is rejected with a ValidationError (400); admins add statuses with
+POST /statuses.
+
+Every worker keeps the vocabulary in memory. It is loaded before the first
+request (`ensure_loaded` is an application dependency, see main.py) and
+reloaded after `dimension_cache_ttl` seconds or when a status is added, in
+every worker through app.utils.invalidation. Unlike the dimension caches the
+previous vocabulary keeps being served until the reload, as conversions can't
+wait for a query.
+"""
+import asyncio
+import time
+from types import MappingProxyType
+from typing import Any, Mapping
+
+from tortoise import connections, fields
+from tortoise.backends.base.client import BaseDBAsyncClient
+from tortoise.exceptions import ValidationError
+from tortoise.models import Model
+
+from app.settings import dimension_cache_ttl, logger
+from app.utils import invalidation
+
+NAME = "equipment_statuses"
+
+# Codes seeded by the migration; the hot statuses have partial indexes
+AVAILABLE = 1
+IN_REPAIR = 3
+
+
+class StatusVocabulary:
+    """Status name <-> code, replaced as a whole on every load"""
+
+    def __init__(self, ttl: float) -> None:
+        self.ttl = ttl
+        self.codes: Mapping[str, int] = MappingProxyType({})
+        self.names: Mapping[int, str] = MappingProxyType({})
+        self._loaded_at = 0.0
+        self._lock = asyncio.Lock()
+        invalidation.register(NAME, self.invalidate)
+
+    async def load(self, db: BaseDBAsyncClient | None = None) -> None:
+        """Load the vocabulary, from the primary by default"""
+        async with self._lock:
+            loaded_at = time.monotonic()
+            rows = await (db or connections.get("default")).execute_query_dict(
+                'SELECT "id", "name" FROM "equipment_statuses" ORDER BY "id"'
+            )
+            self.codes = MappingProxyType({row["name"]: row["id"] for row in rows})
+            self.names = MappingProxyType({row["id"]: row["name"] for row in rows})
+            self._loaded_at = loaded_at
+
+    async def ensure_loaded(self) -> None:
+        """Application dependency, loads the vocabulary when missing or stale"""
+        if time.monotonic() - self._loaded_at < self.ttl:
+            return
+        invalidation.listener.ensure_running()
+        await self.load()
+
+    def invalidate(self) -> None:
+        # Reloaded by the next request, the current mappings stay in use until then
+        self._loaded_at = 0.0
+
+    def code(self, name: str) -> int:
+        try:
+            return self.codes[name]
+        except KeyError:
+            raise ValidationError(f"status: unknown status {name!r}") from None
+
+    def name(self, code: int) -> str:
+        name = self.names.get(code)
+        if name is None:
+            # Added by another worker since our last load
+            logger.warning(f"Unknown status code {code}, reloading the vocabulary")
+            self.invalidate()
+            return str(code)
+        return name
+
+    def matching(self, text: str) -> list[int]:
+        """Codes of the statuses whose name contains `text`, ignoring case"""
+        text = text.lower()
+        return [code for name, code in self.codes.items() if text in name.lower()]
+
+
+vocabulary = StatusVocabulary(dimension_cache_ttl)
+
+
+class StatusField(fields.CharField):
+    """A status name in Python, its code in the database"""
+
+    SQL_TYPE = "SMALLINT"  # type: ignore
+
+    def __init__(self, **kwargs: Any) -> None:
+        super().__init__(max_length=50, **kwargs)
+
+    def to_db_value(self, value: Any, instance: type[Model] | Model) -> int | None:
+        if isinstance(value, int):
+            # Already a code, e.g. from StatusVocabulary.matching
+            return value
+        value = super().to_db_value(value, instance)
+        return None if value is None else vocabulary.code(value)
+
+    def to_python_value(self, value: Any) -> str | None:
+        if isinstance(value, int):
+            return vocabulary.name(value)
+        return value
@@ -0,0 +1,118 @@
+"""
+Delta sync for offline clients
+
+A sync cursor holds two watermarks: (updated_at, id) of the last equipment
+row and (deleted_at, id) of the last tombstone the client has seen. A page
+returns the rows and tombstones after them in watermark order, read from the
+(updated_at, id) and (deleted_at, id) indexes, so the cost depends on the
+number of changes and not on the size of the inventory.
+
+Timestamps are taken when a transaction starts, so a transaction committing
+after a page was read can still add rows behind its watermark. The final
+cursor of a sync is therefore kept `sync_settle_seconds` behind the present:
+the next sync sends those last seconds again. Clients apply rows as upserts
+and tombstones as deletes, so repeats are harmless.
+
+Reads always go to the primary, a lagging replica could let a cursor pass
+rows it has not replicated yet.
+"""
+import base64
+import binascii
+import json
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Any
+
+from tortoise.expressions import Q
+
+from app.models import Equipment, Tombstone
+from app.settings import sync_settle_seconds
+from app.utils.serialization import EQUIPMENT_VALUES
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+@dataclass(frozen=True, order=True)
+class Watermark:
+    at: datetime
+    id: int
+
+    def after(self, field: str) -> Q:
+        """Rows past this watermark, in a form the (field, id) index can serve"""
+        return Q(**{f"{field}__gte": self.at}) & (
+            Q(**{f"{field}__gt": self.at}) | Q(id__gt=self.id)
+        )
+
+
+@dataclass(frozen=True)
+class SyncCursor:
+    rows: Watermark
+    tombstones: Watermark
+
+    @classmethod
+    def start(cls) -> "SyncCursor":
+        return cls(Watermark(EPOCH, 0), Watermark(EPOCH, 0))
+
+    def encode(self) -> str:
+        data = [
+            [self.rows.at.isoformat(), self.rows.id],
+            [self.tombstones.at.isoformat(), self.tombstones.id],
+        ]
+        return base64.urlsafe_b64encode(json.dumps(data).encode()).decode().rstrip("=")
+
+    @classmethod
+    def decode(cls, value: str) -> "SyncCursor":
+        """Raises ValueError on anything but a cursor returned by `encode`"""
+        try:
+            data = json.loads(base64.urlsafe_b64decode(value + "=" * (-len(value) % 4)))
+            marks = [Watermark(datetime.fromisoformat(at), int(id_)) for at, id_ in data]
+        except (binascii.Error, TypeError, ValueError) as e:
+            raise ValueError("Invalid sync cursor") from e
+        if len(marks) != 2 or any(mark.at.tzinfo is None for mark in marks):
+            raise ValueError("Invalid sync cursor")
+        return cls(*marks)
+
+
+async def changes_since(cursor: SyncCursor, limit: int) -> dict[str, Any]:
+    """
+    One page of changes after `cursor`
+
+    Equipment rows keep their type_id and location_id, clients resolve them
+    with /types and /locations. Tombstones cover equipment, types and
+    locations.
+    """
+    db = Equipment._meta.db
+    rows = await Equipment.filter(cursor.rows.after("updated_at")).order_by(
+        "updated_at", "id"
+    ).limit(limit).using_db(db).values(*EQUIPMENT_VALUES)
+    tombstones = await Tombstone.filter(cursor.tombstones.after("deleted_at")).order_by(
+        "deleted_at", "id"
+    ).limit(limit).using_db(db).values("id", "entity", "entity_id", "deleted_at")
+
+    rows_mark = Watermark(rows[-1]["updated_at"], rows[-1]["id"]) if rows else cursor.rows
+    tombstones_mark = (
+        Watermark(tombstones[-1]["deleted_at"], tombstones[-1]["id"])
+        if tombstones
+        else cursor.tombstones
+    )
+    has_more = len(rows) == limit or len(tombstones) == limit
+    if not has_more:
+        settled = Watermark(
+            datetime.now(timezone.utc) - timedelta(seconds=sync_settle_seconds), 0
+        )
+        rows_mark = min(rows_mark, settled)
+        tombstones_mark = min(tombstones_mark, settled)
+
+    return {
+        "equipment": rows,
+        "deleted": [
+            {
+                "entity": tombstone["entity"],
+                "id": tombstone["entity_id"],
+                "deleted_at": tombstone["deleted_at"],
+            }
+            for tombstone in tombstones
+        ],
+        "cursor": SyncCursor(rows_mark, tombstones_mark).encode(),
+        "has_more": has_more,
+    }
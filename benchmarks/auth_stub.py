@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+Stub of the USERSMS introspect and roles endpoints for benchmarks
+
+Every token is active. Tokens starting with "admin" get the admin role, any
+other token the user role. An optional delay simulates the network hop to
+the real service. Point the app at it with USERSMS_URL:
+
+    python -m benchmarks.auth_stub --port 8100 --latency-ms 2
+    USERSMS_URL=http://127.0.0.1:8100 uvicorn main:application
+"""
+import argparse
+import asyncio
+import time
+
+import uvicorn
+from fastapi import FastAPI
+from pydantic import BaseModel
+
+ROLES = [
+    {"id": 1, "description": "admin"},
+    {"id": 2, "description": "user"},
+]
+
+app = FastAPI(title="USERSMS stub")
+latency = 0.0
+
+
+class IntrospectRequest(BaseModel):
+    token: str
+
+
+async def _delay() -> None:
+    if latency:
+        await asyncio.sleep(latency)
+
+
+@app.post("/introspect")
+async def introspect(request: IntrospectRequest) -> dict:
+    await _delay()
+    now = int(time.time())
+    return {
+        "active": True,
+        "payload": {
+            "sub": f"{request.token}@bench.local",
+            "role": 1 if request.token.startswith("admin") else 2,
+            "iat": now,
+            "exp": now + 3600,
+        },
+    }
+
+
+@app.get("/roles")
+async def roles() -> list[dict]:
+    await _delay()
+    return ROLES
+
+
+def main() -> None:
+    global latency
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--latency-ms", type=float, default=0, help="Delay per call")
+    args = parser.parse_args()
+
+    latency = args.latency_ms / 1000
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
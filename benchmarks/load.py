@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+"""
+Drive the API at a fixed concurrency and report latency percentiles
+
+Each scenario runs for a fixed duration with `--concurrency` workers sending
+requests back to back. Parameters (search terms, ids, offsets) are drawn
+from a seeded random generator, so runs against the same seeded database are
+comparable. The report is JSON on stdout (or `--output`), to diff before and
+after a change. Start the app against a seeded database and the auth stub:
+
+    python -m benchmarks.load --base-url http://127.0.0.1:8000 --duration 30 \\
+        --concurrency 32 --output before.json
+"""
+import argparse
+import asyncio
+import json
+import random
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Callable
+
+import httpx
+
+SEARCH_TERMS = (
+    "laptop", "monitor", "dell", "lenovo", "available", "maintenance", "hq",
+    "warehouse", "printer", "sn2019", "docking", "lab annex", "router", "floor 3",
+)
+
+Scenario = Callable[[httpx.AsyncClient, random.Random], Awaitable[httpx.Response]]
+
+
+class Inventory:
+    """Sizes of the seeded tables, read once before the run"""
+
+    equipment = 1
+    types = 1
+    locations = 1
+
+
+def search(client: httpx.AsyncClient, rng: random.Random) -> Awaitable[httpx.Response]:
+    return client.post(
+        "/inventory/search",
+        json={"query": rng.choice(SEARCH_TERMS), "limit": 50, "offset": rng.choice((0, 0, 50))},
+    )
+
+
+def quick_search(client: httpx.AsyncClient, rng: random.Random) -> Awaitable[httpx.Response]:
+    return client.get("/inventory/search/quick", params={"q": rng.choice(SEARCH_TERMS)})
+
+
+def suggestions(client: httpx.AsyncClient, rng: random.Random) -> Awaitable[httpx.Response]:
+    term = rng.choice(SEARCH_TERMS)
+    return client.get("/inventory/search/suggestions", params={"q": term[: rng.randint(2, 4)]})
+
+
+def analytics(client: httpx.AsyncClient, rng: random.Random) -> Awaitable[httpx.Response]:
+    return client.get("/inventory/search/analytics")
+
+
+def list_page(client: httpx.AsyncClient, rng: random.Random) -> Awaitable[httpx.Response]:
+    offset = rng.randrange(0, max(Inventory.equipment - 100, 1))
+    return client.get("/inventory/", params={"limit": 100, "offset": offset})
+
+
+def get_item(client: httpx.AsyncClient, rng: random.Random) -> Awaitable[httpx.Response]:
+    return client.get(f"/inventory/{rng.randint(1, Inventory.equipment)}")
+
+
+def patch(client: httpx.AsyncClient, rng: random.Random) -> Awaitable[httpx.Response]:
+    item_id = rng.randint(1, Inventory.equipment)
+    return client.patch(
+        f"/inventory/{item_id}/patch",
+        json={
+            "name": f"Bench item {item_id}",
+            "serial_number": f"BENCH{item_id:08d}",
+            "status": rng.choice(("available", "in_use", "maintenance")),
+            "condition": rng.randint(0, 10),
+            "type_id": rng.randint(1, Inventory.types),
+            "location_id": rng.randint(1, Inventory.locations),
+        },
+    )
+
+
+SCENARIOS: dict[str, Scenario] = {
+    "search": search,
+    "quick_search": quick_search,
+    "suggestions": suggestions,
+    "analytics": analytics,
+    "list": list_page,
+    "get": get_item,
+    "patch": patch,
+}
+
+
+def percentile(sorted_values: list[float], fraction: float) -> float:
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    index = max(0, min(len(sorted_values) - 1, round(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+async def run_scenario(
+    client: httpx.AsyncClient, scenario: Scenario, concurrency: int, duration: float, seed: int
+) -> dict[str, Any]:
+    latencies: list[float] = []
+    errors: dict[str, int] = {}
+    deadline = time.perf_counter() + duration
+
+    async def worker(worker_id: int) -> None:
+        rng = random.Random(seed * 1000 + worker_id)
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            try:
+                response = await scenario(client, rng)
+                outcome = None if response.status_code < 400 else str(response.status_code)
+            except httpx.HTTPError as e:
+                outcome = type(e).__name__
+            latencies.append(time.perf_counter() - start)
+            if outcome is not None:
+                errors[outcome] = errors.get(outcome, 0) + 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker(i) for i in range(concurrency)))
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "throughput_rps": round(len(latencies) / elapsed, 1),
+        "mean_ms": round(sum(latencies) / max(len(latencies), 1) * 1000, 2),
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 2),
+        "max_ms": round(latencies[-1] * 1000, 2) if latencies else 0.0,
+    }
+
+
+async def read_inventory_sizes(client: httpx.AsyncClient) -> None:
+    stats = (await client.get("/inventory/search/stats")).raise_for_status().json()
+    Inventory.equipment = max(stats["total_equipment"], 1)
+    Inventory.types = max(len((await client.get("/types/")).raise_for_status().json()), 1)
+    Inventory.locations = max(len((await client.get("/locations/")).raise_for_status().json()), 1)
+
+
+def git_revision() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def run(args: argparse.Namespace) -> dict[str, Any]:
+    async with httpx.AsyncClient(
+        base_url=args.base_url,
+        headers={"Authorization": f"Bearer {args.token}"},
+        limits=httpx.Limits(max_connections=args.concurrency),
+        timeout=args.timeout,
+    ) as client:
+        await read_inventory_sizes(client)
+        results = {}
+        for name in args.scenarios:
+            # Warm up caches and connections, not measured
+            await run_scenario(client, SCENARIOS[name], args.concurrency, args.warmup, args.seed)
+            results[name] = await run_scenario(
+                client, SCENARIOS[name], args.concurrency, args.duration, args.seed
+            )
+            print(f"{name}: {results[name]}", file=sys.stderr)
+
+    return {
+        "finished_at": datetime.now(timezone.utc).isoformat(),
+        "revision": git_revision(),
+        "base_url": args.base_url,
+        "concurrency": args.concurrency,
+        "duration_s": args.duration,
+        "seed": args.seed,
+        "inventory": {
+            "equipment": Inventory.equipment,
+            "types": Inventory.types,
+            "locations": Inventory.locations,
+        },
+        "scenarios": results,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+    parser.add_argument("--token", default="admin-bench", help="Bearer token, see auth_stub")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=20, help="Seconds per scenario")
+    parser.add_argument("--warmup", type=float, default=3, help="Unmeasured seconds first")
+    parser.add_argument("--timeout", type=float, default=30)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument(
+        "--scenarios", nargs="+", choices=list(SCENARIOS), default=list(SCENARIOS)
+    )
+    parser.add_argument("--output", help="Write the JSON report here instead of stdout")
+    args = parser.parse_args()
+
+    report = json.dumps(asyncio.run(run(args)), indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(report + "\n")
+    else:
+        print(report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+"""
+Seed a local Postgres with a synthetic inventory
+
+Types follow a Zipf-like popularity (a few laptops and monitors, a long tail
+of rare equipment), locations are rooms spread over buildings and floors,
+and status, condition and metadata are drawn from fixed distributions. The
+random seed makes runs reproducible. Rows are loaded with COPY in batches, so
+millions of items take minutes, not hours. Migrations must have been applied.
+
+    python -m benchmarks.seed --dsn postgres://... --equipment 100000 --truncate
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Iterator
+
+import asyncpg
+
+TYPE_NAMES = (
+    "Laptop", "Monitor", "Docking Station", "Keyboard", "Mouse", "Headset",
+    "Desktop", "Phone", "Tablet", "Printer", "Projector", "Webcam", "Router",
+    "Switch", "Access Point", "Server", "UPS", "Scanner", "Label Printer",
+    "Oscilloscope", "Multimeter", "Soldering Station", "3D Printer", "Camera",
+)
+BUILDINGS = ("HQ", "North Campus", "Lab Annex", "Warehouse")
+# Stored as the codes of the equipment_statuses vocabulary
+STATUSES = ("available", "in_use", "in_repair", "maintenance", "retired")
+STATUS_WEIGHTS = (55, 28, 5, 7, 5)
+# Mostly well kept equipment, condition 0-10
+CONDITION_WEIGHTS = (1, 1, 1, 2, 3, 5, 8, 12, 18, 25, 24)
+MANUFACTURERS = ("Dell", "Lenovo", "HP", "Apple", "Logitech", "Cisco", "Brother", "Fluke")
+
+EQUIPMENT_COLUMNS = (
+    "id", "created_at", "updated_at", "name", "serial_number", "status", "condition",
+    "photo_url", "qr_code_data", "metadata", "search_vector", "type_id", "location_id",
+)
+
+
+def make_types(count: int, now: datetime) -> list[tuple[Any, ...]]:
+    rows = []
+    for i in range(count):
+        name = TYPE_NAMES[i % len(TYPE_NAMES)]
+        if i >= len(TYPE_NAMES):
+            name += f" {i // len(TYPE_NAMES) + 1}"
+        rows.append((i + 1, now, now, name))
+    return rows
+
+
+def make_locations(count: int, now: datetime) -> list[tuple[Any, ...]]:
+    rows = []
+    for i in range(count):
+        building = BUILDINGS[i % len(BUILDINGS)]
+        floor = i // len(BUILDINGS) % 8 + 1
+        name = f"{building} {floor}.{i // (len(BUILDINGS) * 8) + 1:02d}"
+        rows.append((i + 1, now, now, name, f"Floor {floor} of {building}"))
+    return rows
+
+
+def make_metadata(
+    rng: random.Random, type_name: str, manufacturer: str
+) -> dict[str, Any] | None:
+    if rng.random() < 0.2:
+        return None
+    metadata: dict[str, Any] = {
+        "manufacturer": manufacturer,
+        "purchase_year": rng.randint(2015, 2025),
+    }
+    if type_name in ("Laptop", "Desktop", "Server"):
+        metadata["cpu"] = rng.choice(("i5", "i7", "i9", "M2", "Ryzen 7"))
+        metadata["ram_gb"] = rng.choice((8, 16, 32, 64))
+        metadata["storage_gb"] = rng.choice((256, 512, 1024))
+    elif type_name == "Monitor":
+        metadata["size_in"] = rng.choice((24, 27, 32))
+        metadata["resolution"] = rng.choice(("1080p", "1440p", "4k"))
+    if rng.random() < 0.3:
+        metadata["tags"] = rng.sample(("loaner", "it", "lab", "remote", "spare", "vip"), 2)
+    return metadata
+
+
+def make_equipment(
+    count: int,
+    types: list[tuple[Any, ...]],
+    locations: list[tuple[Any, ...]],
+    status_codes: dict[str, int],
+    now: datetime,
+    rng: random.Random,
+) -> Iterator[tuple[Any, ...]]:
+    type_weights = [1 / (rank + 1) for rank in range(len(types))]
+    type_ids = rng.choices(range(len(types)), weights=type_weights, k=count)
+    for i in range(count):
+        type_row = types[type_ids[i]]
+        location = rng.choice(locations)
+        manufacturer = rng.choice(MANUFACTURERS)
+        metadata = make_metadata(rng, type_row[3], manufacturer)
+        name = f"{manufacturer} {type_row[3]} {rng.randint(100, 9999)}"
+        serial_number = f"SN{2015 + i % 11}{i:08d}"
+        status = rng.choices(STATUSES, weights=STATUS_WEIGHTS)[0]
+        condition = rng.choices(range(11), weights=CONDITION_WEIGHTS)[0]
+        # Same parts as EquipmentCRUD.update_search_vector
+        search_parts = [
+            name, serial_number, status, str(condition), type_row[3], location[3], location[4]
+        ]
+        created_at = now - timedelta(days=rng.randint(0, 3650))
+        yield (
+            i + 1,
+            created_at,
+            created_at + timedelta(days=rng.randint(0, 365)),
+            name,
+            serial_number,
+            status_codes[status],
+            condition,
+            None,
+            f"QS-{i + 1:010d}" if rng.random() < 0.8 else None,
+            json.dumps(metadata) if metadata is not None else None,
+            " ".join(part for part in search_parts if part),
+            type_row[0],
+            location[0],
+        )
+
+
+def batches(rows: Iterator[tuple[Any, ...]], size: int) -> Iterator[list[tuple[Any, ...]]]:
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+async def seed(args: argparse.Namespace) -> dict[str, Any]:
+    rng = random.Random(args.seed)
+    now = datetime.now(timezone.utc)
+    types = make_types(args.types, now)
+    locations = make_locations(args.locations, now)
+
+    # asyncpg does not know the Tortoise "asyncpg://" scheme
+    connection = await asyncpg.connect(args.dsn.replace("asyncpg://", "postgres://", 1))
+    start = time.perf_counter()
+    try:
+        if args.truncate:
+            await connection.execute(
+                'TRUNCATE "history", "equipments", "locations", "equipment_types" '
+                "RESTART IDENTITY CASCADE"
+            )
+        status_codes = {
+            row["name"]: row["id"]
+            for row in await connection.fetch('SELECT "id", "name" FROM "equipment_statuses"')
+        }
+        missing = [status for status in STATUSES if status not in status_codes]
+        if missing:
+            raise RuntimeError(f"Statuses missing from equipment_statuses: {missing}")
+        await connection.copy_records_to_table(
+            "equipment_types", records=types, columns=("id", "created_at", "updated_at", "name")
+        )
+        await connection.copy_records_to_table(
+            "locations",
+            records=locations,
+            columns=("id", "created_at", "updated_at", "name", "description"),
+        )
+        loaded = 0
+        equipment = make_equipment(args.equipment, types, locations, status_codes, now, rng)
+        for batch in batches(equipment, args.batch_size):
+            await connection.copy_records_to_table(
+                "equipments", records=batch, columns=EQUIPMENT_COLUMNS
+            )
+            loaded += len(batch)
+            print(f"Loaded {loaded}/{args.equipment} equipment", flush=True)
+
+        # Ids were given explicitly, move the sequences past them
+        for table in ("equipment_types", "locations", "equipments"):
+            await connection.execute(
+                f"SELECT setval(pg_get_serial_sequence('\"{table}\"', 'id'), "
+                f'(SELECT COALESCE(MAX("id"), 1) FROM "{table}"))'
+            )
+        await connection.execute("ANALYZE")
+    finally:
+        await connection.close()
+
+    return {
+        "equipment": args.equipment,
+        "types": args.types,
+        "locations": args.locations,
+        "seed": args.seed,
+        "seconds": round(time.perf_counter() - start, 2),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument(
+        "--dsn", default=os.environ.get("DB_URL"), help="Postgres URL, defaults to DB_URL"
+    )
+    parser.add_argument("--equipment", type=int, default=10_000, help="Equipment rows, 10k-5M")
+    parser.add_argument("--types", type=int, default=40, help="Equipment types")
+    parser.add_argument("--locations", type=int, default=200, help="Locations")
+    parser.add_argument("--seed", type=int, default=42, help="Random seed")
+    parser.add_argument("--batch-size", type=int, default=50_000, help="Rows per COPY")
+    parser.add_argument("--truncate", action="store_true", help="Empty the tables first")
+    args = parser.parse_args()
+    if not args.dsn:
+        parser.error("--dsn or DB_URL is required")
+
+    print(json.dumps(asyncio.run(seed(args)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""
+Benchmark search response serialization
+
+Compares the ORM path (Tortoise instances -> EquipmentSearchSchema.from_orm ->
+SearchResponse -> FastAPI validation and JSON encoding) with the fast path
+(`.values()` rows -> hydrate_related from cached types/locations -> orjson
+bytes) on synthetic pages. The database is not involved, only the per-row
+Python work is measured, but the app settings must be importable:
+
+    DB_URL=... USERSMS_URL=... python -m benchmarks.serialization --rows 1000
+"""
+import argparse
+import json
+import time
+import warnings
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+from app.models import Equipment, EquipmentType, Location
+from app.schemas import EquipmentSearchSchema, SearchResponse
+from app.utils.serialization import EQUIPMENT_VALUES, hydrate_related, json_response
+
+Related = dict[str, dict[int, dict[str, Any]]]
+
+
+def make_related(now: datetime) -> Related:
+    """Build cached type and location rows by id"""
+    return {
+        "type": {
+            i: {"id": i, "created_at": now, "updated_at": now, "name": f"Type {i}"}
+            for i in range(1, 21)
+        },
+        "location": {
+            i: {
+                "id": i,
+                "created_at": now,
+                "updated_at": now,
+                "name": f"Room {i}",
+                "description": "Main office area",
+            }
+            for i in range(1, 51)
+        },
+    }
+
+
+def make_rows(count: int, now: datetime) -> list[dict[str, Any]]:
+    """Build rows as returned by `.values(*EQUIPMENT_VALUES)`"""
+    rows = []
+    for i in range(count):
+        row = {
+            "id": i + 1,
+            "created_at": now - timedelta(days=i),
+            "updated_at": now,
+            "name": f"Dell Latitude {5000 + i}",
+            "serial_number": f"SN{i:08d}",
+            "status": ("available", "in_use", "maintenance")[i % 3],
+            "condition": i % 11,
+            "photo_url": None,
+            "qr_code_data": f"QR-{i:08d}",
+            "metadata": {"cpu": "i7", "ram_gb": 16, "tags": ["office", "floor-2"]},
+            "search_vector": f"Dell Latitude {5000 + i} SN{i:08d} available Laptop Office A",
+            "type_id": i % 20 + 1,
+            "location_id": i % 50 + 1,
+        }
+        assert tuple(row) == EQUIPMENT_VALUES
+        rows.append(row)
+    return rows
+
+
+def make_instances(rows: list[dict[str, Any]], related: Related) -> list[Equipment]:
+    """Build Tortoise instances with type and location fetched, like prefetch_related"""
+    instances = []
+    for row in rows:
+        page = hydrate_related([dict(row)], related)[0]
+        equipment_type = EquipmentType(**page.pop("type"))
+        location = Location(**page.pop("location"))
+        equipment_type._saved_in_db = location._saved_in_db = True
+        equipment = Equipment(**page, type=equipment_type, location=location)
+        instances.append(equipment)
+    return instances
+
+
+def orm_path(instances: list[Equipment]) -> bytes:
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", DeprecationWarning)
+        results = [EquipmentSearchSchema.from_orm(equipment) for equipment in instances]
+    response = SearchResponse(
+        results=results, total_count=len(results), query="dell", limit=len(results), offset=0
+    )
+    # What FastAPI does with a response_model: validate, encode, render
+    validated = SearchResponse.model_validate(response.model_dump())
+    return JSONResponse(jsonable_encoder(validated)).body
+
+
+def fast_path(rows: list[dict[str, Any]], related: Related) -> bytes:
+    # .values() hands out fresh dicts on every query, hydration updates them
+    results = hydrate_related([dict(row) for row in rows], related)
+    return json_response({
+        "results": results,
+        "total_count": len(results),
+        "query": "dell",
+        "limit": len(results),
+        "offset": 0,
+    }).body
+
+
+def measure(func: Callable[[], bytes], rows: int, repeat: int) -> dict[str, float]:
+    func()  # warm up
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    best = min(timings)
+    mean = sum(timings) / len(timings)
+    return {
+        "best_ms": round(best * 1000, 3),
+        "mean_ms": round(mean * 1000, 3),
+        "rows_per_second": round(rows / mean),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=1000, help="Rows per page")
+    parser.add_argument("--repeat", type=int, default=20, help="Timed runs per path")
+    args = parser.parse_args()
+
+    now = datetime.now(timezone.utc)
+    related = make_related(now)
+    rows = make_rows(args.rows, now)
+    instances = make_instances(rows, related)
+    assert json.loads(orm_path(instances)) == json.loads(fast_path(rows, related))
+
+    before = measure(lambda: orm_path(instances), args.rows, args.repeat)
+    after = measure(lambda: fast_path(rows, related), args.rows, args.repeat)
+    print(json.dumps({
+        "rows": args.rows,
+        "repeat": args.repeat,
+        "before": before,
+        "after": after,
+        "speedup": round(after["rows_per_second"] / before["rows_per_second"], 2),
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""
+Measure the cold start of the API
+
+Three numbers per run, each the median of `--repeat` fresh processes:
+import time of `main` (with the slowest modules from `-X importtime`), time
+until uvicorn accepts connections and time until the first request is
+answered. Both the regular entrypoint and the lazy one in
+app.utils.lazy_app are measured. The app needs its usual environment
+(DB_URL, USERSMS_URL), and the database must be reachable for the lifespan
+to complete.
+
+    python -m benchmarks.startup --repeat 5 --port 8765
+"""
+import argparse
+import json
+import os
+import re
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+from typing import Any
+
+ENTRYPOINTS = {
+    "eager": "main:application",
+    "lazy": "app.utils.lazy_app:application",
+}
+IMPORT_TIME_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)")
+
+
+def measure_imports(module: str) -> tuple[float, dict[str, float]]:
+    """Import time of `module` in ms, and the cumulative time of each module it imports"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    total = 0.0
+    modules: dict[str, float] = {}
+    for line in result.stderr.splitlines():
+        match = IMPORT_TIME_LINE.match(line)
+        if match is None:
+            continue
+        depth = (len(match.group(3)) - 1) // 2
+        cumulative = int(match.group(2)) / 1000
+        if depth == 0 and match.group(4) == module:
+            total = cumulative
+        elif depth == 1:
+            # Nested imports are included in these, and reported before their parent
+            modules[match.group(4)] = cumulative
+    return total, modules
+
+
+def wait_for_port(port: int, process: subprocess.Popen, timeout: float) -> None:
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Server exited with {process.returncode}")
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.1).close()
+            return
+        except OSError:
+            time.sleep(0.005)
+    raise TimeoutError(f"Nothing listening on port {port} after {timeout}s")
+
+
+def wait_for_response(url: str, timeout: float) -> None:
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        try:
+            with urllib.request.urlopen(url, timeout=timeout):
+                return
+        except urllib.error.HTTPError:
+            return  # Any status means the application answered
+        except (urllib.error.URLError, ConnectionError):
+            time.sleep(0.005)
+    raise TimeoutError(f"No response from {url} after {timeout}s")
+
+
+def measure_server(target: str, port: int, path: str, timeout: float) -> dict[str, float]:
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", target, "--port", str(port), "--log-level", "warning"],
+        env={**os.environ, "PYTHONDONTWRITEBYTECODE": "1"},
+    )
+    try:
+        wait_for_port(port, process, timeout)
+        listening = time.perf_counter() - start
+        wait_for_response(f"http://127.0.0.1:{port}{path}", timeout)
+        first_response = time.perf_counter() - start
+    finally:
+        process.terminate()
+        process.wait()
+    return {"listening": listening * 1000, "first_response": first_response * 1000}
+
+
+def median(values: list[float]) -> float:
+    return round(statistics.median(values), 1)
+
+
+def run(args: argparse.Namespace) -> dict[str, Any]:
+    totals = []
+    per_module: dict[str, list[float]] = {}
+    for _ in range(args.repeat):
+        total, modules = measure_imports("main")
+        totals.append(total)
+        for name, ms in modules.items():
+            per_module.setdefault(name, []).append(ms)
+    slowest = sorted(
+        ((name, median(values)) for name, values in per_module.items()),
+        key=lambda item: item[1],
+        reverse=True,
+    )[: args.top]
+
+    servers = {}
+    for name, target in ENTRYPOINTS.items():
+        runs = [measure_server(target, args.port, args.path, args.timeout) for _ in range(args.repeat)]
+        servers[name] = {
+            "listening_ms": median([r["listening"] for r in runs]),
+            "first_response_ms": median([r["first_response"] for r in runs]),
+        }
+        print(f"{name}: {servers[name]}", file=sys.stderr)
+
+    return {
+        "python": sys.version.split()[0],
+        "repeat": args.repeat,
+        "import_main_ms": median(totals),
+        "slowest_imports_ms": dict(slowest),
+        "servers": servers,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--repeat", type=int, default=5, help="Fresh processes per measurement")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--path", default="/metrics", help="Polled for the first response")
+    parser.add_argument("--top", type=int, default=15, help="Slowest imports to list")
+    parser.add_argument("--timeout", type=float, default=60)
+    args = parser.parse_args()
+
+    print(json.dumps(run(args), indent=2))
+
+
+if __name__ == "__main__":
+    main()
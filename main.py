@@ -1,22 +1,65 @@
 from pathlib import Path
 
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse
 import tortoise.exceptions
-import uvicorn as uvicorn
-from fastapi import FastAPI
+from fastapi import Depends, FastAPI, Request
 from ms_core import setup_app
 
 from app.dependencies import configure_auth
-from app.settings import db_url, logger, usersms_url
+from app.settings import (
+    db_replica_urls,
+    db_url,
+    jwks_url,
+    jwt_algorithms,
+    jwt_audience,
+    jwt_issuer,
+    jwt_public_key_file,
+    logger,
+    usersms_url,
+)
+from app.utils.db_pool import configure_pool
+from app.utils.db_routing import register_replicas, route_reads
+from app.utils.metrics import CONTENT_TYPE, MetricsMiddleware, render_metrics
+from app.utils.profiler import query_profiling
+from app.utils.snapshots import ensure_scheduler
+from app.utils.statuses import vocabulary
 
 application = FastAPI(
     title="QSInventory",
+    # Status names are converted to codes synchronously, load them first
+    dependencies=[Depends(query_profiling), Depends(vocabulary.ensure_loaded)],
 )
 
-configure_auth(usersms_url, logger=logger)
+configure_auth(
+    usersms_url,
+    logger=logger,
+    jwt_public_key_file=jwt_public_key_file,
+    jwks_url=jwks_url,
+    jwt_algorithms=jwt_algorithms,
+    jwt_audience=jwt_audience,
+    jwt_issuer=jwt_issuer,
+)
 tortoise_conf = setup_app(
     application, db_url, Path("app") / "routers", ["app.models", "aerich.models"]
 )
+register_replicas(tortoise_conf, db_replica_urls)
+configure_pool(tortoise_conf)
+# Once the database is set up, every worker checks whether a snapshot is due
+application.router.add_event_handler("startup", ensure_scheduler)
+
+
+@application.middleware("http")
+async def route_database_reads(request: Request, call_next):
+    return await route_reads(request, call_next)
+
+
+# Added last so it wraps the other middleware and sees the whole request
+application.add_middleware(MetricsMiddleware)
+
+
+@application.get("/metrics", include_in_schema=False)
+async def metrics() -> PlainTextResponse:
+    return PlainTextResponse(render_metrics(), media_type=CONTENT_TYPE)
 
 
 @application.exception_handler(tortoise.exceptions.ValidationError)
@@ -24,5 +67,13 @@ async def exc_handler(request, exc: tortoise.exceptions.ValidationError):
     return JSONResponse(status_code=400, content={"msg": str(exc)})
 
 
+# e.g. deleting a location that still has sublocations
+@application.exception_handler(tortoise.exceptions.IntegrityError)
+async def integrity_exc_handler(request, exc: tortoise.exceptions.IntegrityError):
+    return JSONResponse(status_code=409, content={"msg": str(exc)})
+
+
 if __name__ == "__main__":
+    import uvicorn
+
     uvicorn.run("main:application", port=8000, reload=True)
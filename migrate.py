@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+Apply pending migrations, one replica at a time
+
+Runs the migrations of `aerich upgrade` from the same files and records them
+in the same table, with two differences:
+
+- replicas starting together take a Postgres advisory lock first, the others
+  wait for it and then find nothing left to do;
+- a migration setting `RUN_IN_TRANSACTION = False` runs statement by
+  statement outside a transaction, so it can use `CREATE INDEX CONCURRENTLY`
+  and build indexes of large tables without blocking writes. Its statements
+  end with `;` at the end of a line and must be idempotent (IF NOT EXISTS,
+  OR REPLACE): it is only recorded once all of them succeeded. Invalid
+  indexes left by an interrupted concurrent build are dropped before a rerun.
+
+A migration can also define `async def backfill(db)`, called after its SQL,
+outside any transaction, before it is recorded; see app.utils.backfill.
+
+    python migrate.py
+"""
+import asyncio
+import re
+import sys
+from pathlib import Path
+from types import ModuleType
+
+import asyncpg
+from aerich.models import Aerich
+from aerich.utils import get_app_connection, get_models_describe, import_py_file
+from tortoise import Tortoise
+from tortoise.backends.asyncpg import AsyncpgDBClient
+from tortoise.backends.base.client import BaseDBAsyncClient
+from tortoise.exceptions import OperationalError
+from tortoise.transactions import in_transaction
+
+from app.settings import logger
+
+APP = "models"
+MIGRATIONS = Path("migrations") / APP
+LOCK_NAME = "qsinventory_migrations"
+# Seconds between attempts to take the lock while another replica migrates
+LOCK_POLL_INTERVAL = 2.0
+CONCURRENT_INDEX = re.compile(
+    r'CREATE\s+(?:UNIQUE\s+)?INDEX\s+CONCURRENTLY\s+(?:IF\s+NOT\s+EXISTS\s+)?"?(\w+)"?',
+    re.IGNORECASE,
+)
+
+
+def version_files() -> list[str]:
+    """Migration files in order, as aerich numbers them"""
+    files = [
+        path.name
+        for path in MIGRATIONS.glob("*_*.py")
+        if path.name.split("_", 1)[0].isdigit()
+    ]
+    return sorted(files, key=lambda name: int(name.split("_", 1)[0]))
+
+
+def split_statements(sql: str) -> list[str]:
+    """Statements of a script, each ending with `;` at the end of a line"""
+    statements: list[str] = []
+    lines: list[str] = []
+    in_body = False
+    for line in sql.splitlines():
+        lines.append(line)
+        # Function bodies are dollar quoted and contain semicolons
+        if line.count("$$") % 2:
+            in_body = not in_body
+        if not in_body and line.rstrip().endswith(";"):
+            statement = "\n".join(lines).strip()
+            if statement.strip(";"):
+                statements.append(statement)
+            lines = []
+    if "\n".join(lines).strip():
+        statements.append("\n".join(lines).strip())
+    return statements
+
+
+async def drop_invalid_indexes(db: BaseDBAsyncClient, sql: str) -> None:
+    """Drop the indexes of `sql` an interrupted concurrent build left invalid"""
+    names = CONCURRENT_INDEX.findall(sql)
+    if not names:
+        return
+    _, rows = await db.execute_query(
+        'SELECT c.relname AS "name" FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid '
+        "WHERE NOT i.indisvalid AND c.relname = ANY($1::text[])",
+        [names],
+    )
+    for row in rows:
+        logger.warning(f"Dropping invalid index {row['name']} left by an interrupted build")
+        await db.execute_script(f'DROP INDEX CONCURRENTLY IF EXISTS "{row["name"]}"')
+
+
+async def apply(db: BaseDBAsyncClient, version_file: str, module: ModuleType) -> None:
+    sql = await module.upgrade(db)
+    if getattr(module, "RUN_IN_TRANSACTION", True):
+        async with in_transaction(db.connection_name) as connection:
+            await connection.execute_script(sql)
+    else:
+        await drop_invalid_indexes(db, sql)
+        for statement in split_statements(sql):
+            await db.execute_script(statement)
+
+    if hasattr(module, "backfill"):
+        await module.backfill(db)
+    await Aerich.create(version=version_file, app=APP, content=get_models_describe(APP))
+
+
+async def _lock_connection(client: BaseDBAsyncClient) -> asyncpg.Connection:
+    """A session of its own holding the migration lock until it is closed"""
+    connection = await asyncpg.connect(
+        host=client.host,
+        port=client.port,
+        user=client.user,
+        password=client.password,
+        database=client.database,
+        ssl=client.extra.get("ssl"),
+    )
+    # Polled rather than blocking in pg_advisory_lock: a waiting statement holds a
+    # snapshot, which the other replica's CREATE INDEX CONCURRENTLY would wait for
+    waiting = False
+    while not await connection.fetchval("SELECT pg_try_advisory_lock(hashtext($1))", LOCK_NAME):
+        if not waiting:
+            logger.info("Another replica is migrating, waiting for it")
+            waiting = True
+        await asyncio.sleep(LOCK_POLL_INTERVAL)
+    return connection
+
+
+async def migrate(tortoise_conf: dict) -> list[str]:
+    """Apply the pending migrations, returns their file names"""
+    await Tortoise.init(config=tortoise_conf)
+    db = get_app_connection(tortoise_conf, APP)
+    lock_connection = None
+    try:
+        if isinstance(db, AsyncpgDBClient):
+            lock_connection = await _lock_connection(db)
+
+        migrated = []
+        for version_file in version_files():
+            try:
+                if await Aerich.exists(version=version_file, app=APP):
+                    continue
+            except OperationalError:
+                # No aerich table yet
+                pass
+            logger.info(f"Applying migration {version_file}")
+            module = import_py_file(MIGRATIONS / version_file)
+            await apply(db, version_file, module)
+            migrated.append(version_file)
+        return migrated
+    finally:
+        if lock_connection is not None:
+            # Ending the session releases the lock
+            await lock_connection.close()
+        await Tortoise.close_connections()
+
+
+if __name__ == "__main__":
+    import logging
+
+    from main import tortoise_conf
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    try:
+        migrated = asyncio.run(migrate(tortoise_conf))
+    except Exception:
+        logger.exception("Migration failed")
+        sys.exit(1)
+    logger.info(f"Applied {len(migrated)} migrations" if migrated else "No pending migrations")
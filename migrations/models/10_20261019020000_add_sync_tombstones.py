@@ -0,0 +1,42 @@
+from tortoise import BaseDBAsyncClient
+
+# Applied statement by statement by migrate.py, see CONCURRENTLY below
+RUN_IN_TRANSACTION = False
+
+
+async def upgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        CREATE TABLE IF NOT EXISTS "tombstones" (
+            "id" BIGSERIAL NOT NULL PRIMARY KEY,
+            "entity" VARCHAR(20) NOT NULL,
+            "entity_id" INT NOT NULL,
+            "deleted_at" TIMESTAMPTZ NOT NULL DEFAULT CURRENT_TIMESTAMP
+        );
+        CREATE INDEX IF NOT EXISTS "idx_tombstones_deleted_f978f5" ON "tombstones" ("deleted_at", "id");
+        CREATE INDEX CONCURRENTLY IF NOT EXISTS "idx_equipments_updated_beca8b" ON "equipments" ("updated_at", "id");
+
+        CREATE OR REPLACE FUNCTION "record_tombstone"() RETURNS trigger AS $$
+        BEGIN
+            INSERT INTO "tombstones" ("entity", "entity_id") VALUES (TG_ARGV[0], OLD."id");
+            RETURN OLD;
+        END
+        $$ LANGUAGE plpgsql;
+
+        CREATE OR REPLACE TRIGGER "equipments_tombstone" AFTER DELETE ON "equipments"
+            FOR EACH ROW EXECUTE FUNCTION "record_tombstone"('equipment');
+        CREATE OR REPLACE TRIGGER "equipment_types_tombstone" AFTER DELETE ON "equipment_types"
+            FOR EACH ROW EXECUTE FUNCTION "record_tombstone"('type');
+        CREATE OR REPLACE TRIGGER "locations_tombstone" AFTER DELETE ON "locations"
+            FOR EACH ROW EXECUTE FUNCTION "record_tombstone"('location');
+        """
+
+
+async def downgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        DROP TRIGGER IF EXISTS "locations_tombstone" ON "locations";
+        DROP TRIGGER IF EXISTS "equipment_types_tombstone" ON "equipment_types";
+        DROP TRIGGER IF EXISTS "equipments_tombstone" ON "equipments";
+        DROP FUNCTION IF EXISTS "record_tombstone"();
+        DROP INDEX IF EXISTS "idx_equipments_updated_beca8b";
+        DROP TABLE IF EXISTS "tombstones";
+        """
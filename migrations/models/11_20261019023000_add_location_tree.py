@@ -0,0 +1,83 @@
+from tortoise import BaseDBAsyncClient
+
+# Applied statement by statement by migrate.py, see CONCURRENTLY below
+RUN_IN_TRANSACTION = False
+
+
+async def upgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        ALTER TABLE "locations" ADD COLUMN IF NOT EXISTS "parent_id" INT REFERENCES "locations" ("id") ON DELETE RESTRICT;
+        CREATE INDEX CONCURRENTLY IF NOT EXISTS "idx_equipments_locatio_42fad3" ON "equipments" ("location_id");
+
+        CREATE TABLE IF NOT EXISTS "location_closure" (
+            "id" BIGSERIAL NOT NULL PRIMARY KEY,
+            "depth" INT NOT NULL,
+            "ancestor_id" INT NOT NULL REFERENCES "locations" ("id") ON DELETE CASCADE,
+            "descendant_id" INT NOT NULL REFERENCES "locations" ("id") ON DELETE CASCADE,
+            CONSTRAINT "uid_location_cl_ancesto_a5d303" UNIQUE ("ancestor_id", "descendant_id")
+        );
+        CREATE INDEX IF NOT EXISTS "idx_location_cl_descend_d6fb8c" ON "location_closure" ("descendant_id", "depth");
+
+        CREATE OR REPLACE FUNCTION "location_closure_insert"() RETURNS trigger AS $$
+        BEGIN
+            INSERT INTO "location_closure" ("ancestor_id", "descendant_id", "depth")
+                SELECT "ancestor_id", NEW."id", "depth" + 1
+                FROM "location_closure" WHERE "descendant_id" = NEW."parent_id"
+                UNION ALL
+                SELECT NEW."id", NEW."id", 0;
+            RETURN NEW;
+        END
+        $$ LANGUAGE plpgsql;
+
+        -- Moves a whole subtree with one delete and one insert
+        CREATE OR REPLACE FUNCTION "location_closure_move"() RETURNS trigger AS $$
+        BEGIN
+            -- Concurrent moves could otherwise build a cycle between them
+            PERFORM pg_advisory_xact_lock(hashtext('location_closure'));
+            IF EXISTS (
+                SELECT 1 FROM "location_closure"
+                WHERE "ancestor_id" = NEW."id" AND "descendant_id" = NEW."parent_id"
+            ) THEN
+                RAISE EXCEPTION 'Location % can''t be moved into its own subtree', NEW."id"
+                    USING ERRCODE = 'check_violation';
+            END IF;
+
+            -- Links from the old ancestors to every location of the subtree
+            DELETE FROM "location_closure" AS link
+            USING "location_closure" AS subtree, "location_closure" AS path
+            WHERE subtree."ancestor_id" = NEW."id"
+                AND path."descendant_id" = NEW."id" AND path."depth" > 0
+                AND link."ancestor_id" = path."ancestor_id"
+                AND link."descendant_id" = subtree."descendant_id";
+
+            INSERT INTO "location_closure" ("ancestor_id", "descendant_id", "depth")
+                SELECT path."ancestor_id", subtree."descendant_id", path."depth" + subtree."depth" + 1
+                FROM "location_closure" AS path, "location_closure" AS subtree
+                WHERE path."descendant_id" = NEW."parent_id" AND subtree."ancestor_id" = NEW."id";
+            RETURN NEW;
+        END
+        $$ LANGUAGE plpgsql;
+
+        CREATE OR REPLACE TRIGGER "locations_closure_insert" AFTER INSERT ON "locations"
+            FOR EACH ROW EXECUTE FUNCTION "location_closure_insert"();
+        CREATE OR REPLACE TRIGGER "locations_closure_move" AFTER UPDATE OF "parent_id" ON "locations"
+            FOR EACH ROW WHEN (OLD."parent_id" IS DISTINCT FROM NEW."parent_id")
+            EXECUTE FUNCTION "location_closure_move"();
+
+        -- Locations that existed before the triggers, all roots
+        INSERT INTO "location_closure" ("ancestor_id", "descendant_id", "depth")
+            SELECT "id", "id", 0 FROM "locations"
+            ON CONFLICT DO NOTHING;
+        """
+
+
+async def downgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        DROP TRIGGER IF EXISTS "locations_closure_move" ON "locations";
+        DROP TRIGGER IF EXISTS "locations_closure_insert" ON "locations";
+        DROP FUNCTION IF EXISTS "location_closure_move"();
+        DROP FUNCTION IF EXISTS "location_closure_insert"();
+        DROP TABLE IF EXISTS "location_closure";
+        DROP INDEX IF EXISTS "idx_equipments_locatio_42fad3";
+        ALTER TABLE "locations" DROP COLUMN IF EXISTS "parent_id";
+        """
@@ -0,0 +1,39 @@
+from tortoise import BaseDBAsyncClient
+
+# Applied statement by statement by migrate.py, see CONCURRENTLY below
+RUN_IN_TRANSACTION = False
+
+
+async def upgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        CREATE TABLE IF NOT EXISTS "inventory_snapshots" (
+            "id" SERIAL NOT NULL PRIMARY KEY,
+            "taken_at" TIMESTAMPTZ NOT NULL,
+            "item_count" INT NOT NULL DEFAULT 0
+        );
+        CREATE INDEX IF NOT EXISTS "idx_inventory_s_taken_a_1f6b22" ON "inventory_snapshots" ("taken_at");
+        CREATE TABLE IF NOT EXISTS "snapshot_items" (
+            "id" BIGSERIAL NOT NULL PRIMARY KEY,
+            "equipment_id" INT NOT NULL,
+            "name" VARCHAR(255) NOT NULL,
+            "serial_number" VARCHAR(255) NOT NULL,
+            "status" VARCHAR(50) NOT NULL,
+            "condition" INT NOT NULL,
+            "type_id" INT NOT NULL,
+            "location_id" INT NOT NULL,
+            "snapshot_id" INT NOT NULL REFERENCES "inventory_snapshots" ("id") ON DELETE CASCADE
+        );
+        CREATE INDEX IF NOT EXISTS "idx_snapshot_it_snapsho_a2f183" ON "snapshot_items" ("snapshot_id", "location_id");
+        CREATE INDEX IF NOT EXISTS "idx_snapshot_it_snapsho_1f3567" ON "snapshot_items" ("snapshot_id", "equipment_id");
+        CREATE INDEX CONCURRENTLY IF NOT EXISTS "idx_history_created_cf1313" ON "history" ("created_at", "id");
+        CREATE INDEX CONCURRENTLY IF NOT EXISTS "idx_equipments_created_1b2d98" ON "equipments" ("created_at");
+        """
+
+
+async def downgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        DROP INDEX IF EXISTS "idx_equipments_created_1b2d98";
+        DROP INDEX IF EXISTS "idx_history_created_cf1313";
+        DROP TABLE IF EXISTS "snapshot_items";
+        DROP TABLE IF EXISTS "inventory_snapshots";
+        """
@@ -0,0 +1,68 @@
+from tortoise import BaseDBAsyncClient
+
+from app.utils.backfill import backfill as backfill_rows
+
+# Applied statement by statement by migrate.py, the codes are backfilled in
+# batches below and swapped in by the next migration. migrate.py applies both in
+# one run and the previous version of the app writes status names, which fail
+# after the swap: stop it before migrating (a short downtime for writes).
+RUN_IN_TRANSACTION = False
+
+
+async def upgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        CREATE TABLE IF NOT EXISTS "equipment_statuses" (
+            "id" SMALLSERIAL NOT NULL PRIMARY KEY,
+            "name" VARCHAR(50) NOT NULL UNIQUE
+        );
+        -- Fixed codes, the hot ones get partial indexes (see app.utils.statuses)
+        INSERT INTO "equipment_statuses" ("id", "name") VALUES
+            (1, 'available'), (2, 'in_use'), (3, 'in_repair'), (4, 'maintenance'), (5, 'retired')
+            ON CONFLICT DO NOTHING;
+        SELECT setval(
+            pg_get_serial_sequence('equipment_statuses', 'id'),
+            (SELECT max("id") FROM "equipment_statuses")
+        );
+        -- Statuses already in use join the vocabulary
+        INSERT INTO "equipment_statuses" ("name")
+            SELECT DISTINCT "status" FROM "equipments"
+            WHERE "status" NOT IN (SELECT "name" FROM "equipment_statuses")
+            ON CONFLICT DO NOTHING;
+
+        ALTER TABLE "equipments" ADD COLUMN IF NOT EXISTS "status_code" SMALLINT;
+
+        -- Keeps the code in step with the rows written during the backfill
+        CREATE OR REPLACE FUNCTION "equipment_status_code"() RETURNS trigger AS $$
+        BEGIN
+            SELECT "id" INTO NEW."status_code" FROM "equipment_statuses" WHERE "name" = NEW."status";
+            IF NEW."status_code" IS NULL THEN
+                INSERT INTO "equipment_statuses" ("name") VALUES (NEW."status")
+                    ON CONFLICT DO NOTHING;
+                SELECT "id" INTO NEW."status_code" FROM "equipment_statuses" WHERE "name" = NEW."status";
+            END IF;
+            RETURN NEW;
+        END
+        $$ LANGUAGE plpgsql;
+
+        CREATE OR REPLACE TRIGGER "equipments_status_code" BEFORE INSERT OR UPDATE OF "status"
+            ON "equipments" FOR EACH ROW EXECUTE FUNCTION "equipment_status_code"();
+        """
+
+
+async def backfill(db: BaseDBAsyncClient) -> None:
+    await backfill_rows(
+        db,
+        "equipments",
+        '"status_code" = (SELECT "id" FROM "equipment_statuses" '
+        'WHERE "name" = "equipments"."status")',
+        '"status_code" IS NULL',
+    )
+
+
+async def downgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        DROP TRIGGER IF EXISTS "equipments_status_code" ON "equipments";
+        DROP FUNCTION IF EXISTS "equipment_status_code"();
+        ALTER TABLE "equipments" DROP COLUMN IF EXISTS "status_code";
+        DROP TABLE IF EXISTS "equipment_statuses";
+        """
@@ -0,0 +1,76 @@
+from tortoise import BaseDBAsyncClient
+
+# Applied statement by statement by migrate.py, see CONCURRENTLY below. The
+# steps of the swap check whether it already happened, so an interrupted run
+# can be repeated. The previous version of the app must be stopped first, see
+# the previous migration.
+RUN_IN_TRANSACTION = False
+
+
+async def upgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        -- Constraints added without a scan and validated without blocking writes
+        DO $$
+        BEGIN
+            IF EXISTS (
+                SELECT 1 FROM information_schema.columns
+                WHERE table_name = 'equipments' AND column_name = 'status_code'
+            ) AND NOT EXISTS (
+                SELECT 1 FROM pg_constraint WHERE conname = 'equipments_status_code_not_null'
+            ) THEN
+                ALTER TABLE "equipments" ADD CONSTRAINT "equipments_status_code_not_null"
+                    CHECK ("status_code" IS NOT NULL) NOT VALID;
+                ALTER TABLE "equipments" ADD CONSTRAINT "equipments_status_fkey"
+                    FOREIGN KEY ("status_code") REFERENCES "equipment_statuses" ("id")
+                    ON DELETE RESTRICT NOT VALID;
+            END IF;
+        END
+        $$;
+        DO $$
+        BEGIN
+            IF EXISTS (
+                SELECT 1 FROM pg_constraint WHERE conname = 'equipments_status_code_not_null'
+            ) THEN
+                ALTER TABLE "equipments" VALIDATE CONSTRAINT "equipments_status_code_not_null";
+                ALTER TABLE "equipments" VALIDATE CONSTRAINT "equipments_status_fkey";
+            END IF;
+        END
+        $$;
+
+        -- The swap itself, one short transaction; SET NOT NULL relies on the
+        -- validated check instead of scanning the table
+        DO $$
+        BEGIN
+            IF EXISTS (
+                SELECT 1 FROM information_schema.columns
+                WHERE table_name = 'equipments' AND column_name = 'status_code'
+            ) THEN
+                SET LOCAL lock_timeout = '10s';
+                ALTER TABLE "equipments" ALTER COLUMN "status_code" SET NOT NULL;
+                ALTER TABLE "equipments" DROP CONSTRAINT "equipments_status_code_not_null";
+                DROP TRIGGER IF EXISTS "equipments_status_code" ON "equipments";
+                ALTER TABLE "equipments" DROP COLUMN "status";
+                ALTER TABLE "equipments" RENAME COLUMN "status_code" TO "status";
+            END IF;
+        END
+        $$;
+        DROP FUNCTION IF EXISTS "equipment_status_code"();
+
+        CREATE INDEX CONCURRENTLY IF NOT EXISTS "idx_equipments_status_d59da2" ON "equipments" ("status");
+        CREATE INDEX CONCURRENTLY IF NOT EXISTS "idx_equipments_available" ON "equipments" ("id") WHERE status = 1;
+        CREATE INDEX CONCURRENTLY IF NOT EXISTS "idx_equipments_in_repair" ON "equipments" ("id") WHERE status = 3;
+        """
+
+
+async def downgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        DROP INDEX IF EXISTS "idx_equipments_in_repair";
+        DROP INDEX IF EXISTS "idx_equipments_available";
+        DROP INDEX IF EXISTS "idx_equipments_status_d59da2";
+        ALTER TABLE "equipments" ADD COLUMN "status_name" VARCHAR(50);
+        UPDATE "equipments" AS e SET "status_name" = s."name"
+            FROM "equipment_statuses" AS s WHERE s."id" = e."status";
+        ALTER TABLE "equipments" DROP COLUMN "status";
+        ALTER TABLE "equipments" RENAME COLUMN "status_name" TO "status";
+        ALTER TABLE "equipments" ALTER COLUMN "status" SET NOT NULL;
+        """
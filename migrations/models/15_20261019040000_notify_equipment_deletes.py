@@ -0,0 +1,39 @@
+from tortoise import BaseDBAsyncClient
+
+# Equipment delete events of the change feed (app.utils.change_feed) are sent
+# by the database, so the items deleted by a cascade from their type or
+# location are reported too. Same fields as change_feed.equipment_event.
+
+
+async def upgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        CREATE OR REPLACE FUNCTION "notify_equipment_deleted"() RETURNS trigger AS $$
+        BEGIN
+            PERFORM pg_notify('qsinventory_changes', json_build_object(
+                'entity', 'equipment',
+                'action', 'delete',
+                'id', d."id",
+                'name', d."name",
+                'serial_number', d."serial_number",
+                'condition', d."condition",
+                'status', s."name",
+                'type_id', d."type_id",
+                'location_id', d."location_id",
+                'updated_at', d."updated_at"
+            )::text)
+            FROM "deleted" AS d LEFT JOIN "equipment_statuses" AS s ON s."id" = d."status";
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql;
+
+        CREATE OR REPLACE TRIGGER "equipments_notify_delete" AFTER DELETE ON "equipments"
+            REFERENCING OLD TABLE AS "deleted"
+            FOR EACH STATEMENT EXECUTE FUNCTION "notify_equipment_deleted"();
+        """
+
+
+async def downgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        DROP TRIGGER IF EXISTS "equipments_notify_delete" ON "equipments";
+        DROP FUNCTION IF EXISTS "notify_equipment_deleted"();
+        """
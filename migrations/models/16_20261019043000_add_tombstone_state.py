@@ -0,0 +1,44 @@
+from tortoise import BaseDBAsyncClient
+
+# Equipment tombstones keep the creation time and the state of the deleted row,
+# its history is deleted with it. As-of queries use them for the items created
+# since a snapshot and deleted after the requested time (app.utils.snapshots).
+# Applied statement by statement by migrate.py, see CONCURRENTLY below
+RUN_IN_TRANSACTION = False
+
+
+async def upgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        ALTER TABLE "tombstones" ADD COLUMN IF NOT EXISTS "created_at" TIMESTAMPTZ;
+        ALTER TABLE "tombstones" ADD COLUMN IF NOT EXISTS "state" JSONB;
+        CREATE INDEX CONCURRENTLY IF NOT EXISTS "idx_tombstones_created_ac7274" ON "tombstones" ("created_at");
+
+        CREATE OR REPLACE FUNCTION "record_equipment_tombstone"() RETURNS trigger AS $$
+        BEGIN
+            INSERT INTO "tombstones" ("entity", "entity_id", "created_at", "state")
+            VALUES ('equipment', OLD."id", OLD."created_at", jsonb_build_object(
+                'name', OLD."name",
+                'serial_number', OLD."serial_number",
+                'status', (SELECT "name" FROM "equipment_statuses" WHERE "id" = OLD."status"),
+                'condition', OLD."condition",
+                'type_id', OLD."type_id",
+                'location_id', OLD."location_id"
+            ));
+            RETURN OLD;
+        END
+        $$ LANGUAGE plpgsql;
+
+        CREATE OR REPLACE TRIGGER "equipments_tombstone" AFTER DELETE ON "equipments"
+            FOR EACH ROW EXECUTE FUNCTION "record_equipment_tombstone"();
+        """
+
+
+async def downgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        CREATE OR REPLACE TRIGGER "equipments_tombstone" AFTER DELETE ON "equipments"
+            FOR EACH ROW EXECUTE FUNCTION "record_tombstone"('equipment');
+        DROP FUNCTION IF EXISTS "record_equipment_tombstone"();
+        DROP INDEX IF EXISTS "idx_tombstones_created_ac7274";
+        ALTER TABLE "tombstones" DROP COLUMN IF EXISTS "state";
+        ALTER TABLE "tombstones" DROP COLUMN IF EXISTS "created_at";
+        """
@@ -1,11 +1,14 @@
 from tortoise import BaseDBAsyncClient
 
+# Applied statement by statement by migrate.py, see CONCURRENTLY below
+RUN_IN_TRANSACTION = False
+
 
 async def upgrade(db: BaseDBAsyncClient) -> str:
     return """
-        ALTER TABLE "equipments" ADD "search_vector" TEXT;
-        CREATE INDEX "idx_equipments_name_serial" ON "equipments" ("name", "serial_number");
-        CREATE INDEX "idx_equipments_search_vector" ON "equipments" ("search_vector");
+        ALTER TABLE "equipments" ADD COLUMN IF NOT EXISTS "search_vector" TEXT;
+        CREATE INDEX CONCURRENTLY IF NOT EXISTS "idx_equipments_name_serial" ON "equipments" ("name", "serial_number");
+        CREATE INDEX CONCURRENTLY IF NOT EXISTS "idx_equipments_search_vector" ON "equipments" ("search_vector");
         """
 
 
@@ -0,0 +1,18 @@
+from tortoise import BaseDBAsyncClient
+
+# Applied statement by statement by migrate.py, see CONCURRENTLY below
+RUN_IN_TRANSACTION = False
+
+
+async def upgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        CREATE INDEX CONCURRENTLY IF NOT EXISTS "idx_equipments_serial__6ba265" ON "equipments" ("serial_number");
+        CREATE INDEX CONCURRENTLY IF NOT EXISTS "idx_equipments_qr_code_6fa2fe" ON "equipments" ("qr_code_data");
+        """
+
+
+async def downgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        DROP INDEX IF EXISTS "idx_equipments_qr_code_6fa2fe";
+        DROP INDEX IF EXISTS "idx_equipments_serial__6ba265";
+        """
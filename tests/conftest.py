@@ -0,0 +1,83 @@
+import asyncio
+import os
+import sys
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Iterator
+
+import pytest
+
+# app.settings reads these at import time, the tests needing a database skip
+# themselves unless TEST_DB_URL is set, e.g. to
+# postgres://postgres@localhost/qsinventory_test_{} (created and dropped per test)
+TEST_DB_URL = os.environ.get("TEST_DB_URL")
+os.environ.setdefault("DB_URL", TEST_DB_URL or "postgres://localhost/test")
+os.environ.setdefault("USERSMS_URL", "http://usersms.test")
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+
+@contextmanager
+def count_queries() -> Iterator[list[str]]:
+    """Record the statements sent to the database, in transactions too"""
+    from tortoise import connections
+
+    # Transactions run on a wrapper subclassing the client class
+    client_class = type(connections.get("default"))
+    queries: list[str] = []
+    wrapped = {}
+    for method in ("execute_query", "execute_query_dict"):
+        original = wrapped[method] = getattr(client_class, method)
+
+        def counting(self, query: str, *args: Any, _original=original, **kwargs: Any):
+            queries.append(query)
+            return _original(self, query, *args, **kwargs)
+
+        setattr(client_class, method, counting)
+    try:
+        yield queries
+    finally:
+        for method, original in wrapped.items():
+            setattr(client_class, method, original)
+
+
+@pytest.fixture
+def run_with_db(monkeypatch) -> Callable[[Callable[[], Awaitable[None]]], None]:
+    """Runs a test coroutine against a fresh database with the schema and statuses"""
+    if TEST_DB_URL is None:
+        pytest.skip("TEST_DB_URL is not set")
+
+    from tortoise import Tortoise
+
+    from app.models import EquipmentStatus
+    from app.utils import invalidation
+    from app.utils.dimension_cache import equipment_types, locations
+    from app.utils.statuses import vocabulary
+
+    monkeypatch.setattr(invalidation.listener, "ensure_running", lambda: None)
+
+    def run(test: Callable[[], Awaitable[None]]) -> None:
+        async def main() -> None:
+            await Tortoise.init(
+                db_url=TEST_DB_URL, modules={"models": ["app.models"]}, _create_db=True
+            )
+            try:
+                await Tortoise.generate_schemas()
+                await EquipmentStatus.bulk_create(
+                    [
+                        EquipmentStatus(id=code, name=name)
+                        for code, name in enumerate(
+                            ("available", "in_use", "in_repair", "maintenance", "retired"), 1
+                        )
+                    ]
+                )
+                await vocabulary.load()
+                equipment_types.invalidate()
+                locations.invalidate()
+                await test()
+            finally:
+                await Tortoise._drop_databases()
+
+        asyncio.run(main())
+
+    return run
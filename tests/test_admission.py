@@ -0,0 +1,18 @@
+from fastapi.routing import APIRoute
+
+from app.routers.inventory import router
+from app.utils.admission import ConcurrencyLimit
+
+
+def test_limits_are_taken_after_authentication():
+    limited = 0
+    for route in router.routes:
+        if not isinstance(route, APIRoute):
+            continue
+        names = [dependency.name for dependency in route.dependant.dependencies]
+        for position, dependency in enumerate(route.dependant.dependencies):
+            if isinstance(dependency.call, ConcurrencyLimit):
+                limited += 1
+                assert "user" in names[:position], route.path
+
+    assert limited == 8
@@ -0,0 +1,159 @@
+import asyncio
+import time
+
+import jwt
+import pytest
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from fastapi import HTTPException
+
+from app import dependencies
+
+AUDIENCE = "qsinventory"
+
+
+def _key_pair() -> tuple[rsa.RSAPrivateKey, str]:
+    private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    public_pem = private_key.public_key().public_bytes(
+        serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo
+    )
+    return private_key, public_pem.decode()
+
+
+PRIVATE_KEY, PUBLIC_PEM = _key_pair()
+
+
+def _token(kid: str | None = None, **claims) -> str:
+    payload = {"sub": "42", "role": 1, "aud": AUDIENCE, "exp": int(time.time()) + 300}
+    payload.update(claims)
+    payload = {name: value for name, value in payload.items() if value is not None}
+    headers = {"kid": kid} if kid is not None else None
+    return jwt.encode(payload, PRIVATE_KEY, algorithm="RS256", headers=headers)
+
+
+def _introspection(calls: list[str]):
+    async def introspect(token: str) -> dict:
+        calls.append(token)
+        return {"active": True, "payload": {"sub": "42", "role": 1}}
+
+    return introspect
+
+
+@pytest.fixture
+def static_key():
+    dependencies.configure_auth(
+        "http://auth.test", jwt_public_key=PUBLIC_PEM, jwt_audience=AUDIENCE
+    )
+
+
+@pytest.fixture
+def jwks(monkeypatch):
+    jwk = jwt.algorithms.RSAAlgorithm.to_jwk(PRIVATE_KEY.public_key(), as_dict=True)
+
+    async def load_signing_keys() -> dict:
+        return {"known": jwt.PyJWK.from_dict({**jwk, "kid": "known", "alg": "RS256"})}
+
+    monkeypatch.setattr(dependencies, "_load_signing_keys", load_signing_keys)
+    dependencies.configure_auth(
+        "http://auth.test", jwks_url="http://auth.test/jwks", jwt_audience=AUDIENCE
+    )
+
+
+def test_valid_token_is_verified_locally(static_key, monkeypatch):
+    calls: list[str] = []
+    monkeypatch.setattr(dependencies, "_introspect_token", _introspection(calls))
+
+    data = asyncio.run(dependencies._verify_token(_token()))
+
+    assert data["payload"]["sub"] == "42"
+    assert calls == []
+
+
+def test_expired_token_is_rejected(static_key):
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(dependencies._verify_token(_token(exp=int(time.time()) - 60)))
+    assert error.value.status_code == 401
+    assert error.value.detail == "Token expired"
+
+
+def test_wrong_audience_is_rejected(static_key):
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(dependencies._verify_token(_token(aud="another-service")))
+    assert error.value.status_code == 401
+
+
+@pytest.mark.parametrize("claim", ["exp", "sub"])
+def test_missing_required_claim_is_rejected(static_key, claim):
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(dependencies._verify_token(_token(**{claim: None})))
+    assert error.value.status_code == 401
+
+
+def test_known_kid_is_verified_locally(jwks, monkeypatch):
+    calls: list[str] = []
+    monkeypatch.setattr(dependencies, "_introspect_token", _introspection(calls))
+
+    data = asyncio.run(dependencies._verify_token(_token(kid="known")))
+
+    assert data["payload"]["sub"] == "42"
+    assert calls == []
+
+
+def test_unknown_kid_falls_back_to_introspection(jwks, monkeypatch):
+    calls: list[str] = []
+    monkeypatch.setattr(dependencies, "_introspect_token", _introspection(calls))
+    token = _token(kid="rotated")
+
+    data = asyncio.run(dependencies._verify_token(token))
+
+    assert data["payload"]["sub"] == "42"
+    assert calls == [token]
+
+
+@pytest.fixture
+def roles_api(static_key, monkeypatch):
+    calls: list[str | None] = []
+    responses: list[Exception | dict] = []
+
+    async def fetch_roles(auth_token: str | None = None) -> dict[int, str]:
+        calls.append(auth_token)
+        response = responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+    monkeypatch.setattr(dependencies, "fetch_roles_from_api", fetch_roles)
+    monkeypatch.setattr(dependencies.invalidation.listener, "ensure_running", lambda: None)
+    monkeypatch.setattr(dependencies, "_role_cache", {})
+    monkeypatch.setattr(dependencies, "_role_refresh_task", None)
+    monkeypatch.setattr(dependencies, "_role_refresh_failed_at", None)
+    return calls, responses
+
+
+def test_failed_role_refresh_backs_off(roles_api, caplog):
+    calls, responses = roles_api
+    responses.append(HTTPException(503, detail="Unable to fetch roles from auth service"))
+
+    async def lookups() -> None:
+        for _ in range(3):
+            with pytest.raises(HTTPException) as error:
+                await dependencies.get_role_id_map("token")
+            assert error.value.status_code == 503
+
+    asyncio.run(lookups())
+
+    assert len(calls) == 1
+    assert "Role map refresh failed" not in caplog.text
+
+
+def test_role_refresh_resumes_after_backoff(roles_api):
+    calls, responses = roles_api
+    responses.extend([RuntimeError("roles API down"), {1: "admin"}])
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(dependencies.get_role_id_map("token"))
+    dependencies._role_refresh_failed_at -= dependencies.ROLE_REFRESH_BACKOFF
+
+    assert asyncio.run(dependencies.get_role_id_map("token")) == {1: "admin"}
+    assert len(calls) == 2
+    assert dependencies._role_refresh_failed_at is None
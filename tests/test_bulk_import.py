@@ -0,0 +1,32 @@
+from pathlib import Path
+
+from app.models import Equipment, EquipmentHistoryEntry
+from app.utils.bulk_import import HISTORY_EMAIL, import_file
+
+HEADER = "name,serial_number,status,condition,type,location\n"
+
+
+def test_updates_are_written_to_history(run_with_db, tmp_path: Path):
+    dump = tmp_path / "dump.csv"
+
+    async def load(*rows: str) -> None:
+        dump.write_text(HEADER + "".join(f"{row}\n" for row in rows))
+        report = await import_file(dump, "csv")
+        assert report.invalid == 0
+
+    async def test() -> None:
+        await load("Drill,SN-1,available,9,Tools,Shed", "Saw,SN-2,available,8,Tools,Shed")
+        assert await EquipmentHistoryEntry.all().count() == 0
+
+        await load("Drill,SN-1,in_repair,4,Tools,Shed", "Saw,SN-2,available,8,Tools,Shed")
+
+        drill = await Equipment.get(serial_number="SN-1")
+        entries = await EquipmentHistoryEntry.all().values("equipment_id", "old", "new", "email")
+        # Only the item whose values changed
+        assert len(entries) == 1
+        assert entries[0]["equipment_id"] == drill.id
+        assert entries[0]["email"] == HISTORY_EMAIL
+        assert (entries[0]["old"]["status"], entries[0]["old"]["condition"]) == ("available", 9)
+        assert (entries[0]["new"]["status"], entries[0]["new"]["condition"]) == ("in_repair", 4)
+
+    run_with_db(test)
@@ -0,0 +1,22 @@
+import pytest
+from tortoise.exceptions import IntegrityError
+
+from app.models import Location
+from app.schemas import LocationCreate
+
+
+def test_tree_changes_only_through_move():
+    assert "parent_id" not in LocationCreate.model_fields
+
+
+def test_location_with_sublocations_is_not_deleted(run_with_db):
+    async def test() -> None:
+        building = await Location.create(name="Building A")
+        await Location.create(name="Room 1", parent_id=building.id)
+
+        # Reported as 409 by the exception handler in main.py
+        with pytest.raises(IntegrityError):
+            await building.delete()
+        assert await Location.filter(id=building.id).exists()
+
+    run_with_db(test)
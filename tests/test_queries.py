@@ -0,0 +1,58 @@
+"""
+Query counts of the read paths, see run_with_db for the database
+"""
+from app.crud import EquipmentCRUD
+from app.models import Equipment, EquipmentType, Location
+from app.utils.dimension_cache import equipment_types, locations
+
+from conftest import count_queries
+
+
+async def _seed() -> Equipment:
+    equipment_type = await EquipmentType.create(name="Laptop")
+    location = await Location.create(name="Warehouse")
+    item = await Equipment.create(
+        name="ThinkPad X1",
+        serial_number="SN-1",
+        status="available",
+        condition=8,
+        type=equipment_type,
+        location=location,
+        search_vector="thinkpad x1 laptop",
+    )
+    # Dimension tables are served from memory once loaded
+    await equipment_types.rows()
+    await locations.rows()
+    return item
+
+
+def test_get_by_id_queries(run_with_db):
+    async def test() -> None:
+        item = await _seed()
+        with count_queries() as queries:
+            equipment = await EquipmentCRUD.get_equipment(item.id)
+
+        assert equipment is not None and equipment.type.name == "Laptop"
+        # The item joined with type and location, then its history
+        assert len(queries) == 2, queries
+
+    run_with_db(test)
+
+
+def test_search_queries(run_with_db):
+    async def test() -> None:
+        item = await _seed()
+        with count_queries() as queries:
+            results = await EquipmentCRUD.search_equipment("thinkpad", status="available")
+        assert [row["id"] for row in results] == [item.id]
+        assert results[0]["location"]["name"] == "Warehouse"
+        assert len(queries) == 1, queries
+
+        with count_queries() as queries:
+            total_count, _ = await EquipmentCRUD.count_matching(
+                EquipmentCRUD.search_filter("thinkpad", "available")
+            )
+        assert total_count == 1
+        assert len(queries) == 1, queries
+
+    run_with_db(test)
@@ -0,0 +1,50 @@
+from app.crud import EquipmentCRUD
+from app.models import Equipment, EquipmentHistoryEntry, EquipmentType, Location
+from app.schemas import ScanEvent
+from app.utils.dimension_cache import equipment_types, locations
+
+from conftest import count_queries
+
+# The largest batch ScanBatchRequest accepts
+MAX_SCANS = 5000
+
+
+def test_full_scan_batch(run_with_db):
+    async def test() -> None:
+        equipment_type = await EquipmentType.create(name="Scanner")
+        warehouse = await Location.create(name="Warehouse")
+        workshop = await Location.create(name="Workshop")
+        await Equipment.bulk_create(
+            [
+                Equipment(
+                    name=f"Item {number}",
+                    serial_number=f"SN-{number}",
+                    status="available",
+                    condition=5,
+                    type=equipment_type,
+                    location=warehouse,
+                )
+                for number in range(MAX_SCANS)
+            ]
+        )
+        # Dimension tables are served from memory once loaded
+        await equipment_types.rows()
+        await locations.rows()
+        scans = [
+            ScanEvent(serial_number=f"SN-{number}", status="in_repair", location_id=workshop.id)
+            for number in range(MAX_SCANS)
+        ]
+
+        with count_queries() as queries:
+            results = await EquipmentCRUD.apply_scans(scans, "scanner@example.com")
+
+        assert [result["outcome"] for result in results] == ["updated"] * MAX_SCANS
+        # Lock, update, history and change events, whatever the batch size
+        assert len(queries) == 4, queries
+        assert await Equipment.filter(status="in_repair", location=workshop).count() == MAX_SCANS
+        history = await EquipmentHistoryEntry.all().order_by("id").limit(1).first()
+        assert history is not None
+        assert history.old["status"] == "available" and history.new["status"] == "in_repair"
+        assert await EquipmentHistoryEntry.all().count() == MAX_SCANS
+
+    run_with_db(test)